@@ -1,3 +1,5 @@
+import json
+
 from loguru import logger
 
 from os import getenv
@@ -12,7 +14,150 @@ ALGORITHM = "HS256"
 ACCES_TOKEN_EXPIRE_MINUTES = 30
 REFRESH_TOKEN_EXPIRE_DAYS = 7
 
+TOKEN_CACHE_SIZE = int(getenv("TOKEN_CACHE_SIZE", "20000")) #проверенные access токены
+TOKEN_CACHE_TTL = float(getenv("TOKEN_CACHE_TTL", "300")) #секунды, но не дольше exp токена
+
+#ОТЗЫВ REFRESH ТОКЕНОВ
+REVOCATION_BLOOM_ENABLED = getenv("REVOCATION_BLOOM_ENABLED", "false").lower() == "true"
+REVOCATION_BLOOM_SIZE = int(getenv("REVOCATION_BLOOM_SIZE", str(1 << 20))) #бит
+REVOCATION_BLOOM_HASHES = int(getenv("REVOCATION_BLOOM_HASHES", "7"))
+REVOCATION_BLOOM_REFRESH = float(getenv("REVOCATION_BLOOM_REFRESH", "5")) #секунды между пересборками фильтра
+
+
+#ФИЛЬТР EMAIL АКТИВНЫХ ЮЗЕРОВ ДЛЯ ЛОГИНА
+LOGIN_FILTER_ENABLED = getenv("LOGIN_FILTER_ENABLED", "true").lower() == "true"
+LOGIN_FILTER_SIZE = int(getenv("LOGIN_FILTER_SIZE", str(1 << 22))) #счётчиков по 4 бита, 2 МБ в Redis
+LOGIN_FILTER_HASHES = int(getenv("LOGIN_FILTER_HASHES", "7"))
+LOGIN_FILTER_REBUILD_INTERVAL = int(getenv("LOGIN_FILTER_REBUILD_INTERVAL", "3600")) #секунды, фильтр пересобирается из бд с нуля
+
+
+#БД - НАСТРОЙКА ПУЛА СОЕДИНЕНИЙ
+DB_ECHO = getenv("DB_ECHO", "false").lower() == "true" #лог каждого запроса, только для отладки
+DB_POOL_SIZE = int(getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(getenv("DB_POOL_TIMEOUT", "10")) #сколько ждать свободное соединение
+DB_POOL_RECYCLE = int(getenv("DB_POOL_RECYCLE", "1800")) #пересоздавать соединения старше N секунд
+DB_POOL_PRE_PING = getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_SLOW_QUERY_SECONDS = float(getenv("DB_SLOW_QUERY_SECONDS", "0.2"))
+DB_SLOW_QUERY_SAMPLE_RATE = float(getenv("DB_SLOW_QUERY_SAMPLE_RATE", "1.0")) #доля медленных запросов в логе
+
+
+#BCRYPT - НАСТРОЙКА ПУЛА
+HASH_POOL_KIND = getenv("HASH_POOL_KIND", "thread") #thread или process
+HASH_POOL_WORKERS = int(getenv("HASH_POOL_WORKERS", "4"))
+HASH_MAX_CONCURRENCY = int(getenv("HASH_MAX_CONCURRENCY", "8")) #сколько задач одновременно уходит в пул
+
+
+#КЕШ АВТОРИЗОВАННЫХ ЮЗЕРОВ
+PRINCIPAL_CACHE_SIZE = int(getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL = float(getenv("PRINCIPAL_CACHE_TTL", "30")) #секунды, in-process
+PRINCIPAL_REDIS_TTL = int(getenv("PRINCIPAL_REDIS_TTL", "300")) #секунды, redis
+
+
+#КЕШ ПОИСКА КОМАНД
+SEARCH_CACHE_SIZE = int(getenv("SEARCH_CACHE_SIZE", "2000"))
+SEARCH_CACHE_TTL = float(getenv("SEARCH_CACHE_TTL", "5")) #секунды, in-process
+SEARCH_REDIS_TTL = int(getenv("SEARCH_REDIS_TTL", "30")) #секунды, redis
+SEARCH_GENERATION_TTL = float(getenv("SEARCH_GENERATION_TTL", "1")) #как часто сверять поколение с redis
+
+
+#КЕШ СОСТАВА КОМАНД
+ROSTER_CACHE_SIZE = int(getenv("ROSTER_CACHE_SIZE", "5000"))
+ROSTER_CACHE_TTL = float(getenv("ROSTER_CACHE_TTL", "2")) #секунды, in-process
+ROSTER_REDIS_TTL = int(getenv("ROSTER_REDIS_TTL", "60")) #секунды, redis
+
+
+#ПОТОК ИЗМЕНЕНИЙ СОСТАВА КОМАНД (SSE)
+ROSTER_STREAM_BUFFER = int(getenv("ROSTER_STREAM_BUFFER", "100")) #событий в очереди подписчика, дальше он отключается
+ROSTER_STREAM_HEARTBEAT = float(getenv("ROSTER_STREAM_HEARTBEAT", "15")) #секунды между ping
+ROSTER_STREAM_MAX_SUBSCRIBERS = int(getenv("ROSTER_STREAM_MAX_SUBSCRIBERS", "10000")) #на воркер
+
+
+#ИНДЕКС НАЗВАНИЙ КОМАНД
+NAME_INDEX_REFRESH = float(getenv("NAME_INDEX_REFRESH", "30")) #секунды, полная перестройка из бд
+NAME_SUGGEST_LIMIT = int(getenv("NAME_SUGGEST_LIMIT", "10"))
+
+
+#OUTBOX ДОМЕННЫХ СОБЫТИЙ
+OUTBOX_STREAM = getenv("OUTBOX_STREAM", "outbox:events")
+OUTBOX_STREAM_MAXLEN = int(getenv("OUTBOX_STREAM_MAXLEN", "100000")) #примерная длина stream, старые записи обрезаются
+OUTBOX_BATCH_SIZE = int(getenv("OUTBOX_BATCH_SIZE", "200"))
+OUTBOX_POLL_INTERVAL = float(getenv("OUTBOX_POLL_INTERVAL", "0.5")) #секунды между проверками, когда событий нет
+OUTBOX_RETENTION_HOURS = float(getenv("OUTBOX_RETENTION_HOURS", "24")) #сколько хранить отправленные события в бд
+OUTBOX_MAX_DELIVERIES = int(getenv("OUTBOX_MAX_DELIVERIES", "5")) #после стольких неудачных доставок событие уходит в {stream}:dead
+
+
+#ОЧЕРЕДЬ ПИСЕМ
+MAIL_QUEUE_BACKEND = getenv("MAIL_QUEUE_BACKEND", "redis") #redis, memory (для тестов) или jobs (отправляет python -m app.worker)
+MAIL_BATCH_SIZE = int(getenv("MAIL_BATCH_SIZE", "20"))
+MAIL_MAX_ATTEMPTS = int(getenv("MAIL_MAX_ATTEMPTS", "5"))
+MAIL_RETRY_BASE_DELAY = float(getenv("MAIL_RETRY_BASE_DELAY", "2")) #секунды, удваивается с каждой попыткой
+
+
+#ОГРАНИЧЕНИЕ ЧАСТОТЫ ЗАПРОСОВ, формат "запросов/секунд"
+RATE_LIMIT_ENABLED = getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_LOGIN_IP = getenv("RATE_LIMIT_LOGIN_IP", "30/60")
+RATE_LIMIT_LOGIN_EMAIL = getenv("RATE_LIMIT_LOGIN_EMAIL", "10/300")
+RATE_LIMIT_REGISTER_IP = getenv("RATE_LIMIT_REGISTER_IP", "10/600")
+RATE_LIMIT_VERIFY_IP = getenv("RATE_LIMIT_VERIFY_IP", "20/600")
+RATE_LIMIT_RESEND_IP = getenv("RATE_LIMIT_RESEND_IP", "10/600")
+RATE_LIMIT_RESEND_EMAIL = getenv("RATE_LIMIT_RESEND_EMAIL", "3/600")
+RATE_LIMIT_FALLBACK_SIZE = int(getenv("RATE_LIMIT_FALLBACK_SIZE", "50000")) #ключей в in-process запасном лимитере
+
+
+#СЖАТИЕ ОТВЕТОВ
+COMPRESSION_MIN_SIZE = int(getenv("COMPRESSION_MIN_SIZE", "1000")) #байт, меньше не сжимаем
+COMPRESSION_OFFLOAD_SIZE = int(getenv("COMPRESSION_OFFLOAD_SIZE", "65536")) #байт, больше сжимаем в потоке, а не в event loop
+COMPRESSION_GZIP_LEVEL = int(getenv("COMPRESSION_GZIP_LEVEL", "5"))
+COMPRESSION_BROTLI_QUALITY = int(getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+COMPRESSION_ZSTD_LEVEL = int(getenv("COMPRESSION_ZSTD_LEVEL", "3"))
+
+
+#ФОНОВЫЕ ЗАДАЧИ (python -m app.worker)
+JOBS_CONCURRENCY = int(getenv("JOBS_CONCURRENCY", "10")) #задач одновременно на воркер
+JOBS_MAX_ATTEMPTS = int(getenv("JOBS_MAX_ATTEMPTS", "5"))
+JOBS_RETRY_BASE_DELAY = float(getenv("JOBS_RETRY_BASE_DELAY", "5")) #секунды, удваивается с каждой попыткой
+JOBS_VISIBILITY_TIMEOUT = float(getenv("JOBS_VISIBILITY_TIMEOUT", "300")) #секунды, после них задача упавшего воркера вернётся в очередь
+JOBS_POLL_INTERVAL = float(getenv("JOBS_POLL_INTERVAL", "0.5")) #секунды, когда очередь пуста
+JOBS_UNVERIFIED_TTL_HOURS = float(getenv("JOBS_UNVERIFIED_TTL_HOURS", "48")) #через сколько удалять неподтверждённые аккаунты
+JOBS_PURGE_INTERVAL = float(getenv("JOBS_PURGE_INTERVAL", "3600"))
+JOBS_WARM_INTERVAL = float(getenv("JOBS_WARM_INTERVAL", "300"))
+JOBS_WARM_TEAMS = int(getenv("JOBS_WARM_TEAMS", "100")) #сколько свежих команд прогревать в кеше состава
 
 
 #файл логирования
-logger.add("info.log", format="Log: [{extra[log_id]}:{time} - {level} - {message}]", level="INFO", enqueue = True)
\ No newline at end of file
+LOG_SAMPLE_RATE = float(getenv("LOG_SAMPLE_RATE", "1.0")) #доля успешных запросов в логе, ошибки пишутся всегда
+REQUEST_LOG_FILE = getenv("REQUEST_LOG_FILE", "requests.log") #лог запросов, по json объекту на строку
+
+_log_sink_id : int | None = None
+
+
+def _is_request(record) -> bool:
+    return "request" in record["extra"]
+
+
+def _request_json(record) -> str:
+    """
+    Формат лога запросов: запись из middleware плюс время, уровень и id запроса одной json строкой
+    """
+    record["extra"]["json"] = json.dumps({
+        "time": record["time"].isoformat(),
+        "level": record["level"].name,
+        "log_id": record["extra"].get("log_id"),
+        **record["extra"]["request"],
+    }, ensure_ascii=False)
+    return "{extra[json]}\n"
+
+
+def setup_logging() -> None:
+    """
+    Подключает файлы логирования, вызывается в lifespan, а не при импорте.
+    Записи запросов идут только в отдельный json лог, всё остальное - в info.log
+    """
+    global _log_sink_id
+    if _log_sink_id is None:
+        _log_sink_id = logger.add(
+            "info.log", format="Log: [{extra[log_id]}:{time} - {level} - {message}]", level="INFO", enqueue = True,
+            filter=lambda record: not _is_request(record)
+        )
+        logger.add(REQUEST_LOG_FILE, format=_request_json, level="INFO", enqueue=True, filter=_is_request)
@@ -1,21 +1,66 @@
 import os
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy.orm import DeclarativeBase, sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession, async_sessionmaker
+from sqlalchemy.orm import DeclarativeBase
+
+from app.config import DB_ECHO, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING
+from app.services.db_metrics import AsyncTimedPool, async_pool_metrics, instrument_engine
 
 load_dotenv()
 
-#асинхронная сессия
-async_create_engine = create_async_engine(os.getenv('ASYNC_LOCAL_DATABASE_URL'), echo = True)
-async_session_maker = async_sessionmaker(async_create_engine, expire_on_commit=False, class_=AsyncSession)
+#настройки пула
+POOL_SETTINGS = {
+    "echo": DB_ECHO,
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+    "pool_recycle": DB_POOL_RECYCLE,
+    "pool_pre_ping": DB_POOL_PRE_PING,
+}
+
+#движок создаётся при первом обращении, а не при импорте
+_async_engine : AsyncEngine | None = None
+_async_session_maker : async_sessionmaker[AsyncSession] | None = None
+
+
+def get_async_engine() -> AsyncEngine:
+    """
+    Асинхронный движок, создаётся 1 раз при первом обращении
+    """
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = create_async_engine(os.getenv('ASYNC_LOCAL_DATABASE_URL'), poolclass=AsyncTimedPool, **POOL_SETTINGS)
+        instrument_engine(_async_engine.sync_engine, async_pool_metrics)
+    return _async_engine
+
+
+def get_async_session_maker() -> async_sessionmaker[AsyncSession]:
+    global _async_session_maker
+    if _async_session_maker is None:
+        _async_session_maker = async_sessionmaker(get_async_engine(), expire_on_commit=False, class_=AsyncSession)
+    return _async_session_maker
+
+
+async def dispose_engines() -> None:
+    """
+    Закрывает движок при остановке приложения или воркера задач
+    """
+    global _async_engine, _async_session_maker
+    if _async_engine is not None:
+        await _async_engine.dispose()
+    _async_engine = _async_session_maker = None
+
+
+def __getattr__(name : str):
+    #старые имена модуля продолжают работать, но движок создаётся только при обращении
+    lazy_names = {
+        "async_create_engine": get_async_engine,
+        "async_session_maker": get_async_session_maker,
+    }
+    if name in lazy_names:
+        return lazy_names[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-# Синхронная сессия для Celery
-sync_engine = create_engine(os.getenv("SYNC_LOCAL_DATABASE_URL"), echo=True)
-SyncSessionLocal = sessionmaker(
-    sync_engine, 
-    expire_on_commit=False
-)
 
 class Base(DeclarativeBase):
-    pass
\ No newline at end of file
+    pass
@@ -1,18 +1,10 @@
 from collections.abc import AsyncGenerator
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.database import async_session_maker, SyncSessionLocal
+from app.database import get_async_session_maker
 
 async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
     """
     Предоставляет асинхронную сессию SQLAlchemy для работы с базой данных PostgreSQL.
     """
-    async with async_session_maker() as session:
+    async with get_async_session_maker()() as session:
         yield session
-
-
-def get_sync_db():
-    db = SyncSessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
\ No newline at end of file
@@ -0,0 +1,104 @@
+"""
+Фоновые задачи, которые выполняет python -m app.worker.
+Всё через асинхронную сессию, отдельного синхронного движка для воркера нет
+"""
+import redis.asyncio as redis
+
+from datetime import timedelta
+from fastapi import HTTPException
+from os import getenv
+
+from sqlalchemy import select, delete, func
+
+from app.config import logger, JOBS_UNVERIFIED_TTL_HOURS, JOBS_PURGE_INTERVAL, JOBS_WARM_INTERVAL, JOBS_WARM_TEAMS
+from app.database import get_async_session_maker
+from app.models import UserModel, CommandModel
+from app.services.email import build_verification_message, create_smtp_client
+from app.services.email_filter import email_filter
+from app.services.job_queue import job_queue
+from app.services.outbox import add_events, outbox_event
+from app.services.principal_cache import principal_cache
+from app.services.roster_cache import roster_cache
+from app.utilits import get_command
+
+
+PURGE_CHUNK = 1000
+
+
+@job_queue.job("send_verification_email")
+async def send_verification_email(r : redis.Redis, to : str, code : str) -> None:
+    message = build_verification_message(to, code)
+    async with create_smtp_client() as smtp:
+        await smtp.send_message(message, sender=getenv("SMTP_FROM"))
+
+
+@job_queue.job("purge_expired_accounts", max_attempts=1) #следующий запуск по расписанию и так скоро
+async def purge_expired_accounts(r : redis.Redis) -> None:
+    """
+    Удаляет аккаунты, которые так и не подтвердили почту за JOBS_UNVERIFIED_TTL_HOURS.
+    Пачками, чтобы не держать долгую транзакцию и блокировки на users
+    """
+    total = 0
+    while True:
+        async with get_async_session_maker()() as db:
+            expired = (
+                select(UserModel.id)
+                .where(
+                    UserModel.is_active == False,
+                    UserModel.command_id.is_(None),
+                    UserModel.created_at < func.now() - timedelta(hours=JOBS_UNVERIFIED_TTL_HOURS),
+                )
+                .limit(PURGE_CHUNK)
+                .with_for_update(skip_locked=True)
+                .scalar_subquery()
+            )
+            result = await db.execute(
+                delete(UserModel)
+                .where(UserModel.id.in_(expired))
+                .returning(UserModel.id)
+                .execution_options(synchronize_session=False)
+            )
+            deleted_ids = list(result.scalars())
+            await add_events(db, *(outbox_event("user.deleted", "user", user_id, command_id=None) for user_id in deleted_ids))
+            await db.commit()
+
+        await principal_cache.invalidate(r, *deleted_ids)
+        total += len(deleted_ids)
+        if len(deleted_ids) < PURGE_CHUNK:
+            break
+
+    if total:
+        logger.bind(log_id="jobs").info(f"Удалено неподтверждённых аккаунтов: {total}")
+
+
+@job_queue.job("warm_caches", max_attempts=1)
+async def warm_caches(r : redis.Redis, teams : int = JOBS_WARM_TEAMS) -> None:
+    """
+    Прогревает Redis уровень кеша состава для свежих активных команд
+    и собирает фильтр email, если Redis его потерял
+    """
+    async with get_async_session_maker()() as db:
+        command_ids = (await db.scalars(
+            select(CommandModel.id)
+            .where(CommandModel.status == "active")
+            .order_by(CommandModel.created_at.desc())
+            .limit(teams)
+        )).all()
+
+        for command_id in command_ids:
+            if await roster_cache.get(command_id, r) is not None:
+                continue
+            version = await roster_cache.version(command_id, r)
+            try:
+                command = await get_command(command_id, db)
+            except HTTPException: #команду удалили между запросами
+                continue
+            await roster_cache.set(command_id, command.model_dump_json().encode(), r, version)
+
+    await email_filter.build(r)
+
+
+
+#расписание
+job_queue.every(JOBS_PURGE_INTERVAL, "purge_expired_accounts")
+job_queue.every(JOBS_WARM_INTERVAL, "warm_caches")
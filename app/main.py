@@ -1,21 +1,16 @@
-from fastapi import FastAPI, Request
-
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI
 
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.middleware.httpsredirect import HTTPSRedirectMiddleware
-from fastapi.middleware.gzip import GZipMiddleware
 
 from app.services.redis_client import lifespan
 
-from app.routers import users, commands
-
-from time import time
-from uuid import uuid4
+from app.routers import users, commands, metrics
 
-
-from app.config import logger
+from app.middleware.request_logging import RequestLoggingMiddleware
+from app.middleware.metrics import MetricsMiddleware
+from app.middleware.compression import CompressionMiddleware
 
 
  
@@ -26,36 +21,10 @@ app = FastAPI(
 )
 
 
-@app.middleware("http")
-async def log_middleware(request: Request, call_next):
-    log_id = str(uuid4())
-    with logger.contextualize(log_id=log_id):
-        try:
-            response = await call_next(request) #передаем дальше поток, чтобы получить request данные
-            if response.status_code in [401, 402, 403, 404]:
-                logger.warning(f"Ошибка запроса к  {request.url.path} failed")
-            else:
-                logger.info('Успешный запрос к ' + request.url.path)
-        except Exception as ex:
-            logger.error(f"Ошибка запроса к  {request.url.path} failed: {ex}")
-            response = JSONResponse(content={"success": False}, status_code=500)
-        return response
-
-
-
-app.add_middleware( #4
-    GZipMiddleware,
-    minimum_size = 1000,
-    compresslevel=5
-)
+app.add_middleware(CompressionMiddleware) #4 br/zstd/gzip, закешированные тела приходят уже сжатыми
 
-@app.middleware("http") #3
-async def modify_request_response_middleware(request: Request, call_next):
-    start_time = time() #текущее время
-    response = await call_next(request) #некст мидлвар или приложение
-    duration = time() - start_time #смотрим время
-    logger.info(f"Время выполнения запроса к : {duration:.10f} seconds | {request.method} {request.url.path}") #логирование
-    return response  #возврат запроса
+app.add_middleware(MetricsMiddleware) #3 счётчики и гистограммы по шаблону роута
+app.add_middleware(RequestLoggingMiddleware) #3 метод, путь, статус и длительность одной json строкой
 
 
 app.add_middleware( #2
@@ -80,6 +49,7 @@ app.add_middleware( #1
 
 app.include_router(users.router)
 app.include_router(commands.router)
+app.include_router(metrics.router)
 
 
 @app.get("/")
@@ -0,0 +1,84 @@
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import COMPRESSION_MIN_SIZE, COMPRESSION_OFFLOAD_SIZE
+from app.services.compression import negotiate, compress_async
+
+
+COMPRESSIBLE_TYPES = ("application/json", "application/javascript", "application/xml", "image/svg+xml")
+
+
+def is_compressible(content_type : str) -> bool:
+    content_type = content_type.split(";", 1)[0].strip().lower()
+    if content_type == "text/event-stream": #поток событий должен уходить сразу
+        return False
+    return content_type.startswith("text/") or content_type.endswith("+json") or content_type in COMPRESSIBLE_TYPES
+
+
+
+class CompressionMiddleware:
+    """
+    Чистый ASGI middleware сжатия вместо GZipMiddleware:
+    br/zstd/gzip по Accept-Encoding, большие тела сжимаются вне event loop.
+    Ответы с уже выставленным Content-Encoding (закешированные тела
+    из negotiated_response) и потоковые ответы пропускаются как есть
+    """
+    def __init__(self, app : ASGIApp, minimum_size : int = COMPRESSION_MIN_SIZE,
+                 offload_size : int = COMPRESSION_OFFLOAD_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.offload_size = offload_size
+
+
+    async def __call__(self, scope : Scope, receive : Receive, send : Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message : Message | None = None
+        passthrough = False
+
+        async def send_wrapper(message : Message) -> None:
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if "content-encoding" in headers or not is_compressible(headers.get("content-type", "")):
+                    passthrough = True
+                    await send(message)
+                    return
+                start_message = message #заголовки уйдут вместе с телом
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            if message.get("more_body", False) or len(body) < self.minimum_size:
+                #стриминг или маленькое тело - отдаём как есть
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            compressed = await compress_async(body, encoding, offload_size=self.offload_size)
+            headers = MutableHeaders(raw=start_message["headers"])
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            headers.add_vary_header("Accept-Encoding")
+            etag = headers.get("etag")
+            if etag is not None and not etag.startswith("W/"):
+                headers["ETag"] = "W/" + etag
+            await send(start_message)
+            await send({"type": "http.response.body", "body": compressed, "more_body": False})
+
+        await self.app(scope, receive, send_wrapper)
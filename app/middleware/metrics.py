@@ -0,0 +1,41 @@
+from time import perf_counter
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.services.metrics import HTTP_REQUESTS, HTTP_LATENCY, HTTP_IN_FLIGHT
+
+
+class MetricsMiddleware:
+    """
+    Чистый ASGI middleware для метрик запросов.
+    Роут берётся из шаблона (/commands/{command_id}), а не из сырого пути,
+    чтобы число серий не росло вместе с id в url
+    """
+    def __init__(self, app : ASGIApp):
+        self.app = app
+
+
+    async def __call__(self, scope : Scope, receive : Receive, send : Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message : Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            #scope["route"] выставляет роутер FastAPI после сопоставления пути
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            HTTP_LATENCY.observe(perf_counter() - started, method=scope["method"], route=route_path)
+            HTTP_REQUESTS.inc(method=scope["method"], route=route_path, status=status_code)
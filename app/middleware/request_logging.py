@@ -0,0 +1,75 @@
+import os
+import random
+
+from itertools import count
+from time import perf_counter
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import logger, LOG_SAMPLE_RATE
+
+
+_request_ids = count(1)
+_pid = os.getpid()
+
+
+class RequestLoggingMiddleware:
+    """
+    Чистый ASGI middleware для логирования запросов одной json строкой
+    (метод, путь, статус и длительность) в отдельный лог REQUEST_LOG_FILE. Тело ответа не буферизуется,
+    успешные запросы логируются выборочно, ошибки - всегда
+    """
+    def __init__(self, app : ASGIApp, sample_rate : float = LOG_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+
+
+    async def __call__(self, scope : Scope, receive : Receive, send : Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = perf_counter()
+        log_id = f"{_pid:x}-{next(_request_ids):x}"
+        status_code = 500
+        response_started = False
+        error = None
+
+        async def send_wrapper(message : Message) -> None:
+            nonlocal status_code, response_started
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                response_started = True
+            await send(message)
+
+        with logger.contextualize(log_id=log_id):
+            try:
+                await self.app(scope, receive, send_wrapper)
+            except Exception as ex:
+                error = repr(ex)
+                if response_started: #заголовки уже ушли, ответ не подменить
+                    raise
+                status_code = 500
+                response = JSONResponse(content={"success": False}, status_code=500)
+                await response(scope, receive, send)
+            finally:
+                self._log(scope, status_code, perf_counter() - started, error)
+
+
+    def _log(self, scope : Scope, status_code : int, duration : float, error : str | None) -> None:
+        is_error = status_code >= 400 or error is not None
+        if not is_error and random.random() >= self.sample_rate:
+            return
+
+        record = {
+            "method": scope["method"],
+            "path": scope["path"],
+            "status": status_code,
+            "duration_ms": round(duration * 1000, 3),
+        }
+        if error is not None:
+            record["error"] = error
+
+        level = "ERROR" if status_code >= 500 else "WARNING" if status_code >= 400 else "INFO"
+        logger.bind(request=record).log(level, f"{record['method']} {record['path']} {status_code}")
@@ -13,6 +13,7 @@ from os import getenv
 from app.database import Base
 from app.models import UserModel
 from app.models import CommandModel
+from app.models import OutboxEventModel
 
 load_dotenv()
 
@@ -0,0 +1,37 @@
+"""добавил счётчик игроков members_count в ComandModel
+
+Revision ID: b41e6d0c9a27
+Revises: 7f3a9c2d1e84
+Create Date: 2026-10-17 13:21:07.418392
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b41e6d0c9a27'
+down_revision: Union[str, Sequence[str], None] = '7f3a9c2d1e84'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('commands', sa.Column('members_count', sa.Integer(), server_default='0', nullable=False))
+    # заполняем счётчик для уже существующих команд
+    op.execute(
+        """
+        UPDATE commands
+        SET members_count = (SELECT count(*) FROM users WHERE users.command_id = commands.id)
+        """
+    )
+    op.create_check_constraint('ck_commands_members_count', 'commands', 'members_count <= 5')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('ck_commands_members_count', 'commands', type_='check')
+    op.drop_column('commands', 'members_count')
@@ -1,5 +1,6 @@
 from .users import UserModel
 from .commands import CommandModel
+from .outbox import OutboxEventModel
 
 
-__all__ = ["UserModel", "CommandModel"]
\ No newline at end of file
+__all__ = ["UserModel", "CommandModel", "OutboxEventModel"]
\ No newline at end of file
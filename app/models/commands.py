@@ -1,4 +1,4 @@
-from sqlalchemy import String, Boolean, DateTime, func, Index, Computed
+from sqlalchemy import String, Boolean, DateTime, Integer, func, Index, Computed, CheckConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from sqlalchemy.dialects.postgresql import TSVECTOR
@@ -7,6 +7,9 @@ from app.database import Base
 from datetime import datetime, timezone
 
 
+MAX_MEMBERS = 5 #максимум игроков в команде
+
+
 class CommandModel(Base):
     __tablename__ = "commands"
 
@@ -17,6 +20,7 @@ class CommandModel(Base):
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
     status: Mapped[str] = mapped_column(String(20), default="active", nullable=False)
     is_filled: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
+    members_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False) #денормализованный счётчик игроков
 
     tsv: Mapped[TSVECTOR] = mapped_column(
         TSVECTOR,
@@ -41,8 +45,10 @@ class CommandModel(Base):
             postgresql_using="gin", #гин индекс для поиска
             postgresql_ops={"name": "gin_trgm_ops"} #триграм разбивает слова на части Django dj, an, go
         ),
+        CheckConstraint(f"members_count <= {MAX_MEMBERS}", name="ck_commands_members_count"), #команда не может переполниться даже при гонке
     )
 
 
 
-
+#курсорная пагинация без поиска: ORDER BY created_at DESC, id DESC
+Index("ix_commands_created_at_id", CommandModel.created_at.desc(), CommandModel.id.desc())
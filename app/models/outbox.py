@@ -0,0 +1,28 @@
+from sqlalchemy import String, Integer, BigInteger, DateTime, func, Index
+from sqlalchemy.orm import Mapped, mapped_column
+
+from sqlalchemy.dialects.postgresql import JSONB
+
+from app.database import Base
+from datetime import datetime
+
+
+class OutboxEventModel(Base):
+    """
+    Доменное событие, записанное в той же транзакции, что и само изменение.
+    Релей публикует неотправленные события в Redis stream и ставит published_at
+    """
+    __tablename__ = "outbox_events"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    event_type: Mapped[str] = mapped_column(String(50), nullable=False) #user.registered, command.player_joined ...
+    aggregate_type: Mapped[str] = mapped_column(String(20), nullable=False) #user или command
+    aggregate_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    payload: Mapped[dict] = mapped_column(JSONB, nullable=False, server_default="{}")
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    published_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        #релей читает только неотправленные, индекс остаётся маленьким
+        Index("ix_outbox_events_unpublished", "id", postgresql_where=published_at.is_(None)),
+    )
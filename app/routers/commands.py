@@ -1,17 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from fastapi.responses import StreamingResponse
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, or_
-from sqlalchemy.orm import selectinload
+from sqlalchemy import select, update, delete, func, or_, tuple_
+from sqlalchemy.exc import IntegrityError
 
+from time import perf_counter
 
-from app.schemas.users import UserResponseSchema
-from app.schemas.commands import CommandCreateSchema, CommandResponseSchema, CommandSearchSchema
+
+from app.schemas.commands import CommandCreateSchema, CommandResponseSchema, CommandSearchSchema, CommandSuggestSchema, BulkStatusSchema
+from app.schemas.users import BulkIdsSchema
 from app.models import CommandModel, UserModel
 
 from app.db_depends import get_async_db
-from app.validation.hash_password import hash_password
-from app.utilits import get_command, team_rights, check_has_team
+from app.services.redis_client import get_redis
+from app.services.principal_cache import principal_cache
+from app.services.search_cache import search_cache
+from app.services.roster_cache import roster_cache
+from app.services.json_response import FastJSONResponse, dumps
+from app.services.compression import negotiated_response
+from app.services.name_index import name_index
+from app.services.roster_events import roster_events
+from app.services.outbox import add_events, outbox_event
+from app.config import NAME_SUGGEST_LIMIT
+from app.validation.hash_password import hash_password_async
+from app.utilits import get_command, team_rights, check_has_team, check_is_admin, encode_cursor, decode_cursor, roster_json, id_in
 
 
 router = APIRouter(
@@ -24,65 +37,247 @@ router = APIRouter(
 async def new_command(
     create_command : CommandCreateSchema,
     db : AsyncSession = Depends(get_async_db),
-    user : UserModel =  Depends(check_has_team) #проверка состоит ли юзер уже в команде
+    user : UserModel =  Depends(check_has_team), #проверка состоит ли юзер уже в команде
+    redis_client = Depends(get_redis)
 ) -> CommandResponseSchema:
     
-    command = await db.scalar(select(CommandModel).where(CommandModel.name == create_command.name))
-    if command is not None:
+    # Свободное по индексу имя не проверяется в бд, занятое другим воркером поймает unique.
+    # "Занято" подтверждается в бд: создание редкое, а удалённая на другом воркере команда не держит имя
+    if await name_index.is_taken(create_command.name, db):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Команда с таким именем уже существует!")
     
-    hashed_password = hash_password(create_command.password)
+    hashed_password = await hash_password_async(create_command.password)
     new_command = CommandModel(
         name = create_command.name,
-        password = hashed_password
+        password = hashed_password,
+        members_count = 1 #создатель сразу в команде
     )
 
     new_command.users.append(user)
     user.is_team_creator = True
 
     db.add(new_command)
-    await db.commit()
+    try:
+        await db.flush()
+        await add_events(db, outbox_event("command.created", "command", new_command.id, name=new_command.name, creator_id=user.id))
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Команда с таким именем уже существует!")
     await db.refresh(new_command)
+    name_index.add(new_command.id, new_command.name)
+    await principal_cache.invalidate(redis_client, user.id)
+    await search_cache.bump_generation(redis_client)
+    await roster_events.publish(redis_client, {
+        "type": "created", "command_id": new_command.id, "name": new_command.name,
+        "user_ids": [user.id], "members_count": 1, "is_filled": False
+    })
     result = await get_command(new_command.id, db)
     return result
 
     
 
-@router.get("/{command_id}", response_model=CommandResponseSchema)
+@router.get("/stream")
+async def stream_rosters(
+    command_id : int | None = Query(None, description="Только эта команда, без него - все команды")
+) -> StreamingResponse:
+    """
+    SSE поток изменений состава: вступление, выход, создание и удаление команд.
+    Вместо опроса GET /commands/{command_id}, объявлен до него
+    """
+    if not roster_events.has_capacity():
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Слишком много подписчиков, попробуйте позже")
+    return StreamingResponse(
+        roster_events.stream(command_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+
+@router.get("/suggest", response_model=list[CommandSuggestSchema], response_class=FastJSONResponse)
+async def suggest_commands(
+    prefix : str = Query(..., min_length=1, max_length=50, description="Начало названия команды"),
+    limit : int = Query(NAME_SUGGEST_LIMIT, ge=1, le=50),
+    db : AsyncSession = Depends(get_async_db)
+) -> FastJSONResponse:
+    """
+    Автодополнение названий активных команд из in-process индекса, без запроса в бд.
+    Объявлен до /{command_id}, иначе "suggest" попадёт в command_id
+    """
+    if name_index.ready:
+        return FastJSONResponse(dumps(name_index.suggest(prefix, limit)))
+
+    # индекс ещё грузится после старта
+    result = await db.execute(
+        select(CommandModel.id, CommandModel.name)
+        .where(CommandModel.status == "active", CommandModel.name.istartswith(prefix, autoescape=True))
+        .order_by(func.lower(CommandModel.name), CommandModel.id)
+        .limit(limit)
+    )
+    return FastJSONResponse(dumps([dict(row) for row in result.mappings()]))
+
+
+
+@router.head("/name/{name}")
+async def check_command_name(
+    name : str,
+    db : AsyncSession = Depends(get_async_db)
+) -> Response:
+    """
+    200 - название занято, 404 - свободно.
+    Отвечает по индексу без запроса в бд, это проверка при наборе названия: команда,
+    удалённая на другом воркере, считается занятой до перестройки индекса (NAME_INDEX_REFRESH),
+    окончательно имя проверяет создание команды
+    """
+    if name_index.ready:
+        taken = name_index.exists(name)
+    else: #индекс ещё грузится после старта
+        taken = await db.scalar(select(CommandModel.id).where(CommandModel.name == name)) is not None
+    return Response(status_code=status.HTTP_200_OK if taken else status.HTTP_404_NOT_FOUND)
+
+
+
+@router.get("/{command_id}", response_model=CommandResponseSchema, response_class=FastJSONResponse)
 async def get_info_command(
     command_id : int,
-    db : AsyncSession = Depends(get_async_db)
-) -> CommandResponseSchema:
-    command = await get_command(command_id, db)
-    return command
+    request : Request,
+    db : AsyncSession = Depends(get_async_db),
+    redis_client = Depends(get_redis)
+) -> Response:
+    """
+    Состав команды отдаётся готовыми байтами из кеша,
+    при совпадении If-None-Match - 304 без тела
+    """
+    cached = await roster_cache.get(command_id, redis_client)
+    if cached is None:
+        version = await roster_cache.version(command_id, redis_client)
+        command = await get_command(command_id, db)
+        cached = await roster_cache.set(command_id, command.model_dump_json().encode(), redis_client, version)
+    etag, body = cached
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if roster_cache.matches(request.headers.get("if-none-match"), etag):
+        roster_cache.not_modified += 1
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return await negotiated_response(request, body, headers)
     
     
 @router.delete("/{сommand_id}")
 async def delete_command(
     command_id : int,
     db : AsyncSession = Depends(get_async_db),
-    rights_check = Depends(team_rights)    
+    rights_check = Depends(team_rights),
+    redis_client = Depends(get_redis)
 ):
     
     command = await db.scalar(select(CommandModel).where(CommandModel.id == command_id))
+    members = await db.scalars(select(UserModel.id).where(UserModel.command_id == command_id))
+    member_ids = members.all()
     await db.delete(command)
+    await add_events(db, outbox_event("command.deleted", "command", command_id, member_ids=member_ids))
     await db.commit()
+    name_index.remove(command_id)
+    await principal_cache.invalidate(redis_client, *member_ids)
+    await search_cache.bump_generation(redis_client)
+    await roster_cache.invalidate(redis_client, command_id)
+    await roster_events.publish(redis_client, {"type": "deleted", "command_id": command_id})
     return {"message" : "Команда удалена!"}
 
 
 
 
-@router.get("/", response_model=CommandSearchSchema)
+@router.post("/bulk-delete")
+async def bulk_delete_commands(
+    bulk : BulkIdsSchema,
+    db : AsyncSession = Depends(get_async_db),
+    admin : UserModel = Depends(check_is_admin),
+    redis_client = Depends(get_redis)
+) -> dict:
+    """
+    Удаляет пачку команд одной транзакцией, участники отвязываются одним UPDATE
+    """
+    ids = list(set(bulk.ids))
+
+    detached = await db.execute(
+        update(UserModel)
+        .where(id_in(UserModel.command_id, ids))
+        .values(command_id=None, is_team_creator=False)
+        .returning(UserModel.id)
+        .execution_options(synchronize_session=False)
+    )
+    member_ids = detached.scalars().all()
+    result = await db.execute(
+        delete(CommandModel)
+        .where(id_in(CommandModel.id, ids))
+        .returning(CommandModel.id)
+        .execution_options(synchronize_session=False)
+    )
+    deleted_ids = result.scalars().all()
+    await add_events(db, *(outbox_event("command.deleted", "command", command_id) for command_id in deleted_ids))
+    await db.commit()
+    name_index.remove(*deleted_ids)
+
+    await principal_cache.invalidate(redis_client, *member_ids)
+    await search_cache.bump_generation(redis_client)
+    await roster_cache.invalidate(redis_client, *deleted_ids)
+    await roster_events.publish(redis_client, *({"type": "deleted", "command_id": command_id} for command_id in deleted_ids))
+    return {"message" : "Команды удалены!", "deleted" : len(deleted_ids), "detached_players" : len(member_ids)}
+
+
+
+@router.post("/bulk-status")
+async def bulk_change_status(
+    bulk : BulkStatusSchema,
+    db : AsyncSession = Depends(get_async_db),
+    admin : UserModel = Depends(check_is_admin),
+    redis_client = Depends(get_redis)
+) -> dict:
+    """
+    Меняет статус пачки команд одним UPDATE
+    """
+    result = await db.execute(
+        update(CommandModel)
+        .where(id_in(CommandModel.id, list(set(bulk.ids))))
+        .values(status=bulk.status)
+        .returning(CommandModel.id)
+        .execution_options(synchronize_session=False)
+    )
+    updated_ids = result.scalars().all()
+    await add_events(db, *(outbox_event("command.status_changed", "command", command_id, status=bulk.status) for command_id in updated_ids))
+    await db.commit()
+    name_index.set_status(bulk.status, *updated_ids)
+
+    await search_cache.bump_generation(redis_client)
+    await roster_cache.invalidate(redis_client, *updated_ids)
+    return {"message" : f"Статус изменён на {bulk.status}", "updated" : len(updated_ids)}
+
+
+
+
+@router.get("/", response_model=CommandSearchSchema, response_class=FastJSONResponse)
 async def search_commands(
+    request: Request,
     search_name: str | None = Query(None, description="Поиск по названию команды"),
     status: str | None = Query(None, pattern=r"^(active|inactive)$", description="Статус [active|inactive]"),
     is_filled: bool | None = Query(None, description="Заполненность команды"),
-    last_id: int | None = Query(None, ge=1, description="ID для курсорной пагинации"),
+    cursor: str | None = Query(None, description="Курсор следующей страницы из next_cursor"),
+    include_users: bool = Query(True, description="Подгружать состав команд (false - облегчённый список)"),
     db: AsyncSession = Depends(get_async_db),
-) -> CommandSearchSchema:
+    redis_client = Depends(get_redis),
+) -> FastJSONResponse:
     
     PAGE_SIZE = 20
 
+    # Кеш результатов
+    cache_params = search_cache.normalize(search_name, status, is_filled, cursor, include_users)
+    cache_key = await search_cache.key(cache_params, redis_client)
+    cached = await search_cache.get(cache_key, redis_client)
+    if cached is not None:
+        return await negotiated_response(request, cached)
+
+    started = perf_counter()
+
     # Базовые фильтры
     filters  = []   
 
@@ -126,56 +321,45 @@ async def search_commands(
             )
 
 
-    if rank is None and last_id: #проверка что нет поиска и есть ласт айди курсор пагинация
-        filters.append(CommandModel.id > last_id)
+    # Курсорная пагинация по (rank, id) при поиске и по (created_at, id) без него
+    sort_key = rank if rank is not None else CommandModel.created_at
+    cursor_kind = "rank" if rank is not None else "created_at"
+    if cursor:
+        cursor_value, cursor_id = decode_cursor(cursor, cursor_kind)
+        filters.append(tuple_(sort_key, CommandModel.id) < tuple_(cursor_value, cursor_id))
+
+    # Запрос: только нужные колонки, без tsv и пароля, состав собирается в SQL
+    columns = [
+        CommandModel.id,
+        CommandModel.name,
+        CommandModel.created_at,
+        CommandModel.updated_at,
+        CommandModel.status,
+        CommandModel.is_filled,
+    ]
+    if include_users:
+        columns.append(roster_json().label("users"))
 
-    # Запрос
     stmt = (
-        select(CommandModel)
+        select(*columns, sort_key.label("sort_key"))
         .where(*filters)
-        .options(selectinload(CommandModel.users))  # подгружаем участников
+        .order_by(sort_key.desc(), CommandModel.id.desc())
         .limit(PAGE_SIZE)
     )
 
-    # Сортировка
-    if rank is not None:
-        stmt = stmt.order_by(rank.desc())
-    else:
-        stmt = stmt.order_by(CommandModel.created_at.desc())
-
     result = await db.execute(stmt)
-    commands = result.scalars().all()
+    rows = result.mappings().all()
 
-    # Конвертация в схемы
     items = [
-        CommandResponseSchema(
-            id=cmd.id,
-            name=cmd.name,
-            created_at=cmd.created_at,
-            updated_at=cmd.updated_at,
-            status=cmd.status,
-            is_filled=cmd.is_filled,
-            users=[
-                UserResponseSchema(
-                    id=u.id,
-                    username=u.username,
-                    email=u.email,
-                    created_at=u.created_at,
-                    updated_at=u.updated_at,
-                    command_id = u.command_id,
-                    role=u.role,
-                    is_active=u.is_active,
-                    is_team_creator=u.is_team_creator,
-                )
-                for u in cmd.users
-            ]
-        )
-        for cmd in commands
+        {key: value for key, value in row.items() if key != "sort_key"}
+        for row in rows
     ]
 
-    last_id_in_results = items[-1].id if items else None
+    next_cursor = None
+    if len(rows) == PAGE_SIZE: #страница полная, значит дальше могут быть ещё команды
+        next_cursor = encode_cursor(cursor_kind, rows[-1]["sort_key"], rows[-1]["id"])
 
-    return CommandSearchSchema(
-        next_cursor = last_id_in_results,
-        items = items,
-    )
\ No newline at end of file
+    # Строки уже в форме CommandListItemSchema, сериализуем один раз без повторной валидации
+    body = dumps({"next_cursor": next_cursor, "items": items})
+    cached = await search_cache.set(cache_key, body, perf_counter() - started, redis_client)
+    return await negotiated_response(request, cached)
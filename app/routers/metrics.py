@@ -0,0 +1,89 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.services.metrics import registry
+from app.services.db_metrics import async_pool_metrics
+from app.services.principal_cache import principal_cache
+from app.services.search_cache import search_cache
+from app.services.roster_cache import roster_cache
+from app.services.name_index import name_index
+from app.services.email_filter import email_filter
+from app.services.roster_events import roster_events
+from app.services.outbox import outbox_relay
+from app.services.invalidation import invalidation_bus
+from app.validation.hash_password import hash_pool
+
+
+router = APIRouter(
+    tags=["Metrics"]
+)
+
+
+DB_POOL = registry.gauge("db_pool", "Состояние пула соединений бд", ("stat",))
+DB_POOL_CHECKOUT_WAIT = registry.collected_counter("db_pool_checkout_wait_seconds_total", "Суммарное ожидание соединения из пула")
+DB_POOL_CHECKOUTS = registry.collected_counter("db_pool_checkouts_total", "Выдано соединений из пула")
+DB_POOL_TIMEOUTS = registry.collected_counter("db_pool_checkout_timeouts_total", "Таймауты ожидания соединения")
+DB_SLOW_QUERIES = registry.collected_counter("db_slow_queries_total", "Медленные запросы к бд")
+
+BCRYPT_QUEUE = registry.gauge("bcrypt_pool", "Состояние пула bcrypt", ("stat",))
+BCRYPT_WAIT = registry.collected_counter("bcrypt_queue_wait_seconds_total", "Суммарное время ожидания в очереди bcrypt")
+BCRYPT_RUN = registry.collected_counter("bcrypt_run_seconds_total", "Суммарное время работы bcrypt")
+BCRYPT_JOBS = registry.collected_counter("bcrypt_jobs_total", "Выполнено задач bcrypt")
+
+CACHE_EVENTS = registry.collected_counter("cache_events_total", "Попадания и промахи кешей", ("cache", "event"))
+NAME_INDEX = registry.gauge("name_index", "Индекс названий команд", ("stat",))
+ROSTER_STREAM = registry.gauge("roster_stream", "SSE поток состава команд", ("stat",))
+OUTBOX_RELAY = registry.gauge("outbox_relay", "Релей outbox в Redis stream", ("stat",))
+CACHE_INVALIDATION = registry.gauge("cache_invalidation", "Сбросы in-process кешей между воркерами", ("stat",))
+
+
+def collect_db_pool() -> None:
+    stats = async_pool_metrics.stats()
+    for stat in ("size", "in_use", "idle", "overflow"):
+        if stat in stats:
+            DB_POOL.set(stats[stat], stat=stat)
+    DB_POOL_CHECKOUT_WAIT.set(stats["checkout_wait_seconds_total"])
+    DB_POOL_CHECKOUTS.set(stats["checkouts"])
+    DB_POOL_TIMEOUTS.set(stats["checkout_timeouts"])
+    DB_SLOW_QUERIES.set(stats["slow_queries"])
+
+
+def collect_bcrypt() -> None:
+    stats = hash_pool.stats()
+    for stat in ("queued", "in_progress", "max_queue_depth"):
+        BCRYPT_QUEUE.set(stats[stat], stat=stat)
+    BCRYPT_WAIT.set(stats["wait_seconds_total"])
+    BCRYPT_RUN.set(stats["run_seconds_total"])
+    BCRYPT_JOBS.set(stats["completed"])
+
+
+def collect_caches() -> None:
+    for event, value in principal_cache.stats().items():
+        if event != "local_size":
+            CACHE_EVENTS.set(value, cache="principal", event=event)
+    for event, value in search_cache.stats().items():
+        if event not in ("generation", "local_size", "hit_ratio"):
+            CACHE_EVENTS.set(value, cache="search", event=event)
+    for event, value in roster_cache.stats().items():
+        if event != "local_size":
+            CACHE_EVENTS.set(value, cache="roster", event=event)
+    for event, value in email_filter.stats().items():
+        CACHE_EVENTS.set(value, cache="login_email_filter", event=event)
+    for stat, value in name_index.stats().items():
+        NAME_INDEX.set(value, stat=stat)
+    for stat, value in roster_events.stats().items():
+        ROSTER_STREAM.set(value, stat=stat)
+    for stat, value in outbox_relay.stats().items():
+        OUTBOX_RELAY.set(value, stat=stat)
+    for stat, value in invalidation_bus.stats().items():
+        CACHE_INVALIDATION.set(value, stat=stat)
+
+
+registry.register_collector(collect_db_pool)
+registry.register_collector(collect_bcrypt)
+registry.register_collector(collect_caches)
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics() -> PlainTextResponse:
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
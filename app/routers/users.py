@@ -4,23 +4,36 @@ from fastapi.security import OAuth2PasswordRequestForm
 
 import redis.asyncio as redis
 
-from sqlalchemy import select, func
+from sqlalchemy import select, update, delete, func
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
 
-from app.schemas.users import UserCreateSchema, UserResponseSchema, VerifyCode, ResendCodeSchema
+from app.schemas.users import UserCreateSchema, UserResponseSchema, VerifyCode, ResendCodeSchema, BulkIdsSchema, TokenPrincipalSchema
 from app.schemas.commands import JoinCommandResponce
  
 from app.models import UserModel, CommandModel
+from app.models.commands import MAX_MEMBERS
 from app.db_depends import get_async_db
 
 from app.services.redis_client import get_redis
-from app.services.email import send_verification_email
+from app.services.mail_queue import MailQueue, get_mail_queue
+from app.services.principal_cache import principal_cache
+from app.services.search_cache import search_cache
+from app.services.roster_cache import roster_cache
+from app.services.verification_store import verification_store
+from app.services.email_filter import email_filter
+from app.services.roster_events import roster_events
+from app.services.outbox import add_events, outbox_event
+from app.services.rate_limit import (
+    login_ip_limit, login_email_limit, register_ip_limit,
+    verify_ip_limit, resend_ip_limit, resend_email_limit
+)
 
-from app.validation.hash_password import hash_password, verify_password
+from app.validation.hash_password import hash_password_async, verify_password_async, verify_dummy_password_async
 from app.validation.jwt_manager import jwt_manager
 from app.validation.jwt_validation import jwt_validator
 
-from app.utilits import check_no_role, check_has_team
+from app.utilits import check_no_role, check_has_team, check_is_admin, id_in
 
 import random
 
@@ -30,11 +43,12 @@ router = APIRouter(
 )
 
 
-@router.post("/register", status_code=status.HTTP_201_CREATED)
+@router.post("/register", status_code=status.HTTP_201_CREATED, dependencies=[Depends(register_ip_limit)])
 async def register(
     user_data: UserCreateSchema,
     db: AsyncSession = Depends(get_async_db),
-    redis_client = Depends(get_redis)
+    redis_client = Depends(get_redis),
+    mail_queue : MailQueue = Depends(get_mail_queue)
 ):
     existing_user = await db.scalar(
         select(UserModel).where(
@@ -50,42 +64,36 @@ async def register(
     new_user = UserModel(
         username=user_data.username,
         email=user_data.email,
-        hashed_password=hash_password(user_data.password)
+        hashed_password=await hash_password_async(user_data.password)
     )
 
     db.add(new_user)
+    await db.flush()
+    await add_events(db, outbox_event("user.registered", "user", new_user.id, email=new_user.email, username=new_user.username))
     await db.commit()
     await db.refresh(new_user)
 
     verification_code = str(random.randint(10000000, 99999999))
 
     
-    # Ключ 1: Hash с данными верификации
-    await redis_client.hset(f"verification:{verification_code}", mapping={
-        "code": verification_code,
-        "user_id": str(new_user.id),
-        "email": new_user.email
-    })
-    await redis_client.expire(f"verification:{verification_code}", 600)
-    
-    # Ключ 2: Быстрый поиск кода по email (чтобы не перебирать все ключи)
-    await redis_client.set(f"verification:email:{new_user.email}", verification_code, ex=600)
+    # Hash с данными верификации + быстрый поиск кода по email, одним запросом
+    await verification_store.create(redis_client, verification_code, new_user.id, new_user.email)
 
-    await send_verification_email(to=user_data.email, code=verification_code)
+    await mail_queue.enqueue_verification_email(to=user_data.email, code=verification_code)
 
     return {"message": f"Код подтверждения отправлен на почту {user_data.email}"}
 
 
 
 
-@router.post("/verify")
+@router.post("/verify", dependencies=[Depends(verify_ip_limit)])
 async def verify_code(
     verify_data: VerifyCode,
     db: AsyncSession = Depends(get_async_db),
     redis_client = Depends(get_redis)
 ):
-    # Получаем данные из Redis Hash
-    data = await redis_client.hgetall(f"verification:{verify_data.verify_code}")
+    # Получаем данные кода и сразу гасим его (оба ключа удаляются атомарно)
+    data = await verification_store.consume(redis_client, verify_data.verify_code)
     
     # Проверяем, существует ли код
     if not data:
@@ -116,15 +124,11 @@ async def verify_code(
         )
     
     user.is_active = True
+    await add_events(db, outbox_event("user.activated", "user", user.id, email=user.email))
     await db.commit()
     await db.refresh(user)
-
-    # Удаляем ОБА ключа после успешной верификации
-    await redis_client.delete(f"verification:{verify_data.verify_code}")
-    # Удаляем ключ поиска по email (email берём из данных hash)
-    email = data.get("email")
-    if email:
-        await redis_client.delete(f"verification:email:{email}")
+    await principal_cache.invalidate(redis_client, user.id)
+    await email_filter.add(redis_client, user.email) #теперь может логиниться
 
     # Создаём токены
     token_data = {
@@ -143,21 +147,17 @@ async def verify_code(
     }
 
 
-@router.post("/resend-code")
+@router.post("/resend-code", dependencies=[Depends(resend_ip_limit)])
 async def resend_code(
     resend_data: ResendCodeSchema,
     db: AsyncSession = Depends(get_async_db),
-    redis_client = Depends(get_redis)
+    redis_client = Depends(get_redis),
+    mail_queue : MailQueue = Depends(get_mail_queue)
 ):
-    # 1. Находим старый код по email (быстрый поиск по новому ключу)
-    old_code = await redis_client.get(f"verification:email:{resend_data.email}")
-    
-    # 2. Если код есть — удаляем оба старых ключа
-    if old_code:
-        await redis_client.delete(f"verification:{old_code}")
-        await redis_client.delete(f"verification:email:{resend_data.email}")
-    
-    # 3. Проверяем, существует ли пользователь с таким email и не активирован
+    # Не больше пары писем на один адрес, независимо от IP
+    await resend_email_limit.check(redis_client, resend_data.email)
+
+    # 1. Проверяем, существует ли пользователь с таким email и не активирован
     user = await db.scalar(
         select(UserModel).where(UserModel.email == resend_data.email, UserModel.is_active == False)
     )
@@ -168,33 +168,42 @@ async def resend_code(
             detail="Пользователь с таким email не найден или уже активирован"
         )
     
-    # 4. Генерируем новый код
+    # 2. Генерируем новый код
     new_code = str(random.randint(10000000, 99999999))
     
-    # 5. Сохраняем ОБА ключа 
-    await redis_client.hset(f"verification:{new_code}", mapping={
-        "code": new_code,
-        "user_id": str(user.id),
-        "email": user.email
-    })
-    await redis_client.expire(f"verification:{new_code}", 600)
-    await redis_client.set(f"verification:email:{user.email}", new_code, ex=600)
+    # 3. Атомарно удаляем старый код и сохраняем новый
+    await verification_store.rotate(redis_client, new_code, user.id, user.email)
     
-    # 6. Отправляем email
-    await send_verification_email(to=resend_data.email, code=new_code)
+    # 4. Ставим email в очередь на отправку
+    await mail_queue.enqueue_verification_email(to=resend_data.email, code=new_code)
     
     return {"message": f"Код подтверждения отправлен на почту {resend_data.email}"}
 
 
 
-@router.post("/token")
-async def login(form_data : OAuth2PasswordRequestForm = Depends(), db : AsyncSession = Depends(get_async_db)):
-    request_user = await db.scalars(
-        select(UserModel)
-        .where(UserModel.email == form_data.username, UserModel.is_active == True)
-    )
-    user = request_user.first()
-    if user is None or not verify_password(form_data.password, user.hashed_password):
+@router.post("/token", dependencies=[Depends(login_ip_limit)])
+async def login(
+    form_data : OAuth2PasswordRequestForm = Depends(),
+    db : AsyncSession = Depends(get_async_db),
+    redis_client = Depends(get_redis)
+):
+    # Перебор паролей к одному аккаунту с разных IP упирается в лимит по email до bcrypt
+    await login_email_limit.check(redis_client, form_data.username)
+
+    # Email, которого точно нет среди активных, отсекается фильтром без запроса в бд
+    user = None
+    if await email_filter.might_exist(redis_client, form_data.username) is not False:
+        request_user = await db.scalars(
+            select(UserModel)
+            .where(UserModel.email == form_data.username, UserModel.is_active == True)
+        )
+        user = request_user.first()
+
+    if user is None: #bcrypt всё равно гоняется, чтобы время ответа не выдавало наличие аккаунта
+        password_valid = await verify_dummy_password_async(form_data.password)
+    else:
+        password_valid = await verify_password_async(form_data.password, user.hashed_password)
+    if not password_valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неправильный пароль или емейл, или юзер не активен",
@@ -226,31 +235,118 @@ async def update_refresh_token(user : UserModel = Depends(jwt_validator.validate
 async def logout(token_revoke : dict = Depends(jwt_manager.revoke_refresh_tokens)):
     return token_revoke
 
+
+@router.get("/me", response_model=TokenPrincipalSchema)
+async def get_me(principal : TokenPrincipalSchema = Depends(jwt_validator.get_token_principal)) -> TokenPrincipalSchema:
+    """
+    Кто я по access токену, без запроса в бд и кеш юзеров.
+    Роль может отставать от бд до истечения токена
+    """
+    return principal
+
  
 @router.delete("/{user_id}")
 async def delete_account(
     user_id : int,
     db : AsyncSession = Depends(get_async_db),
-    current_user : UserModel = Depends(jwt_validator.get_current_user)
-
+    current_user : UserModel = Depends(jwt_validator.get_current_user),
+    redis_client = Depends(get_redis)
 ) -> dict:
     if current_user.role != "admin":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Только администратор может удалять пользователей")
     user = await db.scalar(select(UserModel).where(UserModel.id == user_id))
     if user is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Юзер не найден")
+    command_id = user.command_id
+    active_email = user.email if user.is_active else None
+    members_count = None
+    if command_id is not None: #освобождаем место в команде
+        members_count = await db.scalar(
+            update(CommandModel)
+            .where(CommandModel.id == command_id)
+            .values(members_count=CommandModel.members_count - 1, is_filled=False)
+            .returning(CommandModel.members_count)
+            .execution_options(synchronize_session=False)
+        )
     await db.delete(user)
+    await add_events(db, outbox_event("user.deleted", "user", user_id, command_id=command_id))
     await db.commit()
+    await principal_cache.invalidate(redis_client, user_id)
+    await search_cache.bump_generation(redis_client)
+    await roster_cache.invalidate(redis_client, command_id)
+    if active_email is not None:
+        await email_filter.remove(redis_client, active_email)
+    if members_count is not None:
+        await roster_events.publish(redis_client, {
+            "type": "left", "command_id": command_id, "user_ids": [user_id],
+            "members_count": members_count, "is_filled": False
+        })
     return {"message" : "успешно!"}
     
 
 
+@router.post("/bulk-delete")
+async def bulk_delete_accounts(
+    bulk : BulkIdsSchema,
+    db : AsyncSession = Depends(get_async_db),
+    admin : UserModel = Depends(check_is_admin),
+    redis_client = Depends(get_redis)
+) -> dict:
+    """
+    Удаляет пачку юзеров одной транзакцией, освобождая их места в командах
+    """
+    ids = list(set(bulk.ids))
+
+    # сколько мест освобождается в каждой команде
+    freed = (
+        select(UserModel.command_id, func.count().label("freed"))
+        .where(id_in(UserModel.id, ids), UserModel.command_id.is_not(None))
+        .group_by(UserModel.command_id)
+        .subquery()
+    )
+    freed_commands = await db.execute(
+        update(CommandModel)
+        .where(CommandModel.id == freed.c.command_id)
+        .values(members_count=CommandModel.members_count - freed.c.freed, is_filled=False)
+        .returning(CommandModel.id, CommandModel.members_count)
+        .execution_options(synchronize_session=False)
+    )
+    members_counts = dict(freed_commands.tuples().all())
+    command_ids = list(members_counts)
+    result = await db.execute(
+        delete(UserModel)
+        .where(id_in(UserModel.id, ids))
+        .returning(UserModel.id, UserModel.email, UserModel.is_active, UserModel.command_id)
+        .execution_options(synchronize_session=False)
+    )
+    deleted = result.all()
+    deleted_ids = [row.id for row in deleted]
+    await add_events(db, *(outbox_event("user.deleted", "user", row.id, command_id=row.command_id) for row in deleted))
+    await db.commit()
+
+    await principal_cache.invalidate(redis_client, *deleted_ids)
+    await search_cache.bump_generation(redis_client)
+    await roster_cache.invalidate(redis_client, *command_ids)
+    await email_filter.remove(redis_client, *(row.email for row in deleted if row.is_active))
+    await roster_events.publish(redis_client, *(
+        {
+            "type": "left", "command_id": command_id,
+            "user_ids": [row.id for row in deleted if row.command_id == command_id],
+            "members_count": members_count, "is_filled": False
+        }
+        for command_id, members_count in members_counts.items()
+    ))
+    return {"message" : "успешно!", "deleted" : len(deleted_ids)}
+
+
+
 @router.put("/join-team/{command_id}")
 async def join_as_player(
     command_id : int,
     join_command : JoinCommandResponce,
     db : AsyncSession = Depends(get_async_db),
-    user : UserModel = Depends(check_has_team) #проверка что у юзера уже есть команда
+    user : UserModel = Depends(check_has_team), #проверка что у юзера уже есть команда
+    redis_client = Depends(get_redis)
 ) -> dict:
     
     command = await db.scalar(select(CommandModel).where(CommandModel.id == command_id))
@@ -261,23 +357,50 @@ async def join_as_player(
     if command.is_filled == True:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Команда заполена всеми игроками!")
     
-    if not  verify_password(join_command.password, command.password):
+    if not await verify_password_async(join_command.password, command.password):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Неверный пароль от группы!")
     
-    user.command_id = command_id
+    # Одним запросом: привязываем юзера и увеличиваем счётчик, только если есть место
+    joined_user = (
+        update(UserModel)
+        .where(UserModel.id == user.id, UserModel.command_id.is_(None))
+        .values(command_id=command_id)
+        .returning(UserModel.id)
+        .cte("joined_user")
+    )
+    result = await db.execute(
+        update(CommandModel)
+        .where(
+            CommandModel.id == command_id,
+            CommandModel.members_count < MAX_MEMBERS,
+            select(joined_user.c.id).exists(),
+        )
+        .values(
+            members_count=CommandModel.members_count + 1,
+            is_filled=CommandModel.members_count + 1 >= MAX_MEMBERS,
+        )
+        .returning(CommandModel.members_count)
+        .execution_options(synchronize_session=False)
+    )
+    players_count = result.scalar()
 
-    await db.commit()
-    
+    if players_count is None: #мест нет или юзер уже успел вступить в другую команду
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Команда заполена всеми игроками!")
 
-    players_count = await db.scalar(
-        select(func.count(UserModel.id))
-        .where(UserModel.command_id == command_id)
-    )
-    
-    
-    if players_count == 5:
-        command.is_filled = True
-        await db.commit()
+    events = [outbox_event("command.player_joined", "command", command_id, user_id=user.id, members_count=players_count)]
+    if players_count >= MAX_MEMBERS:
+        events.append(outbox_event("command.filled", "command", command_id, members_count=players_count))
+    await add_events(db, *events)
+    await db.commit()
+    set_committed_value(user, "command_id", command_id)
+    await principal_cache.invalidate(redis_client, user.id)
+    await search_cache.bump_generation(redis_client)
+    await roster_cache.invalidate(redis_client, command_id)
+    await roster_events.publish(redis_client, {
+        "type": "joined", "command_id": command_id, "user_ids": [user.id], "username": user.username,
+        "members_count": players_count, "is_filled": players_count >= MAX_MEMBERS
+    })
         
 
     return {
@@ -290,10 +413,16 @@ async def join_as_player(
 @router.put("/player-role")
 async def become_player(
     db : AsyncSession = Depends(get_async_db),
-    validation_role_user : UserModel =  Depends(check_no_role)
+    validation_role_user : UserModel =  Depends(check_no_role),
+    redis_client = Depends(get_redis)
 ) -> dict:
     validation_role_user.role = "player"
+    await add_events(db, outbox_event("user.role_changed", "user", validation_role_user.id, role="player"))
     await db.commit()
     await db.refresh(validation_role_user)
+    await principal_cache.invalidate(redis_client, validation_role_user.id)
+    if validation_role_user.command_id is not None: #роль видна в составе команды в поиске
+        await search_cache.bump_generation(redis_client)
+        await roster_cache.invalidate(redis_client, validation_role_user.command_id)
 
     return {"message" : f"Ваша роль изменена на {validation_role_user.role}"}
\ No newline at end of file
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field, field_validator, ConfigDict, PositiveInt
 from datetime import datetime
+from typing import Literal
 
 from app.schemas.users import UserResponseSchema
 
@@ -47,6 +48,30 @@ class JoinCommandResponce(BaseModel):
 
 
 
+class CommandSuggestSchema(BaseModel):
+    id: PositiveInt
+    name: str
+
+
+
+class CommandListItemSchema(BaseModel):
+    id: PositiveInt
+    name: str
+    created_at: datetime
+    updated_at: datetime
+    status: str
+    is_filled: bool
+
+    users : list[UserResponseSchema] | None = None #None если запрошено include_users=false
+
+
+
 class CommandSearchSchema(BaseModel):
-    next_cursor: int | None
-    items: list[CommandResponseSchema]
\ No newline at end of file
+    next_cursor: str | None #непрозрачный курсор, передаётся обратно в ?cursor=
+    items: list[CommandListItemSchema]
+
+
+
+class BulkStatusSchema(BaseModel):
+    ids : list[PositiveInt] = Field(..., min_length=1, max_length=10000, description="Список id команд")
+    status : Literal["active", "inactive"] = Field(..., description="Новый статус")
@@ -37,6 +37,16 @@ class UserResponseSchema(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class TokenPrincipalSchema(BaseModel):
+    """
+    Данные юзера прямо из access токена, без запроса в бд
+    """
+    id: PositiveInt
+    email: EmailStr
+    role: str | None
+
+
+
 class VerifyCode(BaseModel):
     verify_code : str = Field(..., description="Код подтверждения из 8 цифр")
 
@@ -51,6 +61,11 @@ class VerifyCode(BaseModel):
 
 
 
+class BulkIdsSchema(BaseModel):
+    ids : list[PositiveInt] = Field(..., min_length=1, max_length=10000, description="Список id")
+
+
+
 class RefreshToken(BaseModel):
     refresh_token: str
 
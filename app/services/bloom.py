@@ -0,0 +1,40 @@
+from hashlib import blake2b
+
+
+def bloom_positions(item : str, size_bits : int, hashes : int) -> list[int]:
+    """
+    Позиции в фильтре двойным хешированием одного blake2b
+    """
+    digest = blake2b(item.encode(), digest_size=16).digest()
+    first = int.from_bytes(digest[:8], "little")
+    second = int.from_bytes(digest[8:], "little") | 1
+    return [(first + i * second) % size_bits for i in range(hashes)]
+
+
+
+class BloomFilter:
+    """
+    In-process фильтр Блума: "нет" - точно нет, "да" - возможно да.
+    Позиции битов считаются двойным хешированием одного blake2b
+    """
+    def __init__(self, size_bits : int, hashes : int):
+        self.size_bits = size_bits
+        self.hashes = hashes
+        self._bits = bytearray((size_bits + 7) // 8)
+
+
+    def _positions(self, item : str) -> list[int]:
+        return bloom_positions(item, self.size_bits, self.hashes)
+
+
+    def add(self, item : str) -> None:
+        for position in self._positions(item):
+            self._bits[position // 8] |= 1 << (position % 8)
+
+
+    def __contains__(self, item : str) -> bool:
+        return all(self._bits[position // 8] & (1 << (position % 8)) for position in self._positions(item))
+
+
+    def clear(self) -> None:
+        self._bits = bytearray(len(self._bits))
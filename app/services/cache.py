@@ -0,0 +1,63 @@
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Hashable
+
+
+class TTLCache:
+    """
+    In-process LRU кеш с временем жизни записей.
+    Самые старые записи вытесняются при переполнении.
+    """
+    def __init__(self, max_size : int = 1024, ttl : float = 30.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data : OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+        #метрики
+        self.hits = 0
+        self.misses = 0
+
+
+    def get(self, key : Hashable, default : Any = None) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+
+        expires_at, value = item
+        if expires_at <= monotonic(): #запись протухла
+            del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+
+    def set(self, key : Hashable, value : Any, ttl : float | None = None) -> None:
+        expires_at = monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+
+    def delete(self, key : Hashable) -> None:
+        self._data.pop(key, None)
+
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
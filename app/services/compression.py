@@ -0,0 +1,125 @@
+import asyncio
+import gzip
+
+from functools import lru_cache
+
+from fastapi import Request
+
+from app.config import (
+    COMPRESSION_MIN_SIZE, COMPRESSION_OFFLOAD_SIZE,
+    COMPRESSION_GZIP_LEVEL, COMPRESSION_BROTLI_QUALITY, COMPRESSION_ZSTD_LEVEL
+)
+from app.services.json_response import FastJSONResponse
+
+try:
+    import brotli
+except ImportError: #без brotli остаются zstd и gzip
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+#уровни для сжатия на лету и для закешированных тел, которые сжимаются 1 раз
+DYNAMIC_LEVELS = {"br": COMPRESSION_BROTLI_QUALITY, "zstd": COMPRESSION_ZSTD_LEVEL, "gzip": COMPRESSION_GZIP_LEVEL}
+CACHED_LEVELS = {"br": 9, "zstd": 12, "gzip": 9}
+
+#порядок предпочтения при одинаковом q от клиента
+SUPPORTED_ENCODINGS = tuple(
+    encoding for encoding, available in (("br", brotli), ("zstd", zstandard), ("gzip", gzip))
+    if available is not None
+)
+
+
+@lru_cache(maxsize=256)
+def negotiate(accept_encoding : str | None) -> str | None:
+    """
+    Выбирает кодировку по Accept-Encoding с учётом q, None - отдаём без сжатия.
+    Заголовки у клиентов почти всегда одинаковые, поэтому разбор кешируется
+    """
+    if not accept_encoding:
+        return None
+
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+
+    wildcard = weights.get("*", 0.0)
+    best, best_q = None, 0.0
+    for encoding in SUPPORTED_ENCODINGS:
+        q = weights.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(body : bytes, encoding : str, levels : dict = DYNAMIC_LEVELS) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=levels["br"])
+    if encoding == "zstd":
+        #компрессор не потокобезопасен, поэтому свой на каждый вызов
+        return zstandard.ZstdCompressor(level=levels["zstd"]).compress(body)
+    return gzip.compress(body, compresslevel=levels["gzip"], mtime=0)
+
+
+async def compress_async(body : bytes, encoding : str, levels : dict = DYNAMIC_LEVELS,
+                         offload_size : int = COMPRESSION_OFFLOAD_SIZE) -> bytes:
+    """
+    Большие тела сжимаются в потоке: zlib, brotli и zstd отпускают GIL
+    """
+    if len(body) >= offload_size:
+        return await asyncio.to_thread(compress, body, encoding, levels)
+    return compress(body, encoding, levels)
+
+
+
+class CompressedBody:
+    """
+    Готовое тело ответа и его сжатые варианты.
+    Лежит в in-process кешах рядом с байтами, каждый вариант сжимается 1 раз
+    """
+    __slots__ = ("identity", "_variants")
+
+    def __init__(self, identity : bytes):
+        self.identity = identity
+        self._variants : dict[str, bytes] = {}
+
+
+    async def variant(self, encoding : str | None) -> bytes:
+        if encoding is None:
+            return self.identity
+        compressed = self._variants.get(encoding)
+        if compressed is None:
+            #закешированное тело сжимается 1 раз, поэтому можно сильнее и вне event loop
+            compressed = await asyncio.to_thread(compress, self.identity, encoding, CACHED_LEVELS)
+            self._variants[encoding] = compressed
+        return compressed
+
+
+
+async def negotiated_response(request : Request, body : CompressedBody, headers : dict | None = None,
+                              min_size : int = COMPRESSION_MIN_SIZE) -> FastJSONResponse:
+    """
+    Ответ из закешированного тела в кодировке, которую принимает клиент.
+    Content-Encoding уже выставлен, поэтому CompressionMiddleware его не трогает
+    """
+    headers = dict(headers or {})
+    headers["Vary"] = "Accept-Encoding"
+    encoding = None
+    if len(body.identity) >= min_size:
+        encoding = negotiate(request.headers.get("accept-encoding"))
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+        if "ETag" in headers: #сжатое представление байт в байт не совпадает с исходным
+            headers["ETag"] = "W/" + headers["ETag"]
+    return FastJSONResponse(await body.variant(encoding), headers=headers)
@@ -0,0 +1,108 @@
+import random
+
+from time import perf_counter
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+from app.config import logger, DB_SLOW_QUERY_SECONDS, DB_SLOW_QUERY_SAMPLE_RATE
+
+
+class PoolMetrics:
+    """
+    Метрики пула соединений: ожидание соединения, занятые соединения, overflow
+    """
+    def __init__(self, name : str):
+        self.name = name
+        self.engine : Engine | None = None
+
+        self.checkouts = 0
+        self.checkout_wait_seconds_total = 0.0
+        self.checkout_wait_seconds_max = 0.0
+        self.checkout_timeouts = 0
+        self.queries = 0
+        self.slow_queries = 0
+
+
+    def observe_wait(self, seconds : float) -> None:
+        self.checkouts += 1
+        self.checkout_wait_seconds_total += seconds
+        self.checkout_wait_seconds_max = max(self.checkout_wait_seconds_max, seconds)
+
+
+    def stats(self) -> dict:
+        data = {
+            "checkouts": self.checkouts,
+            "checkout_wait_seconds_total": self.checkout_wait_seconds_total,
+            "checkout_wait_seconds_max": self.checkout_wait_seconds_max,
+            "checkout_timeouts": self.checkout_timeouts,
+            "queries": self.queries,
+            "slow_queries": self.slow_queries,
+        }
+        pool = self.engine.pool if self.engine is not None else None
+        if isinstance(pool, QueuePool):
+            data.update({
+                "size": pool.size(),
+                "in_use": pool.checkedout(),
+                "idle": pool.checkedin(),
+                "overflow": max(pool.overflow(), 0),
+            })
+        return data
+
+
+
+async_pool_metrics = PoolMetrics("async")
+
+
+
+class _TimedPoolMixin:
+    """
+    Замеряет сколько запрос ждал свободное соединение из пула
+    """
+    metrics : PoolMetrics
+
+    def _do_get(self):
+        started = perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError: #отказ подключения или отмена запроса - не таймаут пула
+            self.metrics.checkout_timeouts += 1
+            raise
+        self.metrics.observe_wait(perf_counter() - started)
+        return connection
+
+
+class AsyncTimedPool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    metrics = async_pool_metrics
+
+
+
+def instrument_engine(engine : Engine, metrics : PoolMetrics) -> None:
+    """
+    Вешает на движок счётчик запросов и выборочный лог медленных запросов
+    вместо echo=True на каждый запрос
+    """
+    metrics.engine = engine
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration = perf_counter() - conn.info["query_started"].pop()
+        metrics.queries += 1
+        if duration < DB_SLOW_QUERY_SECONDS:
+            return
+        metrics.slow_queries += 1
+        if random.random() < DB_SLOW_QUERY_SAMPLE_RATE:
+            logger.bind(log_id=f"db-{metrics.name}").warning(
+                f"Медленный запрос {duration:.3f} сек: {' '.join(statement.split())[:500]}"
+            )
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(context):
+        if context.connection is not None and context.connection.info.get("query_started"):
+            context.connection.info["query_started"].pop()
@@ -8,9 +8,9 @@ from os import getenv
 
 load_dotenv()
 
-async def send_verification_email(to: str, code: str):
+def build_verification_message(to: str, code: str) -> MIMEMultipart:
     """
-    Отправка email с кодом подтверждения
+    Собирает письмо с кодом подтверждения
     
     Args:
         to: Email получателя
@@ -48,8 +48,35 @@ async def send_verification_email(to: str, code: str):
     # "plain" = простой текст (не HTML)
     # "utf-8" = кодировка (поддерживает кириллицу)
     message.attach(MIMEText(body, "plain", "utf-8"))
+    return message
+
+
+
+def create_smtp_client() -> aiosmtplib.SMTP:
+    """
+    Создаёт SMTP клиент, который переиспользуется воркером очереди писем
+    """
+    return aiosmtplib.SMTP(
+        hostname=getenv("SMTP_HOST"),
+        port=int(getenv("SMTP_PORT", "25")),
+        username=getenv("SMTP_USER"),
+        password=getenv("SMTP_PASSWORD"),
+        start_tls=False,
+    )
+
+
+
+async def send_verification_email(to: str, code: str):
+    """
+    Отправка email с кодом подтверждения напрямую, в обход очереди
+    
+    Args:
+        to: Email получателя
+        code: Код подтверждения (например, "123456")
+    """
+    message = build_verification_message(to, code)
     
-    # 7. Отправляем письмо через SMTP сервер
+    # Отправляем письмо через SMTP сервер
     # aiosmtplib.send - асинхронная отправка
      
     await aiosmtplib.send(
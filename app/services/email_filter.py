@@ -0,0 +1,257 @@
+import asyncio
+
+import redis.asyncio as redis
+
+from sqlalchemy import select
+
+from app.config import (
+    logger, LOGIN_FILTER_ENABLED, LOGIN_FILTER_SIZE, LOGIN_FILTER_HASHES, LOGIN_FILTER_REBUILD_INTERVAL
+)
+from app.database import get_async_session_maker
+from app.models import UserModel
+from app.services.bloom import bloom_positions
+from app.services.redis_scripts import lua_script
+
+
+#пополнение живого фильтра и того, что сейчас собирается, чтобы подтверждения во время сборки не потерялись
+ADD = lua_script("""
+local args = {'OVERFLOW', 'SAT'}
+for i = 1, #ARGV do
+    args[#args + 1] = 'INCRBY'
+    args[#args + 1] = 'u4'
+    args[#args + 1] = '#' .. ARGV[i]
+    args[#args + 1] = 1
+end
+redis.call('BITFIELD', KEYS[1], unpack(args))
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    redis.call('BITFIELD', KEYS[2], unpack(args))
+end
+return 1
+""")
+
+#уменьшение счётчиков в обоих фильтрах. Насыщенный счётчик (15) не уменьшается:
+#сколько email за ним на самом деле, неизвестно, и вычитание дало бы ложное "нет"
+REMOVE = lua_script("""
+for _, key in ipairs(KEYS) do
+    if redis.call('EXISTS', key) == 1 then
+        local get = {}
+        for i = 1, #ARGV do
+            get[#get + 1] = 'GET'
+            get[#get + 1] = 'u4'
+            get[#get + 1] = '#' .. ARGV[i]
+        end
+        local values = redis.call('BITFIELD', key, unpack(get))
+        local args = {'OVERFLOW', 'SAT'}
+        for i, value in ipairs(values) do
+            if value > 0 and value < 15 then
+                args[#args + 1] = 'INCRBY'
+                args[#args + 1] = 'u4'
+                args[#args + 1] = '#' .. ARGV[i]
+                args[#args + 1] = -1
+            end
+        end
+        if #args > 2 then
+            redis.call('BITFIELD', key, unpack(args))
+        end
+    end
+end
+return 1
+""")
+
+
+class EmailFilter:
+    """
+    Считающий фильтр Блума email активных юзеров в Redis (4-битные счётчики в одной строке),
+    общий для всех воркеров. "Нет" - такого активного аккаунта точно нет и логин
+    отклоняется без запроса в бд, "возможно" - идём в бд как раньше.
+    Пополняется при подтверждении почты (неподтверждённые войти всё равно не могут),
+    уменьшается при удалении. Последний счётчик - признак, что фильтр собран:
+    пока его нет (первый старт или Redis потерял ключ) - всегда идём в бд.
+    "Нет" в бд не перепроверяется, поэтому фильтр раз в rebuild_interval собирается
+    из бд заново в соседнем ключе и атомарно подменяет живой: так исправляются
+    пропущенные пополнения (Redis был недоступен, юзера активировали в обход API)
+    """
+    #общий hash tag держит живой и собираемый фильтр в одном слоте для скриптов и RENAME
+    KEY = "{login:emails}:filter"
+    NEXT_KEY = "{login:emails}:filter:next"
+    LOCK_KEY = "{login:emails}:filter:lock"
+    FRESH_KEY = "{login:emails}:filter:fresh" #живёт rebuild_interval после сборки
+    CHECK_INTERVAL = 30 #секунды между проверками, не пора ли пересобрать
+
+    def __init__(self, enabled : bool, size : int, hashes : int, rebuild_interval : int, build_chunk : int = 5000):
+        self.enabled = enabled
+        self.size = size
+        self.hashes = hashes
+        self.rebuild_interval = rebuild_interval
+        self.build_chunk = build_chunk
+        self._builder : asyncio.Task | None = None
+        self._lost_adds = False #пополнение не дошло до Redis, нужна внеочередная сборка
+
+        #метрики
+        self.negative = 0 #отказов без запроса в бд
+        self.maybe = 0
+        self.not_ready = 0
+        self.redis_errors = 0
+        self.rebuilds = 0
+
+
+    def _positions(self, email : str) -> list[int]:
+        return bloom_positions(email.casefold(), self.size, self.hashes)
+
+
+    async def _increment(self, r : redis.Redis, key : str, emails) -> None:
+        field = r.bitfield(key, default_overflow="SAT")
+        for email in emails:
+            for position in self._positions(email):
+                field.incrby("u4", f"#{position}", 1)
+        await field.execute()
+
+
+    async def _apply(self, r : redis.Redis, script, emails) -> None:
+        positions = [position for email in emails for position in self._positions(email)]
+        #unpack в Lua ограничен несколькими тысячами аргументов, большие пачки режем
+        for start in range(0, len(positions), 1500):
+            await script(keys=[self.KEY, self.NEXT_KEY], args=positions[start:start + 1500], client=r)
+
+
+    async def add(self, r : redis.Redis, *emails : str) -> None:
+        if not self.enabled or not emails:
+            return
+        try:
+            await self._apply(r, ADD, emails)
+        except Exception:
+            self.redis_errors += 1
+            self._lost_adds = True
+
+
+    async def remove(self, r : redis.Redis, *emails : str) -> None:
+        if not self.enabled or not emails:
+            return
+        try:
+            await self._apply(r, REMOVE, emails)
+        except Exception:
+            self.redis_errors += 1
+
+
+    async def might_exist(self, r : redis.Redis, email : str) -> bool | None:
+        """
+        False - активного аккаунта точно нет, True - возможно есть,
+        None - фильтр выключен, не собран или Redis недоступен
+        """
+        if not self.enabled:
+            return None
+        field = r.bitfield(self.KEY)
+        field.get("u4", f"#{self.size}") #признак готовности
+        for position in self._positions(email):
+            field.get("u4", f"#{position}")
+        try:
+            ready, *counters = await field.execute()
+        except Exception:
+            self.redis_errors += 1
+            return None
+
+        if not ready:
+            self.not_ready += 1
+            return None
+        if all(counters):
+            self.maybe += 1
+            return True
+        self.negative += 1
+        return False
+
+
+    async def is_ready(self, r : redis.Redis) -> bool:
+        ready, = await r.bitfield(self.KEY).get("u4", f"#{self.size}").execute()
+        return bool(ready)
+
+
+    async def build(self, r : redis.Redis, force : bool = False) -> bool:
+        """
+        Собирает фильтр из бд, если его ещё нет или прошёл rebuild_interval с прошлой сборки.
+        Строит один воркер под локом в NEXT_KEY, подтверждения и удаления во время сборки
+        пишутся и туда, готовый фильтр заменяет живой одним RENAME.
+        Возвращает True, если собирал этот вызов
+        """
+        if not self.enabled:
+            return False
+        if not force and await self.is_ready(r) and await r.exists(self.FRESH_KEY):
+            return False
+        if not await r.set(self.LOCK_KEY, "1", nx=True, ex=600):
+            return False
+
+        try:
+            await r.delete(self.NEXT_KEY) #остатки прерванной сборки
+            #ключ создаётся до чтения из бд: всё, что подтвердят после снимка, ADD допишет сюда
+            await r.bitfield(self.NEXT_KEY).set("u4", f"#{self.size}", 0).execute()
+            count = 0
+            async with get_async_session_maker()() as db:
+                result = await db.stream_scalars(
+                    select(UserModel.email)
+                    .where(UserModel.is_active == True)
+                    .execution_options(yield_per=self.build_chunk)
+                )
+                async for emails in result.partitions(self.build_chunk):
+                    #ошибка здесь должна прервать сборку, иначе фильтр пометится собранным без части email
+                    await self._increment(r, self.NEXT_KEY, emails)
+                    count += len(emails)
+            await r.bitfield(self.NEXT_KEY).set("u4", f"#{self.size}", 1).execute()
+            async with r.pipeline(transaction=True) as pipe:
+                pipe.rename(self.NEXT_KEY, self.KEY)
+                pipe.set(self.FRESH_KEY, "1", ex=self.rebuild_interval)
+                await pipe.execute()
+            self.rebuilds += 1
+            logger.bind(log_id="email-filter").info(f"Фильтр email собран: {count} активных юзеров")
+            return True
+        finally:
+            await r.delete(self.NEXT_KEY, self.LOCK_KEY)
+
+
+    async def _run(self, r : redis.Redis) -> None:
+        while True:
+            try:
+                lost_adds, self._lost_adds = self._lost_adds, False
+                if not await self.build(r, force=lost_adds) and lost_adds:
+                    self._lost_adds = True #собирает другой воркер, возможно по старому снимку
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                if asyncio.current_task().cancelling(): #отмена во время запроса в бд приходит ошибкой закрытого соединения
+                    raise asyncio.CancelledError from ex
+                self._lost_adds = self._lost_adds or lost_adds
+                logger.bind(log_id="email-filter").error(f"Не удалось собрать фильтр email: {ex}")
+            await asyncio.sleep(self.CHECK_INTERVAL)
+
+
+    def start(self, r : redis.Redis) -> None:
+        if self._builder is None:
+            self._builder = asyncio.create_task(self._run(r))
+
+
+    async def stop(self) -> None:
+        if self._builder is not None:
+            self._builder.cancel()
+            try:
+                await self._builder
+            except asyncio.CancelledError:
+                pass
+            self._builder = None
+
+
+    def stats(self) -> dict:
+        return {
+            "negative": self.negative,
+            "maybe": self.maybe,
+            "not_ready": self.not_ready,
+            "redis_errors": self.redis_errors,
+            "rebuilds": self.rebuilds,
+        }
+
+
+
+#создание обьекта
+email_filter = EmailFilter(
+    enabled=LOGIN_FILTER_ENABLED,
+    size=LOGIN_FILTER_SIZE,
+    hashes=LOGIN_FILTER_HASHES,
+    rebuild_interval=LOGIN_FILTER_REBUILD_INTERVAL
+)
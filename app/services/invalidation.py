@@ -0,0 +1,100 @@
+import asyncio
+import json
+
+import redis.asyncio as redis
+
+from collections.abc import Callable
+
+from app.config import logger
+
+
+class InvalidationBus:
+    """
+    Рассылка сбросов in-process кешей всем воркерам через Redis pub/sub.
+    Кеш регистрирует обработчик под своим именем, publish отправляет имя и ключи,
+    каждый воркер (и сам отправитель) вызывает обработчик у себя.
+    Пока подписка оборвана, сообщения теряются, поэтому после каждой (пере)подписки
+    вызывается resync: кеш сбрасывает всё локальное целиком
+    """
+    CHANNEL = "cache:invalidate"
+
+    def __init__(self):
+        self._handlers : dict[str, Callable[[list], None]] = {}
+        self._resync : dict[str, Callable[[], None]] = {}
+        self._worker : asyncio.Task | None = None
+
+        #метрики
+        self.received = 0
+        self.publish_errors = 0
+
+
+    def register(self, name : str, handler : Callable[[list], None], resync : Callable[[], None]) -> None:
+        self._handlers[name] = handler
+        self._resync[name] = resync
+
+
+    async def publish(self, r : redis.Redis, name : str, *keys) -> None:
+        if not keys:
+            return
+        try:
+            await r.publish(self.CHANNEL, json.dumps({"cache": name, "keys": list(keys)}))
+        except Exception as ex:
+            self.publish_errors += 1
+            logger.bind(log_id="invalidation").warning(f"Не удалось разослать сброс кеша {name}: {ex}")
+
+
+    def _dispatch(self, data : str) -> None:
+        try:
+            message = json.loads(data)
+            handler = self._handlers[message["cache"]]
+        except (ValueError, KeyError):
+            return
+        self.received += 1
+        handler(message["keys"])
+
+
+    async def _run(self, r : redis.Redis) -> None:
+        while True:
+            pubsub = r.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.CHANNEL)
+                #сбросы, пришедшие пока подписки не было, потеряны
+                for resync in self._resync.values():
+                    resync()
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self._dispatch(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                logger.bind(log_id="invalidation").error(f"Подписка на сбросы кешей оборвалась: {ex}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+
+    def start(self, r : redis.Redis) -> None:
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run(r))
+
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+
+    def stats(self) -> dict:
+        return {
+            "received": self.received,
+            "publish_errors": self.publish_errors,
+        }
+
+
+
+#создание обьекта
+invalidation_bus = InvalidationBus()
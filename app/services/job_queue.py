@@ -0,0 +1,291 @@
+import asyncio
+import json
+
+import redis.asyncio as redis
+
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from time import time
+from uuid import uuid4
+
+from app.config import (
+    logger, JOBS_CONCURRENCY, JOBS_MAX_ATTEMPTS, JOBS_RETRY_BASE_DELAY,
+    JOBS_VISIBILITY_TIMEOUT, JOBS_POLL_INTERVAL
+)
+from app.services.redis_scripts import lua_script
+
+
+#берём пачку задач и сразу кладём их в processing с дедлайном - один round-trip.
+#пока задача выполняется, воркер продлевает дедлайн, если он упадёт - задача вернётся в очередь
+POP = lua_script("""
+local jobs = redis.call('LPOP', KEYS[1], ARGV[1])
+if not jobs then
+    return {}
+end
+for _, job in ipairs(jobs) do
+    redis.call('ZADD', KEYS[2], ARGV[2], job)
+end
+return jobs
+""")
+
+#переносит в очередь отложенные задачи, у которых подошло время
+PROMOTE = lua_script("""
+local due = redis.call('ZRANGEBYSCORE', KEYS[2], 0, ARGV[1], 'LIMIT', 0, 500)
+if #due > 0 then
+    redis.call('ZREM', KEYS[2], unpack(due))
+    redis.call('RPUSH', KEYS[1], unpack(due))
+end
+return #due
+""")
+
+#задача уходит из processing в очередь или dead, только если она всё ещё там.
+#новое тело (attempts + 1) собирает python, скрипт гарантирует, что задачу переложит ровно один воркер
+REQUEUE = lua_script("""
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 1 then
+    redis.call('RPUSH', KEYS[2], ARGV[2])
+    return 1
+end
+return 0
+""")
+
+#то же для повтора после ошибки: откладываем, только если задача всё ещё за этим воркером
+RESCHEDULE = lua_script("""
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 1 then
+    redis.call('ZADD', KEYS[2], ARGV[3], ARGV[2])
+    return 1
+end
+return 0
+""")
+
+
+@dataclass
+class JobSpec:
+    handler : Callable[..., Awaitable[None]]
+    max_attempts : int
+
+
+
+@dataclass
+class PeriodicJob:
+    name : str
+    every : float
+    kwargs : dict
+
+
+
+class JobQueue:
+    """
+    Очередь фоновых задач в Redis вместо Celery:
+    {jobs}:queue - список готовых, {jobs}:scheduled - sorted set отложенных и повторов,
+    {jobs}:processing - выданные воркерам (score = дедлайн), {jobs}:dead - исчерпавшие попытки.
+    Общий hash tag {jobs} держит ключи в одном слоте Redis Cluster, скрипты трогают их вместе.
+    Роутеры и lifespan только ставят задачи, выполняет их python -m app.worker
+    """
+    QUEUE_KEY = "{jobs}:queue"
+    SCHEDULED_KEY = "{jobs}:scheduled"
+    PROCESSING_KEY = "{jobs}:processing"
+    DEAD_KEY = "{jobs}:dead"
+    PERIODIC_PREFIX = "jobs:periodic:"
+
+    def __init__(self, concurrency : int, max_attempts : int, retry_base_delay : float,
+                 visibility_timeout : float, poll_interval : float):
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self._jobs : dict[str, JobSpec] = {}
+        self._periodic : list[PeriodicJob] = []
+        self._stopping = asyncio.Event()
+
+        #метрики
+        self.completed = 0
+        self.failed = 0
+        self.redelivered = 0
+        self.dead_lettered = 0
+
+
+    def job(self, name : str, max_attempts : int | None = None):
+        """
+        Декоратор регистрации обработчика задачи,
+        обработчик получает Redis воркера первым аргументом и kwargs задачи
+        """
+        def decorator(handler : Callable[..., Awaitable[None]]):
+            self._jobs[name] = JobSpec(handler, max_attempts or self.max_attempts)
+            return handler
+        return decorator
+
+
+    def every(self, seconds : float, name : str, **kwargs) -> None:
+        """
+        Периодическая задача: ставится в очередь раз в seconds одним воркером из всех
+        """
+        self._periodic.append(PeriodicJob(name, seconds, kwargs))
+
+
+    async def enqueue(self, r : redis.Redis, name : str, delay : float = 0, **kwargs) -> str:
+        job_id = uuid4().hex
+        raw = json.dumps({"id": job_id, "name": name, "kwargs": kwargs, "attempts": 0})
+        if delay > 0:
+            await r.zadd(self.SCHEDULED_KEY, {raw: time() + delay})
+        else:
+            await r.rpush(self.QUEUE_KEY, raw)
+        return job_id
+
+
+    async def _schedule_periodic(self, r : redis.Redis) -> None:
+        for periodic in self._periodic:
+            #лок живёт один период, кто его взял - тот и ставит задачу
+            if await r.set(f"{self.PERIODIC_PREFIX}{periodic.name}", "1", nx=True, ex=max(1, int(periodic.every))):
+                await self.enqueue(r, periodic.name, **periodic.kwargs)
+
+
+    def _max_attempts(self, name : str) -> int:
+        spec = self._jobs.get(name)
+        return spec.max_attempts if spec is not None else 1
+
+
+    async def _promote_due(self, r : redis.Redis) -> None:
+        await PROMOTE(keys=[self.QUEUE_KEY, self.SCHEDULED_KEY], args=[time()], client=r)
+
+
+    async def _recover_expired(self, r : redis.Redis) -> None:
+        """
+        Задачи, чей дедлайн истёк (воркер упал, не успев её закончить), возвращаются
+        в очередь как ещё одна попытка, исчерпавшие попытки - в dead
+        """
+        for raw in await r.zrangebyscore(self.PROCESSING_KEY, 0, time(), start=0, num=500):
+            job = json.loads(raw)
+            job["attempts"] += 1
+            job["error"] = "дедлайн истёк, воркер не закончил задачу"
+            exhausted = job["attempts"] >= self._max_attempts(job["name"])
+            target = self.DEAD_KEY if exhausted else self.QUEUE_KEY
+            if not await REQUEUE(keys=[self.PROCESSING_KEY, target], args=[raw, json.dumps(job)], client=r):
+                continue #вернул другой воркер
+            if exhausted:
+                self.dead_lettered += 1
+                logger.bind(log_id="jobs").error(f"Задача {job['name']} {job['id']} исчерпала попытки: {job['error']}")
+            else:
+                self.redelivered += 1
+
+
+    async def _keep_alive(self, r : redis.Redis, raw : str) -> None:
+        """
+        Продлевает дедлайн выполняющейся задачи, чтобы её не вернули в очередь,
+        пока она честно работает дольше visibility_timeout
+        """
+        while True:
+            await asyncio.sleep(self.visibility_timeout / 3)
+            try:
+                #XX: задачу, которую уже вернули в очередь, обратно не добавляем
+                await r.zadd(self.PROCESSING_KEY, {raw: time() + self.visibility_timeout}, xx=True)
+            except Exception as ex:
+                logger.bind(log_id="jobs").warning(f"Не удалось продлить дедлайн задачи: {ex}")
+
+
+    async def _pop(self, r : redis.Redis, count : int) -> list[str]:
+        return await POP(keys=[self.QUEUE_KEY, self.PROCESSING_KEY], args=[count, time() + self.visibility_timeout], client=r)
+
+
+    async def _execute(self, r : redis.Redis, raw : str) -> None:
+        job = json.loads(raw)
+        spec = self._jobs.get(job["name"])
+        keep_alive = asyncio.create_task(self._keep_alive(r, raw))
+        try:
+            if spec is None:
+                raise LookupError(f"Неизвестная задача {job['name']}")
+            await spec.handler(r, **job["kwargs"])
+        except asyncio.CancelledError:
+            raise #задача останется в processing и вернётся в очередь по дедлайну
+        except Exception as ex:
+            self.failed += 1
+            job["attempts"] += 1
+            job["error"] = repr(ex)
+            #если дедлайн не продлился и задачу уже вернул другой воркер, вторую копию не ставим
+            if job["attempts"] >= self._max_attempts(job["name"]):
+                if await REQUEUE(keys=[self.PROCESSING_KEY, self.DEAD_KEY], args=[raw, json.dumps(job)], client=r):
+                    self.dead_lettered += 1
+                    logger.bind(log_id="jobs").error(f"Задача {job['name']} {job['id']} исчерпала попытки: {ex!r}")
+            else:
+                delay = self.retry_base_delay * 2 ** (job["attempts"] - 1)
+                await RESCHEDULE(
+                    keys=[self.PROCESSING_KEY, self.SCHEDULED_KEY],
+                    args=[raw, json.dumps(job), time() + delay],
+                    client=r
+                )
+            return
+        finally:
+            keep_alive.cancel()
+
+        self.completed += 1
+        await r.zrem(self.PROCESSING_KEY, raw)
+
+
+    async def run_worker(self, r : redis.Redis) -> None:
+        """
+        Цикл воркера: не больше concurrency задач одновременно,
+        после stop() новые задачи не берутся, начатые дорабатывают
+        """
+        running : set[asyncio.Task] = set()
+
+        while not self._stopping.is_set():
+            free = self.concurrency - len(running)
+            if free == 0: #все слоты заняты, ждём первую освободившуюся
+                await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                continue
+            try:
+                await self._schedule_periodic(r)
+                await self._promote_due(r)
+                await self._recover_expired(r)
+                jobs = await self._pop(r, free)
+            except Exception as ex:
+                logger.bind(log_id="jobs").error(f"Ошибка воркера задач: {ex}")
+                jobs = []
+
+            for raw in jobs:
+                task = asyncio.create_task(self._execute(r, raw))
+                running.add(task)
+                task.add_done_callback(running.discard)
+
+            if not jobs:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+
+    async def stats(self, r : redis.Redis) -> dict:
+        async with r.pipeline(transaction=False) as pipe:
+            pipe.llen(self.QUEUE_KEY)
+            pipe.zcard(self.SCHEDULED_KEY)
+            pipe.zcard(self.PROCESSING_KEY)
+            pipe.llen(self.DEAD_KEY)
+            queued, scheduled, processing, dead = await pipe.execute()
+        return {
+            "queued": queued,
+            "scheduled": scheduled,
+            "processing": processing,
+            "dead": dead,
+            "completed": self.completed,
+            "failed": self.failed,
+            "redelivered": self.redelivered,
+            "dead_lettered": self.dead_lettered,
+        }
+
+
+
+#создание обьекта
+job_queue = JobQueue(
+    concurrency=JOBS_CONCURRENCY,
+    max_attempts=JOBS_MAX_ATTEMPTS,
+    retry_base_delay=JOBS_RETRY_BASE_DELAY,
+    visibility_timeout=JOBS_VISIBILITY_TIMEOUT,
+    poll_interval=JOBS_POLL_INTERVAL
+)
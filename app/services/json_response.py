@@ -0,0 +1,31 @@
+import orjson
+
+from pydantic import BaseModel
+from pydantic_core import to_json
+from starlette.responses import JSONResponse
+
+
+ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+
+def dumps(content) -> bytes:
+    """
+    json в байты через orjson, datetime сериализуется нативно
+    """
+    return orjson.dumps(content, option=ORJSON_OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    Ответ для горячих read роутов.
+    Роут возвращает этот ответ сам, поэтому FastAPI не валидирует его повторно
+    по response_model и не гоняет через jsonable_encoder.
+    Готовый json в bytes (из кеша) отдаётся как есть, модели - через pydantic_core,
+    остальное, включая str, сериализуется через orjson
+    """
+    def render(self, content) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        if isinstance(content, BaseModel):
+            return to_json(content)
+        return dumps(content)
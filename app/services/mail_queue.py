@@ -0,0 +1,274 @@
+import asyncio
+import json
+
+import aiosmtplib
+import redis.asyncio as redis
+
+from fastapi import Request
+from os import getenv
+from time import time
+
+from app.config import logger, MAIL_BATCH_SIZE, MAIL_MAX_ATTEMPTS, MAIL_RETRY_BASE_DELAY
+from app.services.email import build_verification_message, create_smtp_client
+from app.services.job_queue import job_queue
+from app.services.redis_scripts import lua_script
+
+
+#переносит письма, у которых подошло время повтора, обратно в очередь.
+#одним скриптом, иначе два воркера прочитают одни и те же повторы и письмо уйдёт дважды
+PROMOTE = lua_script("""
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], 0, ARGV[1], 'LIMIT', 0, 500)
+if #due > 0 then
+    redis.call('ZREM', KEYS[1], unpack(due))
+    redis.call('RPUSH', KEYS[2], unpack(due))
+end
+return #due
+""")
+
+
+class RedisMailBackend:
+    """
+    Очередь писем в Redis:
+    {mail}:queue - список готовых к отправке,
+    {mail}:retry - sorted set отложенных повторов (score = время повтора),
+    {mail}:dead - письма, которые так и не удалось отправить.
+    Общий hash tag {mail} держит ключи в одном слоте Redis Cluster для скрипта переноса повторов
+    """
+    QUEUE_KEY = "{mail}:queue"
+    RETRY_KEY = "{mail}:retry"
+    DEAD_KEY = "{mail}:dead"
+
+    def __init__(self, redis_client : redis.Redis):
+        self.redis = redis_client
+
+
+    async def push(self, job : dict) -> None:
+        await self.redis.rpush(self.QUEUE_KEY, json.dumps(job))
+
+
+    async def pop_batch(self, size : int, timeout : float) -> list[dict]:
+        first = await self.redis.blpop(self.QUEUE_KEY, timeout=timeout)
+        if first is None:
+            return []
+        raw_jobs = [first[1]]
+        if size > 1:
+            rest = await self.redis.lpop(self.QUEUE_KEY, size - 1)
+            raw_jobs.extend(rest or [])
+        return [json.loads(raw) for raw in raw_jobs]
+
+
+    async def retry(self, job : dict, delay : float) -> None:
+        await self.redis.zadd(self.RETRY_KEY, {json.dumps(job): time() + delay})
+
+
+    async def promote_due(self) -> None:
+        """
+        Переносит письма, у которых подошло время повтора, обратно в очередь
+        """
+        await PROMOTE(keys=[self.RETRY_KEY, self.QUEUE_KEY], args=[time()], client=self.redis)
+
+
+    async def dead(self, job : dict) -> None:
+        await self.redis.rpush(self.DEAD_KEY, json.dumps(job))
+
+
+    async def depth(self) -> int:
+        return await self.redis.llen(self.QUEUE_KEY)
+
+
+
+class MemoryMailBackend:
+    """
+    In-process очередь писем для тестов и локального запуска без Redis
+    """
+    def __init__(self):
+        self.queue : asyncio.Queue[dict] = asyncio.Queue()
+        self.retries : list[tuple[float, dict]] = []
+        self.dead_letters : list[dict] = []
+
+
+    async def push(self, job : dict) -> None:
+        await self.queue.put(job)
+
+
+    async def pop_batch(self, size : int, timeout : float) -> list[dict]:
+        try:
+            jobs = [await asyncio.wait_for(self.queue.get(), timeout=timeout)]
+        except asyncio.TimeoutError:
+            return []
+        while len(jobs) < size and not self.queue.empty():
+            jobs.append(self.queue.get_nowait())
+        return jobs
+
+
+    async def retry(self, job : dict, delay : float) -> None:
+        self.retries.append((time() + delay, job))
+
+
+    async def promote_due(self) -> None:
+        now = time()
+        due = [job for ready_at, job in self.retries if ready_at <= now]
+        self.retries = [(ready_at, job) for ready_at, job in self.retries if ready_at > now]
+        for job in due:
+            await self.queue.put(job)
+
+
+    async def dead(self, job : dict) -> None:
+        self.dead_letters.append(job)
+
+
+    async def depth(self) -> int:
+        return self.queue.qsize()
+
+
+
+class MailQueue:
+    """
+    Фоновая очередь писем: роутеры только кладут задачу,
+    воркер отправляет пачками через одно переиспользуемое SMTP соединение,
+    повторяет с экспоненциальной задержкой и складывает неудачные в dead-letter
+    """
+    def __init__(self, backend, smtp_factory = create_smtp_client, batch_size : int = MAIL_BATCH_SIZE,
+                 max_attempts : int = MAIL_MAX_ATTEMPTS, retry_base_delay : float = MAIL_RETRY_BASE_DELAY):
+        self.backend = backend
+        self.smtp_factory = smtp_factory
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self._smtp : aiosmtplib.SMTP | None = None
+        self._worker : asyncio.Task | None = None
+
+        #метрики
+        self.sent = 0
+        self.failed = 0
+        self.dead_lettered = 0
+
+
+    async def enqueue_verification_email(self, to : str, code : str) -> None:
+        await self.backend.push({"kind": "verification", "to": to, "code": code, "attempts": 0})
+
+
+    async def _get_smtp(self) -> aiosmtplib.SMTP:
+        #соединение держим открытым между пачками
+        if self._smtp is None or not self._smtp.is_connected:
+            self._smtp = self.smtp_factory()
+            await self._smtp.connect()
+        return self._smtp
+
+
+    async def _close_smtp(self) -> None:
+        if self._smtp is not None and self._smtp.is_connected:
+            try:
+                await self._smtp.quit()
+            except aiosmtplib.SMTPException:
+                self._smtp.close()
+        self._smtp = None
+
+
+    async def _send(self, job : dict) -> None:
+        message = build_verification_message(job["to"], job["code"])
+        smtp = await self._get_smtp()
+        await smtp.send_message(message, sender=getenv("SMTP_FROM"))
+
+
+    async def _handle_failure(self, job : dict, ex : Exception) -> None:
+        self.failed += 1
+        job["attempts"] += 1
+        job["error"] = str(ex)
+        if job["attempts"] >= self.max_attempts:
+            self.dead_lettered += 1
+            logger.bind(log_id="mail-queue").error(f"Письмо на {job.get('to')} не отправлено: {ex!r}")
+            await self.backend.dead(job)
+        else:
+            delay = self.retry_base_delay * 2 ** (job["attempts"] - 1)
+            await self.backend.retry(job, delay)
+
+
+    async def process_batch(self, timeout : float = 1.0) -> int:
+        """
+        Отправляет одну пачку писем, возвращает сколько писем было взято
+        """
+        await self.backend.promote_due()
+        jobs = await self.backend.pop_batch(self.batch_size, timeout)
+        for job in jobs:
+            try:
+                await self._send(job)
+                self.sent += 1
+            except Exception as ex:
+                #письмо уже снято с очереди: любая ошибка идёт в повтор или dead, иначе остаток пачки пропадёт
+                if isinstance(ex, (aiosmtplib.SMTPException, OSError)):
+                    #после ошибки соединение могло сломаться, следующее письмо откроет новое
+                    await self._close_smtp()
+                await self._handle_failure(job, ex)
+        return len(jobs)
+
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.process_batch()
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                logger.bind(log_id="mail-queue").error(f"Ошибка воркера очереди писем: {ex}")
+                await asyncio.sleep(1)
+
+
+    def start(self) -> None:
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        await self._close_smtp()
+
+
+    async def stats(self) -> dict:
+        return {
+            "depth": await self.backend.depth(),
+            "sent": self.sent,
+            "failed": self.failed,
+            "dead_lettered": self.dead_lettered,
+        }
+
+
+
+class JobMailQueue:
+    """
+    Письма уходят задачей send_verification_email в общую очередь задач,
+    отправляет их python -m app.worker, поэтому воркера в приложении нет
+    """
+    def __init__(self, redis_client : redis.Redis):
+        self.redis = redis_client
+
+
+    async def enqueue_verification_email(self, to : str, code : str) -> None:
+        await job_queue.enqueue(self.redis, "send_verification_email", to=to, code=code)
+
+
+    def start(self) -> None:
+        pass
+
+
+    async def stop(self) -> None:
+        pass
+
+
+    async def stats(self) -> dict:
+        return {"depth": await self.redis.llen(job_queue.QUEUE_KEY)}
+
+
+
+async def get_mail_queue(request: Request) -> MailQueue | JobMailQueue:
+    """
+    Получает очередь писем из app.state.
+    Очередь и её воркер создаются 1 раз при старте приложения.
+    """
+    return request.app.state.mail_queue
@@ -0,0 +1,160 @@
+from bisect import bisect_left
+from collections.abc import Callable, Iterable
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels : dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class Counter:
+    def __init__(self, name : str, documentation : str, labelnames : tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values : dict[tuple, float] = {}
+
+
+    def inc(self, amount : float = 1.0, **labels) -> None:
+        key = tuple(labels[name] for name in self.labelnames)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for key, value in self._values.items():
+            yield f"{self.name}{_format_labels(dict(zip(self.labelnames, key)))} {value}"
+
+
+
+class Gauge(Counter):
+    def set(self, value : float, **labels) -> None:
+        key = tuple(labels[name] for name in self.labelnames)
+        self._values[key] = value
+
+
+    def dec(self, amount : float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} gauge"
+        for key, value in self._values.items():
+            yield f"{self.name}{_format_labels(dict(zip(self.labelnames, key)))} {value}"
+
+
+
+class CollectedCounter(Counter):
+    """
+    Монотонный счётчик, который ведёт другой модуль (пул бд, bcrypt, кеши):
+    collector переписывает значение при рендере, а наружу он отдаётся как counter
+    """
+    def set(self, value : float, **labels) -> None:
+        key = tuple(labels[name] for name in self.labelnames)
+        self._values[key] = value
+
+
+
+class Histogram:
+    def __init__(self, name : str, documentation : str, labelnames : tuple[str, ...] = (),
+                 buckets : tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        #ключ -> [счётчики по бакетам (+Inf последний), сумма, количество]
+        self._values : dict[tuple, list] = {}
+
+
+    def observe(self, value : float, **labels) -> None:
+        key = tuple(labels[name] for name in self.labelnames)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for key, (bucket_counts, total, count) in self._values.items():
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), bucket_counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket{_format_labels({**labels, 'le': bound})} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(labels)} {total}"
+            yield f"{self.name}_count{_format_labels(labels)} {count}"
+
+
+
+class MetricsRegistry:
+    """
+    In-process реестр метрик в текстовом формате Prometheus.
+    Collector'ы вызываются при каждом рендере и обновляют gauge'и и collected_counter'ы
+    из статистики других модулей (пул бд, bcrypt, кеши)
+    """
+    def __init__(self):
+        self._metrics : list[Counter | CollectedCounter | Gauge | Histogram] = []
+        self._collectors : list[Callable[[], None]] = []
+
+
+    def counter(self, name : str, documentation : str, labelnames : tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+
+    def collected_counter(self, name : str, documentation : str, labelnames : tuple[str, ...] = ()) -> CollectedCounter:
+        return self._register(CollectedCounter(name, documentation, labelnames))
+
+
+    def gauge(self, name : str, documentation : str, labelnames : tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+
+    def histogram(self, name : str, documentation : str, labelnames : tuple[str, ...] = (),
+                  buckets : tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+
+    def register_collector(self, collector : Callable[[], None]) -> None:
+        self._collectors.append(collector)
+
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            collector()
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+
+#создание обьекта
+registry = MetricsRegistry()
+
+HTTP_REQUESTS = registry.counter("http_requests_total", "HTTP запросы", ("method", "route", "status"))
+HTTP_LATENCY = registry.histogram("http_request_duration_seconds", "Длительность HTTP запросов", ("method", "route"))
+HTTP_IN_FLIGHT = registry.gauge("http_requests_in_flight", "Запросы в обработке")
+REDIS_LATENCY = registry.histogram(
+    "redis_command_duration_seconds", "Длительность команд Redis", ("command",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0, 2.5)
+)
+RATE_LIMITED = registry.counter("rate_limited_total", "Запросы, отклонённые ограничением частоты", ("limit", "backend"))
@@ -0,0 +1,183 @@
+import asyncio
+
+from bisect import bisect_left, insort
+
+from sqlalchemy import select
+
+from app.config import logger, NAME_INDEX_REFRESH
+from app.database import get_async_session_maker
+from app.models import CommandModel
+
+
+class TeamNameIndex:
+    """
+    In-process индекс названий команд для автодополнения и проверки занятости имени.
+    Отсортированный массив (casefold имя, id) активных команд ищется бинарным поиском,
+    занятость проверяется по всем командам, уникальность в бд не смотрит на статус.
+    Изменения этого воркера применяются сразу, чужих - при периодической перестройке
+    """
+    def __init__(self, refresh_interval : float):
+        self.refresh_interval = refresh_interval
+        self.ready = False
+        self._by_id : dict[int, tuple[str, bool]] = {} #id -> (имя, активна)
+        self._ids : dict[str, int] = {} #имя -> id
+        self._keys : list[tuple[str, int]] = [] #только активные, отсортированы
+        self._pending : list[tuple] | None = None #изменения, пришедшие во время перестройки
+        self._worker : asyncio.Task | None = None
+
+        #метрики
+        self.rebuilds = 0
+        self.lookups = 0
+
+
+    @staticmethod
+    def _fold(name : str) -> str:
+        return name.casefold()
+
+
+    def _insert(self, command_id : int, name : str, active : bool) -> None:
+        self._delete(command_id)
+        self._by_id[command_id] = (name, active)
+        self._ids[name] = command_id
+        if active:
+            insort(self._keys, (self._fold(name), command_id))
+
+
+    def _delete(self, command_id : int) -> None:
+        entry = self._by_id.pop(command_id, None)
+        if entry is None:
+            return
+        name, active = entry
+        self._ids.pop(name, None)
+        if active:
+            position = bisect_left(self._keys, (self._fold(name), command_id))
+            if position < len(self._keys) and self._keys[position][1] == command_id:
+                del self._keys[position]
+
+
+    def add(self, command_id : int, name : str, active : bool = True) -> None:
+        if self._pending is not None:
+            self._pending.append(("add", command_id, name, active))
+        self._insert(command_id, name, active)
+
+
+    def remove(self, *command_ids : int) -> None:
+        for command_id in command_ids:
+            if self._pending is not None:
+                self._pending.append(("remove", command_id))
+            self._delete(command_id)
+
+
+    def set_status(self, status : str, *command_ids : int) -> None:
+        for command_id in command_ids:
+            entry = self._by_id.get(command_id)
+            if entry is not None:
+                self.add(command_id, entry[0], status == "active")
+
+
+    def exists(self, name : str) -> bool:
+        self.lookups += 1
+        return name in self._ids
+
+
+    async def is_taken(self, name : str, db) -> bool:
+        """
+        Занято ли название, для создания команды. "Свободно" по индексу отвечается сразу, имя, занятое другим
+        воркером после перестройки, поймает unique в бд. "Занято" проверяется в бд:
+        команду могли удалить на другом воркере, тогда устаревшая запись убирается из индекса
+        """
+        if self.ready and not self.exists(name):
+            return False
+        taken = await db.scalar(select(CommandModel.id).where(CommandModel.name == name)) is not None
+        if not taken and name in self._ids:
+            self.remove(self._ids[name])
+        return taken
+
+
+    def suggest(self, prefix : str, limit : int) -> list[dict]:
+        """
+        Активные команды, чьё название начинается с prefix, без учёта регистра
+        """
+        self.lookups += 1
+        prefix = self._fold(prefix)
+        result = []
+        position = bisect_left(self._keys, (prefix,))
+        while position < len(self._keys) and len(result) < limit:
+            key, command_id = self._keys[position]
+            if not key.startswith(prefix):
+                break
+            result.append({"id": command_id, "name": self._by_id[command_id][0]})
+            position += 1
+        return result
+
+
+    async def rebuild(self) -> None:
+        """
+        Полная перестройка из бд. Новые структуры собираются в стороне,
+        изменения, случившиеся за время запроса, доигрываются поверх
+        """
+        self._pending = []
+        try:
+            async with get_async_session_maker()() as db:
+                rows = (await db.execute(
+                    select(CommandModel.id, CommandModel.name, CommandModel.status)
+                )).all()
+        except Exception:
+            self._pending = None
+            raise
+
+        by_id = {row.id: (row.name, row.status == "active") for row in rows}
+        self._by_id = by_id
+        self._ids = {name: command_id for command_id, (name, _) in by_id.items()}
+        self._keys = sorted((self._fold(name), command_id) for command_id, (name, active) in by_id.items() if active)
+
+        pending, self._pending = self._pending, None
+        for change in pending:
+            if change[0] == "add":
+                self._insert(*change[1:])
+            else:
+                self._delete(change[1])
+        self.ready = True
+        self.rebuilds += 1
+
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.rebuild()
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                if asyncio.current_task().cancelling(): #отмена во время запроса в бд приходит ошибкой закрытого соединения
+                    raise asyncio.CancelledError from ex
+                logger.bind(log_id="name-index").error(f"Не удалось перестроить индекс названий: {ex}")
+            await asyncio.sleep(self.refresh_interval)
+
+
+    def start(self) -> None:
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._by_id),
+            "active": len(self._keys),
+            "rebuilds": self.rebuilds,
+            "lookups": self.lookups,
+        }
+
+
+
+#создание обьекта
+name_index = TeamNameIndex(refresh_interval=NAME_INDEX_REFRESH)
@@ -0,0 +1,306 @@
+import asyncio
+import json
+
+import redis.asyncio as redis
+
+from collections.abc import Awaitable, Callable
+from datetime import timedelta
+from time import monotonic
+
+from redis.exceptions import ResponseError
+from sqlalchemy import select, update, delete, insert, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import (
+    logger, OUTBOX_STREAM, OUTBOX_STREAM_MAXLEN, OUTBOX_BATCH_SIZE,
+    OUTBOX_POLL_INTERVAL, OUTBOX_RETENTION_HOURS, OUTBOX_MAX_DELIVERIES
+)
+from app.database import get_async_session_maker
+from app.models import OutboxEventModel
+from app.services.json_response import dumps
+
+
+RELAY_LOCK_ID = 0x6F7574626F78 #pg advisory lock: публикует один релей за раз, пачки воркеров не пересекаются
+
+
+def outbox_event(event_type : str, aggregate_type : str, aggregate_id : int, **payload) -> dict:
+    return {
+        "event_type": event_type,
+        "aggregate_type": aggregate_type,
+        "aggregate_id": aggregate_id,
+        "payload": payload,
+    }
+
+
+async def add_events(db : AsyncSession, *events : dict) -> None:
+    """
+    Пишет события в outbox в текущей транзакции, одним INSERT на пачку.
+    Событие уйдёт в Redis только если изменение закоммитится
+    """
+    if events:
+        await db.execute(insert(OutboxEventModel), list(events))
+
+
+
+class OutboxRelay:
+    """
+    Переносит неотправленные события из outbox_events в Redis stream пачками.
+    Доставка at-least-once: если XADD прошёл, а коммит published_at нет,
+    пачка уйдёт ещё раз, потребители дедуплицируют по id события.
+    Порядок id в stream не порядок коммитов: id (BIGSERIAL) выдаётся при INSERT,
+    и транзакция с меньшим id может закоммититься и уйти в stream позже большего.
+    Поэтому дедупликация - по множеству обработанных id, а не по максимальному
+    увиденному id: событие с меньшим id может прийти после него
+    """
+    def __init__(self, stream : str, maxlen : int, batch_size : int, poll_interval : float, retention_hours : float):
+        self.stream = stream
+        self.maxlen = maxlen
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retention = timedelta(hours=retention_hours)
+        self._worker : asyncio.Task | None = None
+        self._cleaned_at = 0.0
+
+        #метрики
+        self.published = 0
+        self.batches = 0
+        self.errors = 0
+
+
+    async def relay_batch(self, r : redis.Redis) -> int:
+        """
+        Отправляет одну пачку, возвращает сколько событий ушло
+        """
+        async with get_async_session_maker()() as db:
+            #лок держится до конца транзакции, остальные воркеры в это время пропускают ход
+            if not await db.scalar(select(func.pg_try_advisory_xact_lock(RELAY_LOCK_ID))):
+                return 0
+
+            rows = (await db.execute(
+                select(
+                    OutboxEventModel.id,
+                    OutboxEventModel.event_type,
+                    OutboxEventModel.aggregate_type,
+                    OutboxEventModel.aggregate_id,
+                    OutboxEventModel.payload,
+                    OutboxEventModel.created_at,
+                )
+                .where(OutboxEventModel.published_at.is_(None))
+                .order_by(OutboxEventModel.id)
+                .limit(self.batch_size)
+            )).all()
+            if not rows:
+                return 0
+
+            async with r.pipeline(transaction=False) as pipe:
+                for row in rows:
+                    pipe.xadd(self.stream, {
+                        "id": row.id,
+                        "type": row.event_type,
+                        "aggregate_type": row.aggregate_type,
+                        "aggregate_id": row.aggregate_id,
+                        "payload": dumps(row.payload),
+                        "created_at": row.created_at.isoformat(),
+                    }, maxlen=self.maxlen, approximate=True)
+                await pipe.execute()
+
+            await db.execute(
+                update(OutboxEventModel)
+                .where(OutboxEventModel.id.in_([row.id for row in rows]))
+                .values(published_at=func.now())
+            )
+            await db.commit()
+
+        self.published += len(rows)
+        self.batches += 1
+        return len(rows)
+
+
+    async def cleanup(self) -> None:
+        """
+        Удаляет давно отправленные события, чтобы таблица не росла
+        """
+        async with get_async_session_maker()() as db:
+            await db.execute(
+                delete(OutboxEventModel)
+                .where(OutboxEventModel.published_at < func.now() - self.retention)
+            )
+            await db.commit()
+        self._cleaned_at = monotonic()
+
+
+    async def _run(self, r : redis.Redis) -> None:
+        while True:
+            try:
+                relayed = await self.relay_batch(r)
+                if monotonic() - self._cleaned_at > 600:
+                    await self.cleanup()
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                if asyncio.current_task().cancelling(): #отмена во время запроса в бд приходит ошибкой закрытого соединения
+                    raise asyncio.CancelledError from ex
+                self.errors += 1
+                logger.bind(log_id="outbox").error(f"Ошибка релея outbox: {ex}")
+                await asyncio.sleep(1)
+                continue
+            if relayed < self.batch_size: #очередь разобрана, ждём новых событий
+                await asyncio.sleep(self.poll_interval)
+
+
+    def start(self, r : redis.Redis) -> None:
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run(r))
+
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+
+    def stats(self) -> dict:
+        return {
+            "published": self.published,
+            "batches": self.batches,
+            "errors": self.errors,
+        }
+
+
+
+class OutboxConsumer:
+    """
+    Потребитель stream событий в consumer group: Redis хранит смещение группы
+    и список выданных, но не подтверждённых сообщений, поэтому после падения
+    потребитель продолжает с того же места, а зависшие сообщения забирает claim_stale.
+    Событие, которое не обработалось max_deliveries раз, уходит в {stream}:dead
+    и подтверждается, чтобы не забирать его по кругу
+    """
+    def __init__(self, r : redis.Redis, group : str, consumer : str, stream : str = OUTBOX_STREAM,
+                 max_deliveries : int = OUTBOX_MAX_DELIVERIES):
+        self.redis = r
+        self.group = group
+        self.consumer = consumer
+        self.stream = stream
+        self.dead_stream = f"{stream}:dead"
+        self.max_deliveries = max_deliveries
+
+        #метрики
+        self.dead_lettered = 0
+
+
+    async def ensure_group(self, start_id : str = "0") -> None:
+        """
+        Создаёт группу, "0" - читать stream с начала, "$" - только новые события
+        """
+        try:
+            await self.redis.xgroup_create(self.stream, self.group, id=start_id, mkstream=True)
+        except ResponseError as ex:
+            if "BUSYGROUP" not in str(ex): #группа уже есть
+                raise
+
+
+    @staticmethod
+    def _parse(message_id : str, fields : dict) -> dict:
+        return {
+            "message_id": message_id,
+            "id": int(fields["id"]),
+            "type": fields["type"],
+            "aggregate_type": fields["aggregate_type"],
+            "aggregate_id": int(fields["aggregate_id"]),
+            "payload": json.loads(fields["payload"]),
+            "created_at": fields["created_at"],
+        }
+
+
+    async def read(self, count : int = 100, block_ms : int = 5000) -> list[dict]:
+        response = await self.redis.xreadgroup(self.group, self.consumer, {self.stream: ">"}, count=count, block=block_ms)
+        return [self._parse(message_id, fields) for _, messages in response or [] for message_id, fields in messages]
+
+
+    async def ack(self, *message_ids : str) -> None:
+        if message_ids:
+            await self.redis.xack(self.stream, self.group, *message_ids)
+
+
+    async def claim_stale(self, min_idle_ms : int = 60_000, count : int = 100) -> list[dict]:
+        """
+        Забирает себе сообщения, которые другой потребитель взял и не подтвердил
+        """
+        _, messages, *_ = await self.redis.xautoclaim(self.stream, self.group, self.consumer, min_idle_ms, count=count)
+        return [self._parse(message_id, fields) for message_id, fields in messages if fields]
+
+
+    async def dead_letter_exhausted(self, events : list[dict]) -> list[dict]:
+        """
+        Переносит в dead stream события, доставленные больше max_deliveries раз,
+        возвращает остальные
+        """
+        if not events:
+            return events
+        pending = await self.redis.xpending_range(
+            self.stream, self.group, min=events[0]["message_id"], max=events[-1]["message_id"],
+            count=len(events), consumername=self.consumer,
+        )
+        deliveries = {entry["message_id"]: entry["times_delivered"] for entry in pending}
+        exhausted = [event for event in events if deliveries.get(event["message_id"], 0) > self.max_deliveries]
+        if not exhausted:
+            return events
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for event in exhausted:
+                pipe.xadd(self.dead_stream, {
+                    "message_id": event["message_id"],
+                    "group": self.group,
+                    "deliveries": deliveries[event["message_id"]],
+                    "id": event["id"],
+                    "type": event["type"],
+                    "aggregate_type": event["aggregate_type"],
+                    "aggregate_id": event["aggregate_id"],
+                    "payload": dumps(event["payload"]),
+                    "created_at": event["created_at"],
+                })
+            pipe.xack(self.stream, self.group, *(event["message_id"] for event in exhausted))
+            await pipe.execute()
+
+        self.dead_lettered += len(exhausted)
+        for event in exhausted:
+            logger.bind(log_id=f"outbox-{self.group}").error(
+                f"Событие {event['id']} не обработано за {self.max_deliveries} доставок, перенесено в {self.dead_stream}"
+            )
+        return [event for event in events if event not in exhausted]
+
+
+    async def run(self, handler : Callable[[dict], Awaitable[None]], count : int = 100, claim_idle_ms : int = 60_000) -> None:
+        """
+        Бесконечный цикл обработки: подтверждаются только успешно обработанные события,
+        остальные остаются в pending и позже будут забраны claim_stale,
+        исчерпавшие max_deliveries уходят в dead stream
+        """
+        await self.ensure_group()
+        while True:
+            stale = await self.claim_stale(min_idle_ms=claim_idle_ms, count=count)
+            events = await self.dead_letter_exhausted(stale) or await self.read(count=count)
+            processed = []
+            for event in events:
+                try:
+                    await handler(event)
+                    processed.append(event["message_id"])
+                except Exception as ex:
+                    logger.bind(log_id=f"outbox-{self.group}").error(f"Событие {event['id']} не обработано: {ex}")
+            await self.ack(*processed)
+
+
+
+#создание обьекта
+outbox_relay = OutboxRelay(
+    stream=OUTBOX_STREAM,
+    maxlen=OUTBOX_STREAM_MAXLEN,
+    batch_size=OUTBOX_BATCH_SIZE,
+    poll_interval=OUTBOX_POLL_INTERVAL,
+    retention_hours=OUTBOX_RETENTION_HOURS
+)
@@ -0,0 +1,141 @@
+import json
+
+import redis.asyncio as redis
+
+from datetime import datetime
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+
+from app.models import UserModel
+from app.services.cache import TTLCache
+from app.services.invalidation import invalidation_bus
+from app.config import logger, PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL, PRINCIPAL_REDIS_TTL
+
+
+#поля юзера которые кладём в кеш (хеш пароля туда не попадает)
+PRINCIPAL_FIELDS = (
+    "id", "username", "email", "role", "created_at", "updated_at",
+    "is_active", "is_team_creator", "command_id",
+)
+DATETIME_FIELDS = ("created_at", "updated_at")
+
+
+class PrincipalCache:
+    """
+    Двухуровневый кеш авторизованных юзеров:
+    in-process LRU с TTL + Redis. Ключ - id юзера из токена.
+    Сброс рассылается всем воркерам через invalidation_bus
+    """
+    def __init__(self, max_size : int, ttl : float, redis_ttl : int):
+        self.local = TTLCache(max_size=max_size, ttl=ttl)
+        self.redis_ttl = redis_ttl
+        invalidation_bus.register("principal", self._drop_local, self.local.clear)
+
+        #метрики второго уровня
+        self.redis_hits = 0
+        self.redis_misses = 0
+        self.redis_errors = 0
+
+
+    @staticmethod
+    def _key(user_id : int) -> str:
+        return f"principal:{user_id}"
+
+
+    @staticmethod
+    def _dump(user : UserModel) -> dict:
+        data = {field: getattr(user, field) for field in PRINCIPAL_FIELDS}
+        for field in DATETIME_FIELDS:
+            data[field] = data[field].isoformat()
+        return data
+
+
+    @staticmethod
+    def _load(data : dict) -> dict:
+        data = dict(data)
+        for field in DATETIME_FIELDS:
+            data[field] = datetime.fromisoformat(data[field])
+        return data
+
+
+    async def get(self, user_id : int, r : redis.Redis) -> dict | None:
+        data = self.local.get(user_id)
+        if data is not None:
+            return data
+
+        try:
+            raw = await r.get(self._key(user_id))
+        except Exception as ex:
+            self.redis_errors += 1
+            logger.bind(log_id="principal-cache").warning(f"Redis недоступен для кеша юзеров: {ex}")
+            return None
+
+        if raw is None:
+            self.redis_misses += 1
+            return None
+
+        self.redis_hits += 1
+        data = self._load(json.loads(raw))
+        self.local.set(user_id, data)
+        return data
+
+
+    async def set(self, user : UserModel, r : redis.Redis) -> None:
+        data = self._dump(user)
+        self.local.set(user.id, self._load(data))
+        try:
+            await r.set(self._key(user.id), json.dumps(data), ex=self.redis_ttl)
+        except Exception:
+            self.redis_errors += 1
+
+
+    async def invalidate(self, r : redis.Redis, *user_ids : int) -> None:
+        """
+        Сбрасывает кеш после смены роли, активности, команды или создателя команды
+        """
+        if not user_ids:
+            return
+        self._drop_local(user_ids)
+        try:
+            await r.delete(*(self._key(user_id) for user_id in user_ids))
+        except Exception:
+            self.redis_errors += 1
+        #остальные воркеры держат юзера в своём LRU до ttl, сбрасываем и у них
+        await invalidation_bus.publish(r, "principal", *user_ids)
+
+
+    def _drop_local(self, user_ids) -> None:
+        for user_id in user_ids:
+            self.local.delete(user_id)
+
+
+    @staticmethod
+    async def attach(data : dict, db : AsyncSession) -> UserModel:
+        """
+        Собирает UserModel из кеша и привязывает к сессии без запроса в бд,
+        чтобы роутеры могли менять и коммитить юзера как обычно
+        """
+        user = UserModel(**data)
+        make_transient_to_detached(user)
+        return await db.merge(user, load=False)
+
+
+    def stats(self) -> dict:
+        local = self.local.stats()
+        return {
+            "local_size": local["size"],
+            "local_hits": local["hits"],
+            "local_misses": local["misses"],
+            "redis_hits": self.redis_hits,
+            "redis_misses": self.redis_misses,
+            "redis_errors": self.redis_errors,
+        }
+
+
+
+#создание обьекта
+principal_cache = PrincipalCache(
+    max_size=PRINCIPAL_CACHE_SIZE,
+    ttl=PRINCIPAL_CACHE_TTL,
+    redis_ttl=PRINCIPAL_REDIS_TTL
+)
@@ -0,0 +1,130 @@
+import math
+import os
+
+import redis.asyncio as redis
+
+from collections import deque
+from time import monotonic
+
+from fastapi import Depends, HTTPException, Request, status
+
+from app.config import (
+    logger, RATE_LIMIT_ENABLED, RATE_LIMIT_FALLBACK_SIZE,
+    RATE_LIMIT_LOGIN_IP, RATE_LIMIT_LOGIN_EMAIL, RATE_LIMIT_REGISTER_IP,
+    RATE_LIMIT_VERIFY_IP, RATE_LIMIT_RESEND_IP, RATE_LIMIT_RESEND_EMAIL
+)
+from app.services.cache import TTLCache
+from app.services.metrics import RATE_LIMITED
+from app.services.redis_scripts import lua_script
+from app.services.redis_client import get_redis
+
+
+#скользящее окно на sorted set: чистим старые отметки, считаем, добавляем - один round-trip.
+#время берётся у Redis, чтобы окна всех воркеров совпадали
+SLIDING_WINDOW = lua_script("""
+local now = redis.call('TIME')
+local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local window = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, now_ms - window)
+if redis.call('ZCARD', KEYS[1]) < limit then
+    redis.call('ZADD', KEYS[1], now_ms, now_ms .. '-' .. ARGV[3])
+    redis.call('PEXPIRE', KEYS[1], window)
+    return 0
+end
+local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+return tonumber(oldest[2]) + window - now_ms
+""")
+
+
+def parse_rate(rate : str) -> tuple[int, float]:
+    """
+    "10/60" -> 10 запросов за 60 секунд
+    """
+    limit, window = rate.split("/")
+    return int(limit), float(window)
+
+
+
+class RateLimiter:
+    """
+    Ограничение частоты по скользящему окну в Redis.
+    Если Redis недоступен - такое же окно в памяти воркера (лимит тогда на воркер, а не общий).
+    Экземпляр сам по себе зависимость FastAPI с ключом по IP,
+    check() - для ключей из тела запроса (email)
+    """
+    PREFIX = "ratelimit:"
+
+    def __init__(self, name : str, rate : str, enabled : bool = RATE_LIMIT_ENABLED):
+        self.name = name
+        self.limit, self.window = parse_rate(rate)
+        self.enabled = enabled
+        self._fallback = TTLCache(max_size=RATE_LIMIT_FALLBACK_SIZE, ttl=self.window)
+
+        #метрики
+        self.redis_errors = 0
+
+
+    def _hit_local(self, identity : str) -> float:
+        now = monotonic()
+        hits = self._fallback.get(identity)
+        if hits is None:
+            hits = deque()
+        while hits and hits[0] <= now - self.window:
+            hits.popleft()
+        if len(hits) >= self.limit:
+            return hits[0] + self.window - now
+        hits.append(now)
+        self._fallback.set(identity, hits)
+        return 0.0
+
+
+    async def hit(self, r : redis.Redis, identity : str) -> float:
+        """
+        Засчитывает запрос, возвращает через сколько секунд можно повторить (0 - можно сейчас)
+        """
+        try:
+            retry_after_ms = await SLIDING_WINDOW(
+                keys=[f"{self.PREFIX}{self.name}:{identity}"],
+                args=[int(self.window * 1000), self.limit, os.urandom(4).hex()],
+                client=r,
+            )
+            retry_after, backend = int(retry_after_ms) / 1000, "redis"
+        except Exception as ex:
+            self.redis_errors += 1
+            if self.redis_errors == 1 or self.redis_errors % 1000 == 0:
+                logger.bind(log_id="rate-limit").warning(f"Redis недоступен, лимит {self.name} считается в памяти: {ex}")
+            retry_after, backend = self._hit_local(identity), "memory"
+
+        if retry_after > 0:
+            RATE_LIMITED.inc(limit=self.name, backend=backend)
+        return retry_after
+
+
+    async def check(self, r : redis.Redis, identity : str) -> None:
+        """
+        429 с Retry-After, если лимит исчерпан
+        """
+        if not self.enabled:
+            return
+        retry_after = await self.hit(r, identity.casefold())
+        if retry_after > 0:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Слишком много запросов, попробуйте позже",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+            )
+
+
+    async def __call__(self, request : Request, redis_client = Depends(get_redis)) -> None:
+        await self.check(redis_client, request.client.host if request.client else "unknown")
+
+
+
+#создание обьектов, лимиты настраиваются в config
+login_ip_limit = RateLimiter("login_ip", RATE_LIMIT_LOGIN_IP)
+login_email_limit = RateLimiter("login_email", RATE_LIMIT_LOGIN_EMAIL)
+register_ip_limit = RateLimiter("register_ip", RATE_LIMIT_REGISTER_IP)
+verify_ip_limit = RateLimiter("verify_ip", RATE_LIMIT_VERIFY_IP)
+resend_ip_limit = RateLimiter("resend_ip", RATE_LIMIT_RESEND_IP)
+resend_email_limit = RateLimiter("resend_email", RATE_LIMIT_RESEND_EMAIL)
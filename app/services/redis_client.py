@@ -7,9 +7,57 @@ from dotenv import load_dotenv
 from os import getenv
 import asyncio
 
+from app.validation.hash_password import hash_pool
+from app.services.mail_queue import MailQueue, JobMailQueue, RedisMailBackend, MemoryMailBackend
+from app.config import MAIL_QUEUE_BACKEND, setup_logging
+from app.database import get_async_engine, dispose_engines
+from app.services.metrics import REDIS_LATENCY
+from app.services.name_index import name_index
+from app.services.email_filter import email_filter
+from app.services.roster_events import roster_events
+from app.services.outbox import outbox_relay
+from app.services.invalidation import invalidation_bus
+
+from time import perf_counter
+
 load_dotenv()
 
 
+#блокирующие команды ждут данных, а не Redis, их длительность не латентность
+BLOCKING_COMMANDS = {"BLPOP", "BRPOP", "BLMOVE", "BRPOPLPUSH", "BZPOPMIN", "BZPOPMAX"}
+
+
+class InstrumentedRedis(redis.Redis):
+    """
+    Redis клиент, который пишет длительность каждой команды в метрики
+    (кроме блокирующих чтений очередей и стримов)
+    """
+    async def execute_command(self, *args, **options):
+        command = str(args[0]).upper()
+        if command in BLOCKING_COMMANDS or (command in ("XREAD", "XREADGROUP") and "BLOCK" in args):
+            return await super().execute_command(*args, **options)
+        started = perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            REDIS_LATENCY.observe(perf_counter() - started, command=command)
+
+
+    def pipeline(self, *args, **kwargs):
+        pipe = super().pipeline(*args, **kwargs)
+        execute = pipe.execute
+
+        async def timed_execute(*execute_args, **execute_kwargs):
+            started = perf_counter()
+            try:
+                return await execute(*execute_args, **execute_kwargs)
+            finally:
+                REDIS_LATENCY.observe(perf_counter() - started, command="PIPELINE")
+
+        pipe.execute = timed_execute
+        return pipe
+
+
 async def get_redis(request: Request) -> redis.Redis:
     """
     Получает Redis-подключение из app.state.
@@ -21,9 +69,11 @@ async def get_redis(request: Request) -> redis.Redis:
 @asynccontextmanager
 async def lifespan(app : FastAPI):
     print("🚀 Приложение запускается...")
+    setup_logging()
+    get_async_engine()
 
     # Создаём подключение 1 раз при старте
-    app.state.redis_client = redis.from_url(
+    app.state.redis_client = InstrumentedRedis.from_url(
         getenv("REDIS_URL"),
         decode_responses=True
     )
@@ -46,9 +96,41 @@ async def lifespan(app : FastAPI):
                 print(f"❌ Не удалось подключиться к Redis после {max_retries} попыток")
                 print("⚠️ Приложение запускается без подключения к Redis!")
 
+    # Очередь писем и её воркер
+    if MAIL_QUEUE_BACKEND == "jobs":
+        app.state.mail_queue = JobMailQueue(app.state.redis_client)
+    elif MAIL_QUEUE_BACKEND == "memory":
+        app.state.mail_queue = MailQueue(MemoryMailBackend())
+    else:
+        app.state.mail_queue = MailQueue(RedisMailBackend(app.state.redis_client))
+    app.state.mail_queue.start()
+
+    # Сбросы in-process кешей от других воркеров
+    invalidation_bus.start(app.state.redis_client)
+
+    # Индекс названий команд для автодополнения, первая загрузка идёт в фоне
+    name_index.start()
+
+    # Фильтр email для логина, собирается из бд один раз на весь кластер
+    email_filter.start(app.state.redis_client)
+
+    # Один подписчик на события состава команд на воркер
+    roster_events.start(app.state.redis_client)
+
+    # Релей outbox -> Redis stream
+    outbox_relay.start(app.state.redis_client)
+
     yield
 
     print("🛑 Приложение останавливается...")
+    await app.state.mail_queue.stop()
+    await invalidation_bus.stop()
+    await name_index.stop()
+    await email_filter.stop()
+    await roster_events.stop()
+    await outbox_relay.stop()
+    await dispose_engines()
+    hash_pool.shutdown()
     try:
         await app.state.redis_client.close()
         print("✅ Redis соединение закрыто")
@@ -0,0 +1,12 @@
+from redis.commands.core import AsyncScript
+
+
+def lua_script(source : str) -> AsyncScript:
+    """
+    Lua-скрипт, который создаётся один раз при импорте модуля, а не на каждый вызов:
+    sha считается сразу, клиент передаётся при вызове - await script(keys=..., args=..., client=r).
+    Redis без скрипта в кеше (рестарт, другой узел) отвечает NOSCRIPT, тогда скрипт загружается заново.
+    Все ключи, которые трогает скрипт, должны быть в keys - иначе Redis Cluster не сможет его маршрутизировать
+    """
+    #исходник в байтах, чтобы не нужен был encoder клиента при создании
+    return AsyncScript(None, source.encode())
@@ -0,0 +1,120 @@
+import redis.asyncio as redis
+
+from time import monotonic, time
+
+from app.services.bloom import BloomFilter
+from app.services.invalidation import invalidation_bus
+from app.config import REVOCATION_BLOOM_ENABLED, REVOCATION_BLOOM_SIZE, REVOCATION_BLOOM_HASHES, REVOCATION_BLOOM_REFRESH
+
+
+class RevocationStore:
+    """
+    Отозванные refresh токены по короткому jti вместо полного JWT в ключе:
+    revoked:{jti} живёт ровно до exp токена, revoked:index (zset jti -> exp)
+    нужен чтобы пересобирать фильтр Блума.
+    Фильтр Блума опционален: отозванные jti рассылаются всем воркерам через
+    invalidation_bus и сразу попадают в их фильтры, а раз в REVOCATION_BLOOM_REFRESH
+    секунд фильтр пересобирается из индекса, чтобы выбросить истёкшие.
+    Пока фильтр не собран или подписка на рассылку оборвалась, проверка идёт в Redis
+    """
+    KEY_PREFIX = "revoked:"
+    INDEX_KEY = "revoked:index"
+    LEGACY_PREFIX = "blacklist:" #токены выданные до появления jti
+
+    def __init__(self, bloom_enabled : bool, bloom_size : int, bloom_hashes : int, bloom_refresh : float):
+        self.bloom = BloomFilter(bloom_size, bloom_hashes) if bloom_enabled else None
+        self.bloom_refresh = bloom_refresh
+        self._bloom_built_at : float | None = None
+        self._received_during_refresh : list[str] | None = None
+        if self.bloom is not None:
+            invalidation_bus.register("revocation", self._add_local, self._mark_stale)
+
+        #метрики
+        self.bloom_skips = 0 #проверок, закрытых фильтром без Redis
+        self.redis_checks = 0
+
+
+    async def revoke_many(self, r : redis.Redis, tokens : list[dict]) -> None:
+        """
+        Отзывает пачку токенов одним pipeline
+        tokens: payload'ы с jti и exp (или legacy с полным токеном в "token")
+        """
+        now = time()
+        async with r.pipeline(transaction=False) as pipe:
+            for token in tokens:
+                ttl = max(int(token["exp"] - now), 1)
+                if token.get("jti"):
+                    pipe.set(f"{self.KEY_PREFIX}{token['jti']}", 1, ex=ttl)
+                    pipe.zadd(self.INDEX_KEY, {token["jti"]: token["exp"]})
+                else:
+                    pipe.set(f"{self.LEGACY_PREFIX}{token['token']}", "revoked", ex=ttl)
+            pipe.zremrangebyscore(self.INDEX_KEY, 0, now) #чистим индекс от истёкших
+            await pipe.execute()
+
+        if self.bloom is not None:
+            jtis = [token["jti"] for token in tokens if token.get("jti")]
+            self._add_local(jtis)
+            await invalidation_bus.publish(r, "revocation", *jtis)
+
+
+    def _add_local(self, jtis : list[str]) -> None:
+        for jti in jtis:
+            self.bloom.add(jti)
+        if self._received_during_refresh is not None:
+            self._received_during_refresh.extend(jtis)
+
+
+    def _mark_stale(self) -> None:
+        #отзывы, разосланные пока подписки не было, есть только в индексе
+        self._bloom_built_at = None
+
+
+    async def _refresh_bloom(self, r : redis.Redis) -> None:
+        if self._received_during_refresh is not None: #уже пересобирается другим запросом
+            return
+        self._received_during_refresh = []
+        try:
+            jtis = await r.zrangebyscore(self.INDEX_KEY, time(), "+inf")
+            #новый фильтр собирается целиком и подменяет старый, отзывы пришедшие
+            #во время чтения индекса могли в него не попасть, добавляем их отдельно
+            bloom = BloomFilter(self.bloom.size_bits, self.bloom.hashes)
+            for jti in (*jtis, *self._received_during_refresh):
+                bloom.add(jti)
+            self.bloom = bloom
+            self._bloom_built_at = monotonic()
+        finally:
+            self._received_during_refresh = None
+
+
+    async def is_revoked(self, r : redis.Redis, jti : str | None, raw_token : str) -> bool:
+        if jti is None:
+            self.redis_checks += 1
+            return await r.get(f"{self.LEGACY_PREFIX}{raw_token}") is not None
+
+        if self.bloom is not None:
+            if self._bloom_built_at is None or monotonic() - self._bloom_built_at > self.bloom_refresh:
+                await self._refresh_bloom(r)
+            if self._bloom_built_at is not None and jti not in self.bloom:
+                self.bloom_skips += 1
+                return False
+
+        self.redis_checks += 1
+        return await r.exists(f"{self.KEY_PREFIX}{jti}") > 0
+
+
+    def stats(self) -> dict:
+        return {
+            "bloom_enabled": self.bloom is not None,
+            "bloom_skips": self.bloom_skips,
+            "redis_checks": self.redis_checks,
+        }
+
+
+
+#создание обьекта
+revocation_store = RevocationStore(
+    bloom_enabled=REVOCATION_BLOOM_ENABLED,
+    bloom_size=REVOCATION_BLOOM_SIZE,
+    bloom_hashes=REVOCATION_BLOOM_HASHES,
+    bloom_refresh=REVOCATION_BLOOM_REFRESH
+)
@@ -0,0 +1,167 @@
+import redis.asyncio as redis
+
+from hashlib import blake2b
+
+from app.services.cache import TTLCache
+from app.services.compression import CompressedBody
+from app.services.redis_scripts import lua_script
+from app.config import ROSTER_CACHE_SIZE, ROSTER_CACHE_TTL, ROSTER_REDIS_TTL
+
+
+#тело кладётся, только если состав не сбрасывали с момента, как взяли версию перед запросом в бд
+SET_IF_VERSION = lua_script("""
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[2] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+return 1
+""")
+
+
+class RosterCache:
+    """
+    Кеш готовых json ответов GET /commands/{command_id}: in-process LRU поверх Redis.
+    Рядом с телом хранится ETag, чтобы отвечать 304 без сериализации и запроса в бд,
+    и сжатые варианты тела, чтобы не сжимать его на каждый запрос.
+    У каждой команды есть версия, которую увеличивает invalidate: версия берётся до
+    запроса в бд, и ответ, прочитанный до сброса, в кеш уже не попадёт
+    """
+    VERSION_TTL = 3600 #секунды, заведомо дольше любого запроса в бд
+
+    def __init__(self, max_size : int, ttl : float, redis_ttl : int):
+        self.local = TTLCache(max_size=max_size, ttl=ttl)
+        self.redis_ttl = redis_ttl
+
+        #метрики
+        self.redis_hits = 0
+        self.redis_misses = 0
+        self.redis_errors = 0
+        self.not_modified = 0
+
+
+    @staticmethod
+    def _key(command_id : int) -> str:
+        return f"roster:{{{command_id}}}"
+
+
+    @staticmethod
+    def _version_key(command_id : int) -> str:
+        return f"roster:{{{command_id}}}:version" #тот же hash tag, что у тела, один слот для скрипта
+
+
+    @staticmethod
+    def make_etag(body : bytes) -> str:
+        return '"' + blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+    async def get(self, command_id : int, r : redis.Redis) -> tuple[str, CompressedBody] | None:
+        """
+        Возвращает (etag, тело) или None
+        """
+        entry = self.local.get(command_id)
+        if entry is not None:
+            return entry
+
+        try:
+            body = await r.get(self._key(command_id))
+        except Exception:
+            self.redis_errors += 1
+            return None
+        if body is None:
+            self.redis_misses += 1
+            return None
+
+        self.redis_hits += 1
+        body = body.encode()
+        entry = (self.make_etag(body), CompressedBody(body))
+        self.local.set(command_id, entry)
+        return entry
+
+
+    async def version(self, command_id : int, r : redis.Redis) -> str | None:
+        """
+        Версия состава, берётся до запроса в бд и передаётся в set.
+        None - Redis недоступен, ответ не кешируется
+        """
+        try:
+            return await r.get(self._version_key(command_id)) or "0"
+        except Exception:
+            self.redis_errors += 1
+            return None
+
+
+    async def set(self, command_id : int, body : bytes, r : redis.Redis, version : str | None) -> tuple[str, CompressedBody]:
+        """
+        Кеширует тело, если с момента version состав не сбрасывали, и в любом случае возвращает (etag, тело)
+        """
+        entry = (self.make_etag(body), CompressedBody(body))
+        if version is None:
+            return entry
+        try:
+            stored = await SET_IF_VERSION(
+                keys=[self._key(command_id), self._version_key(command_id)],
+                args=[body, version, self.redis_ttl],
+                client=r,
+            )
+        except Exception:
+            self.redis_errors += 1
+            return entry
+        if stored:
+            self.local.set(command_id, entry)
+        return entry
+
+
+    async def invalidate(self, r : redis.Redis, *command_ids : int | None) -> None:
+        """
+        Сбрасывает состав команд после вступления, удаления команды или игрока и смены роли
+        """
+        command_ids = [command_id for command_id in command_ids if command_id is not None]
+        if not command_ids:
+            return
+        for command_id in command_ids:
+            self.local.delete(command_id)
+        try:
+            async with r.pipeline(transaction=False) as pipe:
+                for command_id in command_ids:
+                    pipe.incr(self._version_key(command_id))
+                    pipe.expire(self._version_key(command_id), self.VERSION_TTL)
+                    pipe.delete(self._key(command_id))
+                await pipe.execute()
+        except Exception:
+            self.redis_errors += 1
+
+
+    @staticmethod
+    def matches(if_none_match : str | None, etag : str) -> bool:
+        """
+        Проверка заголовка If-None-Match, в том числе списка и слабых W/ тегов
+        """
+        if not if_none_match:
+            return False
+        for candidate in if_none_match.split(","):
+            candidate = candidate.strip()
+            if candidate == "*" or candidate.removeprefix("W/") == etag:
+                return True
+        return False
+
+
+    def stats(self) -> dict:
+        local = self.local.stats()
+        return {
+            "local_size": local["size"],
+            "local_hits": local["hits"],
+            "local_misses": local["misses"],
+            "redis_hits": self.redis_hits,
+            "redis_misses": self.redis_misses,
+            "redis_errors": self.redis_errors,
+            "not_modified": self.not_modified,
+        }
+
+
+
+#создание обьекта
+roster_cache = RosterCache(
+    max_size=ROSTER_CACHE_SIZE,
+    ttl=ROSTER_CACHE_TTL,
+    redis_ttl=ROSTER_REDIS_TTL
+)
@@ -0,0 +1,190 @@
+import asyncio
+
+import orjson
+import redis.asyncio as redis
+
+from collections.abc import AsyncIterator
+
+from app.config import logger, ROSTER_STREAM_BUFFER, ROSTER_STREAM_HEARTBEAT, ROSTER_STREAM_MAX_SUBSCRIBERS
+from app.services.json_response import dumps
+
+
+class Subscription:
+    """
+    Один SSE клиент: ограниченная очередь готовых кадров.
+    Если клиент не успевает читать и очередь переполнилась - он отключается
+    """
+    __slots__ = ("command_id", "queue", "dropped")
+
+    def __init__(self, command_id : int | None, buffer : int):
+        self.command_id = command_id
+        self.queue : asyncio.Queue[bytes | None] = asyncio.Queue(maxsize=buffer)
+        self.dropped = False
+
+
+    def push(self, frame : bytes) -> bool:
+        """
+        False - очередь переполнилась и клиент только что отключён
+        """
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            self.dropped = True
+            #выбрасываем непрочитанное и будим читателя, чтобы он закрыл поток
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+            return False
+
+
+
+class RosterEvents:
+    """
+    События состава команд через Redis pub/sub.
+    Роутеры публикуют в один канал, в каждом воркере один подписчик на Redis
+    раздаёт кадр всем локальным SSE клиентам, кадр собирается 1 раз на событие
+    """
+    CHANNEL = "commands:roster"
+
+    def __init__(self, buffer : int, heartbeat : float, max_subscribers : int):
+        self.buffer = buffer
+        self.heartbeat = heartbeat
+        self.max_subscribers = max_subscribers
+        self._subscribers : dict[int | None, set[Subscription]] = {} #None - подписка на все команды
+        self._count = 0
+        self._worker : asyncio.Task | None = None
+
+        #метрики
+        self.received = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.publish_errors = 0
+
+
+    async def publish(self, r : redis.Redis, *events : dict) -> None:
+        """
+        Публикует события, ошибки Redis не ломают запрос, который их вызвал
+        """
+        if not events:
+            return
+        try:
+            if len(events) == 1:
+                await r.publish(self.CHANNEL, dumps(events[0]))
+                return
+            async with r.pipeline(transaction=False) as pipe:
+                for event in events:
+                    pipe.publish(self.CHANNEL, dumps(event))
+                await pipe.execute()
+        except Exception as ex:
+            self.publish_errors += 1
+            logger.bind(log_id="roster-events").warning(f"Не удалось опубликовать событие состава: {ex}")
+
+
+    def _fanout(self, data : str) -> None:
+        try:
+            event = orjson.loads(data)
+        except orjson.JSONDecodeError:
+            return
+        self.received += 1
+        frame = f"event: roster\ndata: {data}\n\n".encode()
+        for subscription in (*self._subscribers.get(event.get("command_id"), ()), *self._subscribers.get(None, ())):
+            if subscription.dropped:
+                continue
+            if subscription.push(frame):
+                self.delivered += 1
+            else:
+                self.dropped += 1
+
+
+    async def _run(self, r : redis.Redis) -> None:
+        while True:
+            pubsub = r.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self._fanout(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                logger.bind(log_id="roster-events").error(f"Подписка на события состава оборвалась: {ex}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+
+    def start(self, r : redis.Redis) -> None:
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run(r))
+
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+
+    def has_capacity(self) -> bool:
+        return self._count < self.max_subscribers
+
+
+    def _subscribe(self, command_id : int | None) -> Subscription:
+        subscription = Subscription(command_id, self.buffer)
+        self._subscribers.setdefault(command_id, set()).add(subscription)
+        self._count += 1
+        return subscription
+
+
+    def _unsubscribe(self, subscription : Subscription) -> None:
+        subscribers = self._subscribers.get(subscription.command_id)
+        if subscribers is not None and subscription in subscribers:
+            subscribers.discard(subscription)
+            self._count -= 1
+            if not subscribers:
+                del self._subscribers[subscription.command_id]
+
+
+    async def stream(self, command_id : int | None) -> AsyncIterator[bytes]:
+        """
+        Тело SSE ответа. Подписка создаётся при первом чтении,
+        поэтому отписка в finally срабатывает всегда
+        """
+        subscription = self._subscribe(command_id)
+        try:
+            yield b"retry: 3000\n\n" #через сколько мс клиенту переподключаться
+            while True:
+                try:
+                    frame = await asyncio.wait_for(subscription.queue.get(), timeout=self.heartbeat)
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n" #держим соединение через прокси
+                    continue
+                if frame is None: #медленный клиент, пусть переподключится и перечитает состав
+                    yield b"event: dropped\ndata: {}\n\n"
+                    return
+                yield frame
+        finally:
+            self._unsubscribe(subscription)
+
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": self._count,
+            "received": self.received,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "publish_errors": self.publish_errors,
+        }
+
+
+
+#создание обьекта
+roster_events = RosterEvents(
+    buffer=ROSTER_STREAM_BUFFER,
+    heartbeat=ROSTER_STREAM_HEARTBEAT,
+    max_subscribers=ROSTER_STREAM_MAX_SUBSCRIBERS
+)
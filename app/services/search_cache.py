@@ -0,0 +1,146 @@
+import json
+
+import redis.asyncio as redis
+
+from hashlib import sha1
+from time import monotonic
+
+from app.services.cache import TTLCache
+from app.services.compression import CompressedBody
+from app.config import logger, SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL, SEARCH_REDIS_TTL, SEARCH_GENERATION_TTL
+
+
+class SearchCache:
+    """
+    Кеш результатов GET /commands/: in-process LRU поверх Redis.
+    Ключ содержит номер поколения таблицы команд, любое изменение команд
+    увеличивает поколение и старые записи просто перестают читаться.
+    Локально рядом с телом хранятся его сжатые варианты.
+    """
+    GENERATION_KEY = "commands:generation"
+
+    def __init__(self, max_size : int, ttl : float, redis_ttl : int, generation_ttl : float):
+        self.local = TTLCache(max_size=max_size, ttl=ttl)
+        self.redis_ttl = redis_ttl
+        self.generation_ttl = generation_ttl
+        self._generation = 0
+        self._generation_checked_at = 0.0 #когда последний раз сверялись с Redis
+
+        #метрики
+        self.redis_hits = 0
+        self.redis_misses = 0
+        self.redis_errors = 0
+        self.saved_db_seconds = 0.0 #сколько времени бд сэкономили попадания
+
+
+    @staticmethod
+    def normalize(search_name : str | None, status : str | None, is_filled : bool | None, cursor : str | None,
+                  include_users : bool = True) -> tuple:
+        """
+        Приводит параметры поиска к единому виду,
+        чтобы "Navi ", "navi" и "NAVI" попадали в одну запись
+        """
+        if search_name is not None:
+            search_name = " ".join(search_name.split()).casefold() or None
+        return (search_name, status, is_filled, cursor, include_users)
+
+
+    async def _get_generation(self, r : redis.Redis) -> int:
+        if monotonic() - self._generation_checked_at < self.generation_ttl:
+            return self._generation
+        generation = await r.get(self.GENERATION_KEY)
+        self._generation = int(generation or 0)
+        self._generation_checked_at = monotonic()
+        return self._generation
+
+
+    async def key(self, params : tuple, r : redis.Redis) -> str | None:
+        """
+        Ключ записи с текущим поколением. Берётся до запроса в бд и передаётся в set:
+        если во время запроса команды изменились, ответ ляжет под старое поколение,
+        которое уже никто не читает. None - Redis недоступен, кеш пропускается
+        """
+        try:
+            generation = await self._get_generation(r)
+        except Exception:
+            self.redis_errors += 1
+            return None
+        digest = sha1(json.dumps(params).encode()).hexdigest()
+        return f"search:{generation}:{digest}"
+
+
+    async def get(self, key : str | None, r : redis.Redis) -> CompressedBody | None:
+        """
+        Возвращает сохранённый json ответа или None
+        """
+        if key is None:
+            return None
+
+        entry = self.local.get(key)
+        if entry is None:
+            try:
+                raw = await r.get(key)
+            except Exception:
+                self.redis_errors += 1
+                return None
+            if raw is None:
+                self.redis_misses += 1
+                return None
+            self.redis_hits += 1
+            entry = json.loads(raw)
+            entry["body"] = CompressedBody(entry["body"].encode())
+            self.local.set(key, entry)
+
+        self.saved_db_seconds += entry["db_seconds"]
+        return entry["body"]
+
+
+    async def set(self, key : str | None, body : bytes, db_seconds : float, r : redis.Redis) -> CompressedBody:
+        compressed_body = CompressedBody(body)
+        if key is None:
+            return compressed_body
+        try:
+            self.local.set(key, {"body": compressed_body, "db_seconds": db_seconds})
+            await r.set(key, json.dumps({"body": body.decode(), "db_seconds": db_seconds}), ex=self.redis_ttl)
+        except Exception:
+            self.redis_errors += 1
+        return compressed_body
+
+
+    async def bump_generation(self, r : redis.Redis) -> None:
+        """
+        Инвалидирует весь кеш поиска после изменения команд или их состава
+        """
+        self.local.clear()
+        try:
+            self._generation = await r.incr(self.GENERATION_KEY)
+            self._generation_checked_at = monotonic()
+        except Exception as ex:
+            self.redis_errors += 1
+            logger.bind(log_id="search-cache").warning(f"Не удалось сбросить кеш поиска: {ex}")
+
+
+    def stats(self) -> dict:
+        local = self.local.stats()
+        hits = local["hits"] + self.redis_hits
+        lookups = hits + self.redis_misses
+        return {
+            "generation": self._generation,
+            "local_size": local["size"],
+            "local_hits": local["hits"],
+            "redis_hits": self.redis_hits,
+            "redis_misses": self.redis_misses,
+            "redis_errors": self.redis_errors,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "saved_db_seconds": self.saved_db_seconds,
+        }
+
+
+
+#создание обьекта
+search_cache = SearchCache(
+    max_size=SEARCH_CACHE_SIZE,
+    ttl=SEARCH_CACHE_TTL,
+    redis_ttl=SEARCH_REDIS_TTL,
+    generation_ttl=SEARCH_GENERATION_TTL
+)
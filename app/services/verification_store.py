@@ -0,0 +1,94 @@
+import redis.asyncio as redis
+
+from app.services.redis_scripts import lua_script
+
+
+#замена кода: новый код, ссылка email -> код через SET ... GET и удаление старого кода за один round-trip.
+#каждый старый код достаётся ровно тому, кто его заменил
+ROTATE = lua_script("""
+redis.call('HSET', KEYS[1], 'code', ARGV[1], 'user_id', ARGV[2], 'email', ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+local old = redis.call('SET', KEYS[2], ARGV[1], 'EX', ARGV[4], 'GET')
+if old and old ~= ARGV[1] then
+    redis.call('DEL', ARGV[5] .. old)
+end
+return old
+""")
+
+#погашение: читаем код и удаляем его вместе со ссылкой email -> код,
+#если ссылка всё ещё ведёт на этот код. Повторно тот же код использовать нельзя
+CONSUME = lua_script("""
+local data = redis.call('HGETALL', KEYS[1])
+if #data == 0 then
+    return data
+end
+redis.call('DEL', KEYS[1])
+for i = 1, #data, 2 do
+    if data[i] == 'email' then
+        local pointer = ARGV[1] .. data[i + 1]
+        if redis.call('GET', pointer) == ARGV[2] then
+            redis.call('DEL', pointer)
+        end
+    end
+end
+return data
+""")
+
+
+class VerificationStore:
+    """
+    Коды подтверждения почты в Redis:
+    verification:{code} - hash с кодом, user_id и email,
+    verification:email:{email} - код по email, чтобы не перебирать ключи.
+    Каждая операция - один round-trip. Скрипты трогают ключ, имя которого узнают
+    только внутри (старый код, ссылка по email), это работает на одиночном Redis из REDIS_URL,
+    но не в Redis Cluster
+    """
+    CODE_PREFIX = "verification:"
+    EMAIL_PREFIX = "verification:email:"
+
+    def __init__(self, ttl : int = 600):
+        self.ttl = ttl
+
+
+    async def create(self, r : redis.Redis, code : str, user_id : int, email : str) -> str | None:
+        """
+        Сохраняет код и ставит на него ссылку по email, возвращает код, на который ссылка вела раньше
+        """
+        async with r.pipeline(transaction=False) as pipe:
+            pipe.hset(f"{self.CODE_PREFIX}{code}", mapping={
+                "code": code,
+                "user_id": str(user_id),
+                "email": email
+            })
+            pipe.expire(f"{self.CODE_PREFIX}{code}", self.ttl)
+            pipe.set(f"{self.EMAIL_PREFIX}{email}", code, ex=self.ttl, get=True)
+            *_, old_code = await pipe.execute()
+        return old_code
+
+
+    async def rotate(self, r : redis.Redis, code : str, user_id : int, email : str) -> None:
+        """
+        Заменяет действующий код для email новым, старый код удаляется в том же скрипте,
+        при одновременных повторных отправках живым остаётся только последний
+        """
+        await ROTATE(
+            keys=[f"{self.CODE_PREFIX}{code}", f"{self.EMAIL_PREFIX}{email}"],
+            args=[code, str(user_id), email, self.ttl, self.CODE_PREFIX],
+            client=r
+        )
+
+
+    async def consume(self, r : redis.Redis, code : str) -> dict | None:
+        """
+        Возвращает данные кода и сразу удаляет его, None если кода нет или он истёк
+        """
+        data = await CONSUME(keys=[f"{self.CODE_PREFIX}{code}"], args=[self.EMAIL_PREFIX, code], client=r)
+        if not data:
+            return None
+        return dict(zip(data[::2], data[1::2]))
+
+
+
+#создание обьекта
+verification_store = VerificationStore()
@@ -1,6 +1,7 @@
 from fastapi import Depends, HTTPException, status
 
-from sqlalchemy import select
+from sqlalchemy import select, func, literal_column, any_, bindparam, Integer
+from sqlalchemy.dialects.postgresql import JSON, ARRAY, aggregate_order_by
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload, selectinload
  
@@ -10,6 +11,10 @@ from app.schemas.commands import CommandResponseSchema
 from app.models import UserModel, CommandModel
 from app.db_depends import get_async_db
 
+import base64
+import json
+from datetime import datetime
+
  
 
 
@@ -23,6 +28,15 @@ async def check_has_role(current_user : UserModel = Depends(jwt_validator.get_cu
     return current_user
 
 
+async def check_is_admin(current_user : UserModel = Depends(jwt_validator.get_current_user)):
+    """
+    Проверяет что юзер администратор
+    """
+    if current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Действие доступно только администратору")
+    return current_user
+
+
 async def check_no_role(current_user : UserModel = Depends(jwt_validator.get_current_user)):
         """
         Проверяет что юзер уже имеет роль
@@ -34,20 +48,63 @@ async def check_no_role(current_user : UserModel = Depends(jwt_validator.get_cur
 
 
 async def get_command(command_id : int, db : AsyncSession) -> CommandResponseSchema:
-    command = await db.scalar(
-          select(CommandModel)
+    """
+    Активная команда с составом одним запросом, 404 если такой нет
+    """
+    result = await db.execute(
+          select(
+               CommandModel.id,
+               CommandModel.name,
+               CommandModel.created_at,
+               CommandModel.updated_at,
+               CommandModel.status,
+               CommandModel.is_filled,
+               roster_json().label("users"),
+          )
           .where(CommandModel.id == command_id, CommandModel.status == "active")
-          .options(selectinload(CommandModel.users))
      )
+    command = result.mappings().one_or_none()
+    if command is None:
+         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Команда не найдена")
 
-    return CommandResponseSchema(
-         id = command.id,
-         name = command.name,
-         created_at = command.created_at,
-         updated_at = command.updated_at,
-         status = command.status,
-         is_filled = command.is_filled,
-         users = command.users
+    return CommandResponseSchema.model_validate(dict(command))
+    
+
+def utc_iso(column):
+    """
+    timestamptz в строку ISO 8601 в UTC с Z, как даты верхнего уровня отдают orjson (OPT_UTC_Z)
+    и pydantic. Иначе json_build_object пишет смещение часового пояса сессии (+00:00)
+    """
+    return func.to_char(func.timezone("UTC", column), 'YYYY-MM-DD"T"HH24:MI:SS.US"Z"')
+
+
+def roster_json():
+    """
+    Коррелированный подзапрос, собирающий состав команды в json массив
+    одним запросом вместо selectinload и сборки схем в python
+    """
+    user_json = func.json_build_object(
+        "id", UserModel.id,
+        "username", UserModel.username,
+        "email", UserModel.email,
+        "command_id", UserModel.command_id,
+        "created_at", utc_iso(UserModel.created_at),
+        "updated_at", utc_iso(UserModel.updated_at),
+        "role", UserModel.role,
+        "is_active", UserModel.is_active,
+        "is_team_creator", UserModel.is_team_creator,
+    )
+    return (
+        select(
+            func.coalesce(
+                func.json_agg(aggregate_order_by(user_json, UserModel.id)),
+                literal_column("'[]'::json"),
+                type_=JSON,
+            )
+        )
+        .where(UserModel.command_id == CommandModel.id)
+        .correlate(CommandModel)
+        .scalar_subquery()
     )
     
 
@@ -68,4 +125,44 @@ async def check_has_team(user : UserModel = Depends(check_has_role)):
     """
     if user.command_id is not None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Вы уже состоите в команде!")
-    return user
\ No newline at end of file
+    return user
+
+
+
+def encode_cursor(kind : str, sort_value, command_id : int) -> str:
+    """
+    Упаковывает позицию последней команды на странице в непрозрачный курсор
+    kind: rank - при поиске по названию, created_at - без поиска
+    """
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    raw = json.dumps({"k": kind, "v": sort_value, "id": command_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor : str, kind : str) -> tuple:
+    """
+    Распаковывает курсор, проверяя что он выдан для того же режима сортировки
+    """
+    invalid_cursor = HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Некорректный курсор!")
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if data["k"] != kind:
+            raise invalid_cursor
+        value = data["v"]
+        if kind == "created_at":
+            value = datetime.fromisoformat(value)
+        else:
+            value = float(value)
+        return value, int(data["id"])
+    except (ValueError, KeyError, TypeError):
+        raise invalid_cursor
+
+
+
+def id_in(column, ids : list[int]):
+    """
+    column = ANY(:ids) - один параметр-массив вместо IN с тысячами плейсхолдеров
+    """
+    return column == any_(bindparam(None, ids, type_=ARRAY(Integer)))
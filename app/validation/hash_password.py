@@ -1,5 +1,13 @@
+import asyncio
+import secrets
+
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from time import perf_counter
+
 from passlib.context import CryptContext
 
+from app.config import HASH_POOL_KIND, HASH_POOL_WORKERS, HASH_MAX_CONCURRENCY
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated = "auto")
 
 def hash_password(password : str) -> str:
@@ -15,4 +23,117 @@ def verify_password(plain_password : str, hash_password : str) -> bool:
     """
     Проверяет соответсвует ли введеный пароль хешу в бд
     """
-    return pwd_context.verify(plain_password, hash_password)
\ No newline at end of file
+    return pwd_context.verify(plain_password, hash_password)
+
+
+
+class HashPool:
+    """
+    Пул воркеров для bcrypt, чтобы хеширование не блокировало event loop.
+    Семафор ограничивает число одновременных задач, остальные ждут в очереди.
+    """
+    def __init__(self, kind : str, workers : int, max_concurrency : int):
+        self.kind = kind
+        self.workers = workers
+        self.max_concurrency = max_concurrency
+        self._executor : Executor | None = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        #метрики
+        self.queued = 0 #ждут свободного слота
+        self.in_progress = 0 #выполняются в пуле
+        self.completed = 0
+        self.max_queue_depth = 0
+        self.wait_seconds_total = 0.0
+        self.run_seconds_total = 0.0
+
+
+    def _get_executor(self) -> Executor:
+        #пул создаётся при первом обращении
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+
+    async def run(self, func, *args):
+        start = perf_counter()
+        self.queued += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queued)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+
+        started = perf_counter()
+        self.wait_seconds_total += started - start
+        self.in_progress += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.in_progress -= 1
+            self.completed += 1
+            self.run_seconds_total += perf_counter() - started
+            self._semaphore.release()
+
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_concurrency": self.max_concurrency,
+            "queued": self.queued,
+            "in_progress": self.in_progress,
+            "completed": self.completed,
+            "max_queue_depth": self.max_queue_depth,
+            "wait_seconds_total": self.wait_seconds_total,
+            "run_seconds_total": self.run_seconds_total,
+        }
+
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+
+#создание обьекта
+hash_pool = HashPool(
+    kind=HASH_POOL_KIND,
+    workers=HASH_POOL_WORKERS,
+    max_concurrency=HASH_MAX_CONCURRENCY
+)
+
+
+async def hash_password_async(password : str) -> str:
+    """
+    Хеширует пароль в пуле воркеров, не блокируя event loop
+    """
+    return await hash_pool.run(hash_password, password)
+
+
+async def verify_password_async(plain_password : str, hash_password : str) -> bool:
+    """
+    Проверяет пароль в пуле воркеров, не блокируя event loop
+    """
+    return await hash_pool.run(verify_password, plain_password, hash_password)
+
+
+
+_dummy_hash : str | None = None
+
+async def verify_dummy_password_async(plain_password : str) -> bool:
+    """
+    Проверка против случайного хеша для неизвестных email:
+    отказ занимает столько же, сколько проверка настоящего пароля,
+    и по времени ответа нельзя понять, есть ли такой аккаунт
+    """
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = await hash_pool.run(hash_password, secrets.token_urlsafe(16))
+    await hash_pool.run(verify_password, plain_password, _dummy_hash)
+    return False
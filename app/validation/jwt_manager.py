@@ -6,10 +6,12 @@ from app.models import UserModel
 from app.config import SECRET_KEY, ACCES_TOKEN_EXPIRE_MINUTES, REFRESH_TOKEN_EXPIRE_DAYS, ALGORITHM
 from app.schemas.users import RefreshToken, RefreshTokenlist
 from app.services.redis_client import get_redis
+from app.services.revocation import revocation_store
 
 import jwt
 
 from datetime import datetime, timedelta,timezone
+from uuid import uuid4
 
 
 
@@ -39,7 +41,8 @@ class JWTManager:
         to_encody.update(
             {
             "exp" : expire,
-            "token_types" : "refresh"
+            "token_types" : "refresh",
+            "jti" : uuid4().hex #короткий id для отзыва токена
             }
         )
         refresh_token = jwt.encode(to_encody, self.__secret_key, algorithm = self.algorithm)
@@ -67,8 +70,19 @@ class JWTManager:
     
 
     async def revoke_refresh_tokens(self, tokens : RefreshTokenlist, r : redis.Redis = Depends(get_redis)):
+        payloads = []
         for token_obj in tokens.refresh_tokens:
-            await r.set(f"blacklist:{token_obj.refresh_token}", "revoked", ex = self.refresh_token_expire_days * 24 * 60 * 60)
+            try:
+                #срок не проверяем, нужны только jti и exp
+                payload = jwt.decode(
+                    token_obj.refresh_token, self.__secret_key,
+                    algorithms=[self.algorithm], options={"verify_exp": False}
+                )
+            except jwt.PyJWTError:
+                continue #чужой или битый токен отзывать незачем
+            payloads.append({"jti": payload.get("jti"), "exp": payload["exp"], "token": token_obj.refresh_token})
+        if payloads:
+            await revocation_store.revoke_many(r, payloads)
         return {"detail" : "Токены отозваны!"}
 
 
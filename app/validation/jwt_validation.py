@@ -10,9 +10,15 @@ from app.database import  AsyncSession
 from app.models.users import UserModel
 from app.db_depends import get_async_db
 from app.services.redis_client import get_redis
-from app.schemas.users import RefreshToken
+from app.services.principal_cache import principal_cache
+from app.services.revocation import revocation_store
+from app.services.cache import TTLCache
+from app.schemas.users import RefreshToken, TokenPrincipalSchema
 
-from app.config import ALGORITHM, SECRET_KEY
+from app.config import ALGORITHM, SECRET_KEY, TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL
+
+from hashlib import sha256
+from time import time
 
 
 
@@ -23,15 +29,19 @@ class JWTValidator:
     def __init__(self, secret_key: str, algorithm: str):
         self.__secret_key = secret_key
         self.__algorithm = algorithm
+        self._verified_tokens = TTLCache(max_size=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL) #ключ - sha256 токена
 
-    async def get_current_user(
-        self,
-        token: str = Depends(oath2_scheme),
-        db: AsyncSession = Depends(get_async_db)
-    ) -> UserModel:
+    def decode_access_token(self, token: str) -> dict:
         """
-        Функция охранник проверяет access токен
+        Проверяет подпись и claims access токена.
+        Уже проверенные токены берутся из кеша до истечения их exp,
+        повторная проверка подписи для них не нужна
         """
+        token_hash = sha256(token.encode()).digest()
+        payload = self._verified_tokens.get(token_hash)
+        if payload is not None:
+            return payload
+
         credentials_exception = HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Не удалось подтвердить учетные данные!",
@@ -40,8 +50,9 @@ class JWTValidator:
         try:
             payload = jwt.decode(token, self.__secret_key, algorithms=[self.__algorithm])
             email: str | None = payload.get("sub")
+            user_id: int | None = payload.get("id")
             token_types: str | None = payload.get("token_types")
-            if email is None or token_types != "access":
+            if email is None or user_id is None or token_types != "access":
                 raise credentials_exception
         except jwt.ExpiredSignatureError:
             raise HTTPException(
@@ -52,13 +63,54 @@ class JWTValidator:
         except jwt.PyJWTError:
             raise credentials_exception
 
+        #запись живёт не дольше самого токена
+        ttl = min(payload["exp"] - time(), TOKEN_CACHE_TTL)
+        if ttl > 0:
+            self._verified_tokens.set(token_hash, payload, ttl=ttl)
+        return payload
+
+
+    async def get_token_principal(self, token: str = Depends(oath2_scheme)) -> TokenPrincipalSchema:
+        """
+        Облегчённый охранник для read-only роутов: доверяет id и role из токена,
+        не ходит ни в бд, ни в кеш юзеров. Роль может отставать от бд до истечения access токена
+        """
+        payload = self.decode_access_token(token)
+        #claims подписаны нами же, повторная валидация (EmailStr) стоила дороже всего остального
+        return TokenPrincipalSchema.model_construct(id=payload["id"], email=payload["sub"], role=payload.get("role"))
+
+
+    async def get_current_user(
+        self,
+        token: str = Depends(oath2_scheme),
+        db: AsyncSession = Depends(get_async_db),
+        r: redis.Redis = Depends(get_redis)
+    ) -> UserModel:
+        """
+        Функция охранник проверяет access токен,
+        юзер берётся из кеша principal_cache, в бд идём только при промахе
+        """
+        credentials_exception = HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Не удалось подтвердить учетные данные!",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+        payload = self.decode_access_token(token)
+        email: str = payload["sub"]
+        user_id: int = payload["id"]
+
+        cached = await principal_cache.get(user_id, r)
+        if cached is not None and cached["email"] == email and cached["is_active"]:
+            return await principal_cache.attach(cached, db)
+
         request_user = await db.scalars(
             select(UserModel)
-            .where(UserModel.email == email, UserModel.is_active == True)
+            .where(UserModel.id == user_id, UserModel.email == email, UserModel.is_active == True)
         )
         user = request_user.first()
         if user is None:
             raise credentials_exception
+        await principal_cache.set(user, r)
         return user
 
 
@@ -70,7 +122,7 @@ class JWTValidator:
         r: redis.Redis = Depends(get_redis)
     ) -> UserModel:
         """
-        Валидация refresh токена с проверкой на blacklist
+        Валидация refresh токена с проверкой на отзыв
         """
         credentials_exception = HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -78,13 +130,6 @@ class JWTValidator:
             headers={"WWW-Authenticate": "Bearer"}
         )
 
-        # Проверка на blacklist
-        if await r.get(f"blacklist:{token.refresh_token}") is not None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Токен был отозван!",
-                headers={"WWW-Authenticate": "Bearer"}
-            )
         try:
             payload = jwt.decode(token.refresh_token, self.__secret_key, algorithms=[self.__algorithm])
             email: str | None = payload.get("sub")
@@ -100,6 +145,14 @@ class JWTValidator:
         except jwt.PyJWTError:
             raise credentials_exception
 
+        # Проверка на отзыв по jti
+        if await revocation_store.is_revoked(r, payload.get("jti"), token.refresh_token):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Токен был отозван!",
+                headers={"WWW-Authenticate": "Bearer"}
+            )
+
         request_user = await db.scalars(
             select(UserModel)
             .where(UserModel.email == email, UserModel.is_active == True)
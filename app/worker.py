@@ -0,0 +1,57 @@
+"""
+Воркер фоновых задач: письма, чистка неподтверждённых аккаунтов, прогрев кешей.
+Запускается отдельным процессом рядом с приложением, воркеров может быть несколько:
+
+    python -m app.worker --concurrency 20
+
+Останавливается по SIGTERM/SIGINT, начатые задачи дорабатывают
+"""
+import argparse
+import asyncio
+import signal
+
+from dotenv import load_dotenv
+from os import getenv
+
+from app.config import logger, setup_logging
+from app.database import get_async_engine, dispose_engines
+from app.services.job_queue import job_queue
+from app.services.redis_client import InstrumentedRedis
+
+import app.jobs #noqa: F401 регистрирует задачи и расписание
+
+load_dotenv()
+
+
+async def main_async(concurrency : int | None) -> None:
+    setup_logging()
+    get_async_engine()
+    if concurrency:
+        job_queue.concurrency = concurrency
+
+    redis_client = InstrumentedRedis.from_url(getenv("REDIS_URL"), decode_responses=True)
+    await redis_client.ping()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, job_queue.stop)
+
+    logger.bind(log_id="jobs").info(f"Воркер задач запущен, задач одновременно: {job_queue.concurrency}")
+    try:
+        await job_queue.run_worker(redis_client)
+    finally:
+        await dispose_engines()
+        await redis_client.close()
+        logger.bind(log_id="jobs").info(
+            f"Воркер задач остановлен: выполнено {job_queue.completed}, ошибок {job_queue.failed}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воркер фоновых задач")
+    parser.add_argument("--concurrency", type=int, default=None)
+    asyncio.run(main_async(parser.parse_args().concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Микробенчмарк цепочки авторизации целиком, как её вызывает FastAPI:
+    before         - как было: jwt.decode + запрос юзера в бд на каждый запрос
+    current_user   - jwt_validator.get_current_user с тёплым кешем токенов и кешем юзеров
+    token_claims   - jwt_validator.get_token_principal для read-only роутов (GET /users/me)
+
+Идёт поверх локальных Postgres и Redis (ASYNC_LOCAL_DATABASE_URL, REDIS_URL),
+юзер засевается на время прогона и удаляется.
+
+Запуск из корня репозитория:
+    python -m benchmarks.auth --iterations 2000
+"""
+import os
+
+os.environ.setdefault("JWT_SECRET_KEY", "benchmark-secret-key-benchmark-secret-key")
+
+import argparse
+import asyncio
+import json
+
+import jwt
+import redis.asyncio as redis
+
+from time import perf_counter
+from uuid import uuid4
+
+from fastapi import HTTPException
+from sqlalchemy import select, delete
+
+from app.config import SECRET_KEY, ALGORITHM
+from app.database import get_async_session_maker, dispose_engines
+from app.models import UserModel
+from app.validation.jwt_manager import jwt_manager
+from app.validation.jwt_validation import jwt_validator
+
+
+async def before_chain(token : str, db) -> UserModel:
+    """
+    get_current_user до кешей: проверка подписи и запрос в бд каждый раз
+    """
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    user = (await db.scalars(
+        select(UserModel)
+        .where(UserModel.id == payload["id"], UserModel.email == payload["sub"], UserModel.is_active == True)
+    )).first()
+    if user is None:
+        raise HTTPException(status_code=401)
+    return user
+
+
+async def measure(func, iterations : int) -> float:
+    started = perf_counter()
+    for _ in range(iterations):
+        await func()
+    return (perf_counter() - started) / iterations * 1e6
+
+
+async def main_async(iterations : int) -> dict:
+    redis_client = redis.Redis.from_url(os.getenv("REDIS_URL"), decode_responses=True)
+    run_id = uuid4().hex[:8]
+    async with get_async_session_maker()() as db:
+        user = UserModel(
+            username=f"auth{run_id}", email=f"auth-{run_id}@example.com",
+            hashed_password="-", role="player", is_active=True,
+        )
+        db.add(user)
+        await db.commit()
+
+    token = jwt_manager.create_access_token({"sub": user.email, "role": user.role, "id": user.id})
+    try:
+        async with get_async_session_maker()() as db:
+            before = await measure(lambda: before_chain(token, db), iterations)
+            await jwt_validator.get_current_user(token, db, redis_client) #прогреваем кеши
+            current_user = await measure(lambda: jwt_validator.get_current_user(token, db, redis_client), iterations)
+            token_claims = await measure(lambda: jwt_validator.get_token_principal(token), iterations)
+    finally:
+        async with get_async_session_maker()() as db:
+            await db.execute(delete(UserModel).where(UserModel.id == user.id))
+            await db.commit()
+        await redis_client.aclose()
+        await dispose_engines()
+
+    return {
+        "iterations": iterations,
+        "before_us": before,
+        "current_user_us": current_user,
+        "token_claims_us": token_claims,
+        "current_user_speedup": before / current_user,
+        "token_claims_speedup": before / token_claims,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Стоимость цепочки авторизации")
+    parser.add_argument("--iterations", type=int, default=2000)
+    print(json.dumps(asyncio.run(main_async(parser.parse_args().iterations)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+CPU на сжатие ответа страницы поиска (20 команд по 5 игроков):
+GZipMiddleware (как было в app/main.py) против CompressionMiddleware с br/zstd/gzip
+и отдачи закешированного тела через negotiated_response, где вариант сжат 1 раз.
+Приложение вызывается напрямую через ASGI, без сети и HTTP клиента.
+
+Запуск из корня репозитория:
+    python -m benchmarks.compression --requests 5000
+"""
+import argparse
+import asyncio
+import json
+
+from time import process_time
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.requests import Request
+from starlette.routing import Route
+
+from app.middleware.compression import CompressionMiddleware
+from app.services.compression import CompressedBody, negotiated_response, SUPPORTED_ENCODINGS
+from app.services.json_response import FastJSONResponse, dumps
+from benchmarks.serialization import build_rows
+
+
+BODY = dumps({"next_cursor": "cursor", "items": build_rows()})
+CACHED = CompressedBody(BODY)
+
+
+async def uncached_endpoint(request : Request) -> FastJSONResponse:
+    return FastJSONResponse(BODY)
+
+
+async def cached_endpoint(request : Request) -> FastJSONResponse:
+    return await negotiated_response(request, CACHED)
+
+
+def build_app(endpoint, middleware : list[Middleware]) -> Starlette:
+    return Starlette(routes=[Route("/", endpoint)], middleware=middleware)
+
+
+async def drive(app, requests : int, accept_encoding : str) -> tuple[float, int]:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": "/", "raw_path": b"/",
+        "query_string": b"", "root_path": "", "server": ("localhost", 80),
+        "client": ("127.0.0.1", 1234),
+        "headers": [(b"accept-encoding", accept_encoding.encode())],
+    }
+    size = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal size
+        if message["type"] == "http.response.body":
+            size = len(message.get("body", b""))
+
+    started = process_time()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return (process_time() - started) / requests * 1e6, size
+
+
+async def main_async(requests : int):
+    cases = {
+        "identity": (build_app(uncached_endpoint, []), "identity"),
+        "gzip_middleware_level5": (
+            build_app(uncached_endpoint, [Middleware(GZipMiddleware, minimum_size=1000, compresslevel=5)]), "gzip"
+        ),
+    }
+    for encoding in SUPPORTED_ENCODINGS:
+        cases[f"compression_middleware_{encoding}"] = (
+            build_app(uncached_endpoint, [Middleware(CompressionMiddleware)]), encoding
+        )
+        cases[f"cached_precompressed_{encoding}"] = (
+            build_app(cached_endpoint, [Middleware(CompressionMiddleware)]), encoding
+        )
+
+    results = {}
+    for name, (app, accept_encoding) in cases.items():
+        await drive(app, 50, accept_encoding) #прогрев, заодно сжимаются закешированные варианты
+        cpu_us, size = await drive(app, requests, accept_encoding)
+        results[name] = {"cpu_us_per_request": cpu_us, "body_bytes": size}
+
+    print(json.dumps(results, indent=2))
+    print(f"Исходное тело: {len(BODY)} байт, доступные кодировки: {', '.join(SUPPORTED_ENCODINGS)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU на сжатие ответов")
+    parser.add_argument("--requests", type=int, default=5000)
+    asyncio.run(main_async(parser.parse_args().requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+"""
+Нагрузочный бенчмарк API для турнирных сценариев.
+
+Приложение поднимается в том же процессе (httpx + ASGITransport, lifespan
+запускается вручную) поверх локальных Postgres и Redis из переменных окружения
+ASYNC_LOCAL_DATABASE_URL и REDIS_URL. Схема должна быть накатана (alembic upgrade head).
+Перед запуском в бд засеваются юзеры и команды, письма уходят в in-process очередь,
+ограничение частоты выключено.
+
+Сценарии:
+    register    - register -> verify -> login
+    search      - GET /commands/ с search_name и без
+    info        - GET /commands/{command_id}
+    join_race   - много игроков одновременно вступают в одни и те же команды
+    refresh     - обновление access токена по refresh токену
+    bulk_status - POST /commands/bulk-status пачками, статус чередуется
+    bulk        - POST /users/bulk-delete пачками
+    bulk_commands - POST /commands/bulk-delete пачками
+
+Результат (RPS и p50/p95/p99 по каждому эндпоинту внутри сценария, RPS считается
+от первого до последнего запроса к эндпоинту в своём сценарии, без подготовки
+вроде логинов) печатается и сохраняется в json,
+--compare сравнивает с прошлым прогоном, например с другого коммита:
+    python -m benchmarks.load --users 2000 --commands 400 --output results/head.json
+    python -m benchmarks.load --output results/new.json --compare results/head.json
+"""
+import os
+
+os.environ.setdefault("MAIL_QUEUE_BACKEND", "memory")
+os.environ["RATE_LIMIT_ENABLED"] = "false" #все запросы идут с одного адреса
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import subprocess
+
+from collections import defaultdict
+from time import perf_counter
+from uuid import uuid4
+
+import httpx
+
+from sqlalchemy import select, func
+
+from app.main import app
+from app.database import get_async_session_maker
+from app.models import UserModel, CommandModel
+from app.models.commands import MAX_MEMBERS
+from app.services.email_filter import email_filter
+from app.validation.hash_password import hash_password
+
+
+PASSWORD = "Benchmark!pass1"
+SEARCH_WORDS = ("team", "cyber", "navi", "spirit", "virtus", "pro", "dragons", "wolves")
+
+
+class Recorder:
+    """
+    Собирает длительности запросов по эндпоинтам внутри текущего сценария,
+    окно от начала первого до конца последнего запроса и время каждого сценария
+    """
+    def __init__(self):
+        self.scenario = ""
+        self.samples : dict[str, list[float]] = defaultdict(list)
+        self.errors : dict[str, int] = defaultdict(int)
+        self.windows : dict[str, list[float]] = {}
+        self.elapsed : dict[str, float] = {}
+
+
+    async def run_scenario(self, name : str, scenario):
+        self.scenario = name
+        started = perf_counter()
+        result = await scenario
+        self.elapsed[name] = perf_counter() - started
+        return result
+
+
+    async def request(self, client : httpx.AsyncClient, name : str, method : str, url : str, **kwargs) -> httpx.Response:
+        key = f"{self.scenario}: {name}"
+        started = perf_counter()
+        response = await client.request(method, url, **kwargs)
+        finished = perf_counter()
+        self.samples[key].append(finished - started)
+        window = self.windows.setdefault(key, [started, finished])
+        window[0], window[1] = min(window[0], started), finished
+        if response.status_code >= 500:
+            self.errors[key] += 1
+        return response
+
+
+    def summary(self) -> dict:
+        result = {}
+        for name, values in sorted(self.samples.items()):
+            ordered = sorted(values)
+            quantiles = statistics.quantiles(ordered, n=100) if len(ordered) > 1 else ordered * 99
+            result[name] = {
+                "requests": len(ordered),
+                "errors": self.errors[name],
+                "rps": len(ordered) / (self.windows[name][1] - self.windows[name][0]),
+                "p50_ms": quantiles[49] * 1000,
+                "p95_ms": quantiles[94] * 1000,
+                "p99_ms": quantiles[98] * 1000,
+            }
+        return result
+
+
+
+async def seed(users : int, commands : int) -> dict:
+    """
+    Засевает активных игроков и команды, возвращает их id.
+    Вызывается внутри lifespan приложения
+    """
+    hashed = hash_password(PASSWORD) #один хеш на всех, иначе сид займёт минуты
+    run_id = uuid4().hex[:8]
+    session_maker = get_async_session_maker()
+    async with session_maker() as db:
+        new_commands = [
+            CommandModel(
+                name=f"{random.choice(SEARCH_WORDS)} {run_id} {i}",
+                password=hashed,
+            )
+            for i in range(commands)
+        ]
+        db.add_all(new_commands)
+        await db.flush()
+
+        new_users = [
+            UserModel(
+                username=f"b{run_id}{i}",
+                email=f"bench-{run_id}-{i}@example.com",
+                hashed_password=hashed,
+                role="player",
+                is_active=True,
+            )
+            for i in range(users)
+        ]
+        #админ для bulk сценария
+        new_users.append(UserModel(
+            username=f"a{run_id}", email=f"admin-{run_id}@example.com",
+            hashed_password=hashed, role="admin", is_active=True,
+        ))
+        db.add_all(new_users)
+        await db.commit()
+        seeded = {
+            "run_id": run_id,
+            "commands": [command.id for command in new_commands],
+            "users": [(user.id, user.email) for user in new_users[:-1]],
+            "admin": new_users[-1].email,
+        }
+    #сид идёт мимо verify, без этого фильтр email отклонит логин засеянных юзеров
+    await email_filter.add(app.state.redis_client, *(email for _, email in seeded["users"]), seeded["admin"])
+    return seeded
+
+
+async def login(client : httpx.AsyncClient, recorder : Recorder, email : str) -> dict:
+    response = await recorder.request(
+        client, "POST /users/token", "POST", "/users/token",
+        data={"username": email, "password": PASSWORD},
+    )
+    return response.json()
+
+
+
+async def scenario_register(client, recorder, seeded, requests : int, concurrency : int):
+    redis_client = app.state.redis_client
+
+    async def one(i : int):
+        email = f"reg-{seeded['run_id']}-{i}@example.com"
+        await recorder.request(client, "POST /users/register", "POST", "/users/register", json={
+            "username": f"r{seeded['run_id']}{i}"[:20], "email": email, "password": PASSWORD,
+        })
+        code = await redis_client.get(f"verification:email:{email}")
+        if code is None:
+            return
+        await recorder.request(client, "POST /users/verify", "POST", "/users/verify", json={"verify_code": code})
+        await login(client, recorder, email)
+
+    await run_concurrently(one, requests, concurrency)
+
+
+async def scenario_search(client, recorder, seeded, requests : int, concurrency : int):
+    async def one(i : int):
+        if i % 2:
+            params = {"search_name": random.choice(SEARCH_WORDS)}
+            name = "GET /commands/?search_name"
+        else:
+            params = {}
+            name = "GET /commands/"
+        response = await recorder.request(client, name, "GET", "/commands/", params=params)
+        cursor = response.json().get("next_cursor") if response.status_code == 200 else None
+        if cursor:
+            params["cursor"] = cursor
+            await recorder.request(client, f"{name} (page 2)", "GET", "/commands/", params=params)
+
+    await run_concurrently(one, requests, concurrency)
+
+
+async def scenario_info(client, recorder, seeded, requests : int, concurrency : int):
+    async def one(i : int):
+        command_id = random.choice(seeded["commands"])
+        await recorder.request(client, "GET /commands/{command_id}", "GET", f"/commands/{command_id}")
+
+    await run_concurrently(one, requests, concurrency)
+
+
+async def scenario_join_race(client, recorder, seeded, requests : int, concurrency : int):
+    """
+    Все игроки ломятся в небольшое число команд, после чего проверяется,
+    что ни одна команда не переполнилась
+    """
+    targets = seeded["commands"][:max(1, len(seeded["commands"]) // 20)]
+    players = seeded["users"][:requests]
+    tokens = {}
+    for user_id, email in players:
+        tokens[user_id] = (await login(client, recorder, email)).get("access_token")
+
+    async def one(i : int):
+        user_id, _ = players[i]
+        await recorder.request(
+            client, "PUT /users/join-team/{command_id}", "PUT", f"/users/join-team/{random.choice(targets)}",
+            json={"password": PASSWORD}, headers={"Authorization": f"Bearer {tokens[user_id]}"},
+        )
+
+    await run_concurrently(one, len(players), concurrency)
+
+    async with get_async_session_maker()() as db:
+        overfilled = await db.scalar(
+            select(func.count()).select_from(
+                select(UserModel.command_id)
+                .where(UserModel.command_id.in_(targets))
+                .group_by(UserModel.command_id)
+                .having(func.count() > MAX_MEMBERS)
+                .subquery()
+            )
+        )
+    if overfilled:
+        raise AssertionError(f"{overfilled} команд переполнено больше {MAX_MEMBERS} игроков")
+
+
+async def scenario_refresh(client, recorder, seeded, requests : int, concurrency : int):
+    sessions = [await login(client, recorder, email) for _, email in seeded["users"][-min(50, requests):]]
+
+    async def one(i : int):
+        refresh_token = sessions[i % len(sessions)].get("refresh_token")
+        await recorder.request(client, "POST /users/access-token", "POST", "/users/access-token", json={"refresh_token": refresh_token})
+
+    await run_concurrently(one, requests, concurrency)
+
+
+def split_batches(ids : list[int], requests : int) -> list[list[int]]:
+    batch_size = max(1, len(ids) // max(requests, 1))
+    return [ids[i:i + batch_size] for i in range(0, len(ids), batch_size)][:requests]
+
+
+async def run_bulk(client, recorder, seeded, url : str, batches : list[list[int]], concurrency : int, **body):
+    admin_token = (await login(client, recorder, seeded["admin"])).get("access_token")
+
+    async def one(i : int):
+        await recorder.request(
+            client, f"POST {url}", "POST", url,
+            json={"ids": batches[i], **body}, headers={"Authorization": f"Bearer {admin_token}"},
+        )
+
+    await run_concurrently(one, len(batches), min(concurrency, 4))
+
+
+async def scenario_bulk_status(client, recorder, seeded, requests : int, concurrency : int):
+    batches = split_batches(seeded["commands"], requests)
+    for status in ("inactive", "active"): #возвращаем как было, чтобы следующие сценарии видели команды
+        await run_bulk(client, recorder, seeded, "/commands/bulk-status", batches, concurrency, status=status)
+
+
+async def scenario_bulk(client, recorder, seeded, requests : int, concurrency : int):
+    batches = split_batches([user_id for user_id, _ in seeded["users"]], requests)
+    await run_bulk(client, recorder, seeded, "/users/bulk-delete", batches, concurrency)
+
+
+async def scenario_bulk_commands(client, recorder, seeded, requests : int, concurrency : int):
+    batches = split_batches(seeded["commands"], requests)
+    await run_bulk(client, recorder, seeded, "/commands/bulk-delete", batches, concurrency)
+
+
+SCENARIOS = {
+    "register": scenario_register,
+    "search": scenario_search,
+    "info": scenario_info,
+    "join_race": scenario_join_race,
+    "refresh": scenario_refresh,
+    "bulk_status": scenario_bulk_status,
+    #удаляют засеянных юзеров и команды, поэтому идут последними
+    "bulk": scenario_bulk,
+    "bulk_commands": scenario_bulk_commands,
+}
+
+
+
+async def run_concurrently(func, total : int, concurrency : int) -> None:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def guarded(i : int):
+        async with semaphore:
+            await func(i)
+
+    await asyncio.gather(*(guarded(i) for i in range(total)))
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current : dict, previous : dict) -> None:
+    print(f"\nСравнение с {previous.get('revision')}:")
+    for name, stats in current["endpoints"].items():
+        old = previous["endpoints"].get(name)
+        if old is None:
+            continue
+        print(
+            f"{name:60} rps {old['rps']:9.1f} -> {stats['rps']:9.1f}   "
+            f"p99 {old['p99_ms']:8.2f} -> {stats['p99_ms']:8.2f} ms"
+        )
+
+
+async def main_async(args) -> dict:
+    recorder = Recorder()
+    async with app.router.lifespan_context(app):
+        await app.state.mail_queue.stop() #письма копятся в памяти, SMTP не нужен
+        seeded = await seed(args.users, args.commands)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://localhost") as client:
+            for name in args.scenarios:
+                await recorder.run_scenario(name, SCENARIOS[name](client, recorder, seeded, args.requests, args.concurrency))
+
+    return {
+        "revision": git_revision(),
+        "params": {
+            "users": args.users, "commands": args.commands,
+            "requests": args.requests, "concurrency": args.concurrency,
+            "scenarios": args.scenarios,
+        },
+        "scenario_seconds": recorder.elapsed,
+        "endpoints": recorder.summary(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный бенчмарк API")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--commands", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=500, help="Запросов на сценарий")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--output", help="Файл для сохранения результатов в json")
+    parser.add_argument("--compare", help="json прошлого прогона для сравнения")
+    args = parser.parse_args()
+
+    result = asyncio.run(main_async(args))
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as file:
+            json.dump(result, file, indent=2, ensure_ascii=False)
+    if args.compare:
+        with open(args.compare) as file:
+            compare(result, json.load(file))
+
+
+if __name__ == "__main__":
+    main()
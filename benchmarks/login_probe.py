@@ -0,0 +1,86 @@
+"""
+Перебор email на POST /users/token: сколько запросов в бд экономит фильтр email
+активных юзеров и совпадает ли время отказа для несуществующего и существующего аккаунта.
+
+Приложение поднимается в том же процессе, как в benchmarks.load, поверх локальных
+Postgres и Redis (ASYNC_LOCAL_DATABASE_URL, REDIS_URL), ограничение частоты выключено.
+Для запуска нужен httpx (pip install httpx).
+
+Запуск из корня репозитория:
+    python -m benchmarks.login_probe --probes 500 --users 200
+"""
+import os
+
+os.environ.setdefault("MAIL_QUEUE_BACKEND", "memory")
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+
+import argparse
+import asyncio
+import json
+import random
+
+from uuid import uuid4
+
+import httpx
+
+from app.main import app
+from app.services.db_metrics import async_pool_metrics
+from app.services.email_filter import email_filter
+from benchmarks.load import Recorder, seed, run_concurrently, PASSWORD
+
+
+async def probe(client, recorder, seeded, probes : int, concurrency : int) -> dict:
+    known = [email for _, email in seeded["users"]]
+
+    async def one(i : int):
+        if i % 10 == 0: #каждый десятый - существующий аккаунт с неверным паролем
+            email, name = random.choice(known), "known email"
+        else:
+            email, name = f"probe-{uuid4().hex[:12]}@example.com", "unknown email"
+        await recorder.request(
+            client, name, "POST", "/users/token",
+            data={"username": email, "password": PASSWORD + "wrong"},
+        )
+
+    queries_before = async_pool_metrics.queries
+    await run_concurrently(one, probes, concurrency)
+    return {
+        "db_queries": async_pool_metrics.queries - queries_before,
+        "db_queries_per_probe": (async_pool_metrics.queries - queries_before) / probes,
+    }
+
+
+async def main_async(args) -> dict:
+    recorder = Recorder()
+    result = {}
+    async with app.router.lifespan_context(app):
+        await app.state.mail_queue.stop()
+        redis_client = app.state.redis_client
+        seeded = await seed(args.users, 1)
+        await email_filter.build(redis_client)
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://localhost") as client:
+            for label, enabled in (("filter_off", False), ("filter_on", True)):
+                email_filter.enabled = enabled
+                result[label] = await recorder.run_scenario(
+                    label, probe(client, recorder, seeded, args.probes, args.concurrency)
+                )
+
+    off, on = result["filter_off"]["db_queries"], result["filter_on"]["db_queries"]
+    result["db_queries_saved"] = off - on
+    result["filter_stats"] = email_filter.stats()
+    result["latency"] = recorder.summary()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перебор email на логине")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--probes", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    print(json.dumps(asyncio.run(main_async(parser.parse_args())), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
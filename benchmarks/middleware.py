@@ -0,0 +1,102 @@
+"""
+Накладные расходы логирования на запрос: две BaseHTTPMiddleware прослойки
+(как было в app/main.py) против одного RequestLoggingMiddleware.
+Приложение вызывается напрямую через ASGI, без сети и HTTP клиента.
+
+Запуск из корня репозитория:
+    python -m benchmarks.middleware --requests 20000
+"""
+import argparse
+import asyncio
+import json
+
+from time import perf_counter, time
+from uuid import uuid4
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from app.config import logger
+from app.middleware.request_logging import RequestLoggingMiddleware
+
+
+async def endpoint(request : Request) -> JSONResponse:
+    return JSONResponse({"message": "hello"})
+
+
+async def log_middleware(request : Request, call_next):
+    with logger.contextualize(log_id=str(uuid4())):
+        response = await call_next(request)
+        logger.info("Успешный запрос к " + request.url.path)
+        return response
+
+
+async def timing_middleware(request : Request, call_next):
+    start_time = time()
+    response = await call_next(request)
+    duration = time() - start_time
+    logger.info(f"Время выполнения запроса к : {duration:.10f} seconds | {request.method} {request.url.path}")
+    return response
+
+
+def build_app(middleware : list[Middleware]) -> Starlette:
+    return Starlette(routes=[Route("/", endpoint)], middleware=middleware)
+
+
+async def drive(app, requests : int) -> float:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": "/", "raw_path": b"/",
+        "query_string": b"", "root_path": "", "headers": [], "server": ("localhost", 80),
+        "client": ("127.0.0.1", 1234),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    started = perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return perf_counter() - started
+
+
+async def main_async(requests : int):
+    logger.remove()
+    logger.add(lambda message: None, format="{extra[log_id]} {message}", level="INFO") #пишем в никуда, меряем только middleware
+
+    apps = {
+        "no_middleware": build_app([]),
+        "base_http_middleware_x2": build_app([
+            Middleware(BaseHTTPMiddleware, dispatch=timing_middleware),
+            Middleware(BaseHTTPMiddleware, dispatch=log_middleware),
+        ]),
+        "request_logging_middleware": build_app([Middleware(RequestLoggingMiddleware)]),
+        "request_logging_middleware_sampled_10pct": build_app([Middleware(RequestLoggingMiddleware, sample_rate=0.1)]),
+    }
+    results = {}
+    for name, app in apps.items():
+        await drive(app, 200) #прогрев
+        results[name] = await drive(app, requests) / requests * 1e6
+
+    baseline = results["no_middleware"]
+    print(json.dumps({
+        name: {"us_per_request": value, "overhead_us": value - baseline}
+        for name, value in results.items()
+    }, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Накладные расходы middleware логирования")
+    parser.add_argument("--requests", type=int, default=20_000)
+    asyncio.run(main_async(parser.parse_args().requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+CPU на сериализацию одной страницы GET /commands/ (20 команд по 5 игроков):
+прежний путь (схема -> повторная валидация по response_model -> jsonable_encoder -> json.dumps)
+против FastJSONResponse (строки из бд сразу в orjson) и отдачи готового тела из кеша.
+Бд и HTTP не нужны, строки собираются в памяти в том же виде, что отдаёт запрос.
+
+Запуск из корня репозитория:
+    python -m benchmarks.serialization --requests 5000
+"""
+import argparse
+import json
+
+from datetime import datetime, timedelta, timezone
+from time import process_time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.schemas.commands import CommandSearchSchema
+from app.services.json_response import FastJSONResponse, dumps
+
+
+PAGE_SIZE = 20
+TEAM_SIZE = 5
+
+
+def build_rows() -> list[dict]:
+    """
+    Строки как после result.mappings(): состав из json_agg уже список dict'ов
+    """
+    now = datetime.now(timezone.utc)
+    rows = []
+    for command_id in range(1, PAGE_SIZE + 1):
+        created_at = now - timedelta(minutes=command_id)
+        rows.append({
+            "id": command_id,
+            "name": f"team {command_id}",
+            "created_at": created_at,
+            "updated_at": created_at,
+            "status": "active",
+            "is_filled": True,
+            "users": [
+                {
+                    "id": command_id * 10 + i,
+                    "username": f"player{command_id}_{i}",
+                    "email": f"player{command_id}_{i}@example.com",
+                    "command_id": command_id,
+                    "created_at": created_at.isoformat(),
+                    "updated_at": created_at.isoformat(),
+                    "role": "player",
+                    "is_active": True,
+                    "is_team_creator": i == 0,
+                }
+                for i in range(TEAM_SIZE)
+            ],
+        })
+    return rows
+
+
+def old_path(rows : list[dict]) -> bytes:
+    response = CommandSearchSchema(next_cursor="cursor", items=rows)
+    revalidated = CommandSearchSchema.model_validate(response.model_dump()) #валидация по response_model
+    return JSONResponse(jsonable_encoder(revalidated)).body
+
+
+def fast_path(rows : list[dict]) -> bytes:
+    return FastJSONResponse(dumps({"next_cursor": "cursor", "items": rows})).body
+
+
+def cached_path(body : str) -> bytes:
+    return FastJSONResponse(body).body
+
+
+def measure(func, argument, requests : int) -> float:
+    for _ in range(100): #прогрев
+        func(argument)
+    started = process_time()
+    for _ in range(requests):
+        func(argument)
+    return (process_time() - started) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU на сериализацию страницы поиска")
+    parser.add_argument("--requests", type=int, default=5000)
+    requests = parser.parse_args().requests
+
+    rows = build_rows()
+    body = fast_path(rows).decode()
+    results = {
+        "schema_revalidate_jsonable_encoder": measure(old_path, rows, requests),
+        "fast_json_response": measure(fast_path, rows, requests),
+        "fast_json_response_cached_body": measure(cached_path, body, requests),
+    }
+    baseline = results["schema_revalidate_jsonable_encoder"]
+    print(json.dumps({
+        name: {"cpu_us_per_request": value, "speedup": baseline / value if value else None}
+        for name, value in results.items()
+    }, indent=2))
+    print(f"Размер тела: {len(body.encode())} байт")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Замер времени старта: импорт app.main и время до готовности принимать запросы
+(выполнение lifespan до yield). Каждый замер - в отдельном процессе, чтобы
+кеш импортов не искажал результат.
+
+Запуск из корня репозитория:
+    python -m benchmarks.startup --runs 10 --output startup.json
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+
+MEASURE_SCRIPT = """
+import asyncio, json, sys
+from time import perf_counter
+
+started = perf_counter()
+import app.main
+imported = perf_counter()
+
+ready = None
+if {with_lifespan}:
+    async def run_lifespan():
+        async with app.main.app.router.lifespan_context(app.main.app):
+            return perf_counter()
+    ready = asyncio.run(run_lifespan())
+
+heavy = [name for name in ("psycopg2", "sqlalchemy.dialects.postgresql.psycopg2") if name in sys.modules]
+print(json.dumps({{
+    "import_seconds": imported - started,
+    "ready_seconds": (ready - started) if ready else None,
+    "sync_driver_loaded": bool(heavy),
+}}))
+"""
+
+
+def measure(with_lifespan : bool) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", MEASURE_SCRIPT.format(with_lifespan=with_lifespan)],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(values : list[float]) -> dict:
+    return {
+        "min": min(values),
+        "median": statistics.median(values),
+        "max": max(values),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время импорта и старта app.main")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--lifespan", action="store_true", help="Также мерить время до готовности (нужны Postgres и Redis)")
+    parser.add_argument("--output", help="Файл для сохранения результатов в json")
+    args = parser.parse_args()
+
+    runs = [measure(args.lifespan) for _ in range(args.runs)]
+    result = {
+        "runs": args.runs,
+        "import_seconds": summarize([run["import_seconds"] for run in runs]),
+        "sync_driver_loaded": any(run["sync_driver_loaded"] for run in runs),
+    }
+    if args.lifespan:
+        result["ready_seconds"] = summarize([run["ready_seconds"] for run in runs])
+
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(result, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Сравнение числа round-trip'ов к Redis для кодов подтверждения:
+последовательные команды (как было в роутерах) против VerificationStore.
+К каждому round-trip добавляется искусственная задержка сети --latency-ms.
+
+Идёт против настоящего Redis из REDIS_URL или --redis-url.
+
+Запуск из корня репозитория:
+    python -m benchmarks.verification_store --iterations 200 --latency-ms 1
+"""
+import argparse
+import asyncio
+import json
+import os
+
+import redis.asyncio as redis
+
+from time import perf_counter
+
+from app.services.verification_store import VerificationStore
+
+
+class RoundTripCounter:
+    """
+    Считает round-trip'ы клиента и добавляет к каждому задержку
+    """
+    def __init__(self, client, latency : float):
+        self.count = 0
+        self.latency = latency
+        original_execute = client.execute_command
+        original_pipeline = client.pipeline
+
+        async def execute_command(*args, **kwargs):
+            self.count += 1
+            await asyncio.sleep(self.latency)
+            return await original_execute(*args, **kwargs)
+
+        def pipeline(*args, **kwargs):
+            pipe = original_pipeline(*args, **kwargs)
+            original_pipe_execute = pipe.execute
+
+            async def execute(*args, **kwargs):
+                self.count += 1
+                await asyncio.sleep(self.latency)
+                return await original_pipe_execute(*args, **kwargs)
+
+            pipe.execute = execute
+            return pipe
+
+        client.execute_command = execute_command
+        client.pipeline = pipeline
+
+
+async def sequential_flow(r, code : str, email : str) -> None:
+    #register
+    await r.hset(f"verification:{code}", mapping={"code": code, "user_id": "1", "email": email})
+    await r.expire(f"verification:{code}", 600)
+    await r.set(f"verification:email:{email}", code, ex=600)
+    #resend
+    old_code = await r.get(f"verification:email:{email}")
+    if old_code:
+        await r.delete(f"verification:{old_code}")
+        await r.delete(f"verification:email:{email}")
+    new_code = str(int(code) + 1)
+    await r.hset(f"verification:{new_code}", mapping={"code": new_code, "user_id": "1", "email": email})
+    await r.expire(f"verification:{new_code}", 600)
+    await r.set(f"verification:email:{email}", new_code, ex=600)
+    #verify
+    data = await r.hgetall(f"verification:{new_code}")
+    await r.delete(f"verification:{new_code}")
+    await r.delete(f"verification:email:{data['email']}")
+
+
+async def store_flow(store : VerificationStore, r, code : str, email : str) -> None:
+    await store.create(r, code, 1, email)
+    new_code = str(int(code) + 1)
+    await store.rotate(r, new_code, 1, email)
+    await store.consume(r, new_code)
+
+
+async def run(name : str, flow, client, iterations : int, latency : float) -> dict:
+    counter = RoundTripCounter(client, latency)
+    started = perf_counter()
+    for i in range(iterations):
+        await flow(client, str(10000000 + i * 2), f"user{i}@example.com")
+    elapsed = perf_counter() - started
+    return {
+        "flow": name,
+        "round_trips_per_flow": counter.count / iterations,
+        "ms_per_flow": elapsed / iterations * 1000,
+    }
+
+
+def make_client(redis_url : str) -> redis.Redis:
+    return redis.from_url(redis_url, decode_responses=True)
+
+
+async def main_async(args):
+    store = VerificationStore()
+    results = [
+        await run("sequential", sequential_flow, make_client(args.redis_url), args.iterations, args.latency_ms / 1000),
+        await run(
+            "verification_store",
+            lambda r, code, email: store_flow(store, r, code, email),
+            make_client(args.redis_url), args.iterations, args.latency_ms / 1000
+        ),
+    ]
+    print(json.dumps(results, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Round-trip'ы Redis для кодов подтверждения")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=1.0, help="Искусственная задержка на round-trip")
+    parser.add_argument("--redis-url", default=os.getenv("REDIS_URL"), help="По умолчанию REDIS_URL")
+    args = parser.parse_args()
+    if not args.redis_url:
+        parser.error("нужен REDIS_URL или --redis-url")
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
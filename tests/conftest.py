@@ -0,0 +1,25 @@
+"""
+Тесты с бд и Redis идут против локальных Postgres и Redis из ASYNC_LOCAL_DATABASE_URL
+и REDIS_URL (схема накатана alembic upgrade head) и пропускаются, если их нет.
+Ограничение частоты выключено, письма уходят в in-process очередь
+"""
+import os
+
+import pytest
+
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+os.environ.setdefault("MAIL_QUEUE_BACKEND", "memory")
+os.environ.setdefault("JWT_SECRET_KEY", "test-secret-key-with-at-least-32-bytes")
+
+
+@pytest.fixture
+def services() -> None:
+    if not os.getenv("ASYNC_LOCAL_DATABASE_URL") or not os.getenv("REDIS_URL"):
+        pytest.skip("нужны ASYNC_LOCAL_DATABASE_URL и REDIS_URL")
+
+
+@pytest.fixture
+def redis_url() -> str:
+    if not os.getenv("REDIS_URL"):
+        pytest.skip("нужен REDIS_URL")
+    return os.getenv("REDIS_URL")
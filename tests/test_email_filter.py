@@ -0,0 +1,99 @@
+"""
+Фильтр email для логина: насыщенные счётчики не дают ложного "нет" после удалений,
+подтверждения во время пересборки не теряются, пересборка подменяет живой фильтр
+"""
+import asyncio
+import os
+
+from uuid import uuid4
+
+import pytest
+
+redis = pytest.importorskip("redis.asyncio")
+
+from sqlalchemy import delete
+
+from app.database import get_async_session_maker, dispose_engines
+from app.models import UserModel
+from app.services.email_filter import EmailFilter
+
+
+def make_filter(size : int, hashes : int) -> EmailFilter:
+    run_id = uuid4().hex[:8]
+
+    class TestFilter(EmailFilter):
+        KEY = f"{{test:{run_id}}}:filter"
+        NEXT_KEY = f"{{test:{run_id}}}:filter:next"
+        LOCK_KEY = f"{{test:{run_id}}}:filter:lock"
+        FRESH_KEY = f"{{test:{run_id}}}:filter:fresh"
+
+    return TestFilter(enabled=True, size=size, hashes=hashes, rebuild_interval=60)
+
+
+async def cleanup(r, email_filter : EmailFilter) -> None:
+    await r.delete(email_filter.KEY, email_filter.NEXT_KEY, email_filter.LOCK_KEY, email_filter.FRESH_KEY)
+    await r.aclose()
+
+
+def test_saturated_counters_do_not_turn_into_false_negatives(redis_url):
+    #4 счётчика на 40 email: все насыщаются
+    email_filter = make_filter(size=4, hashes=3)
+    emails = [f"user{i}@example.com" for i in range(40)]
+
+    async def run() -> bool | None:
+        r = redis.from_url(redis_url, decode_responses=True)
+        try:
+            await r.bitfield(email_filter.KEY).set("u4", f"#{email_filter.size}", 1).execute()
+            await email_filter.add(r, *emails)
+            await email_filter.remove(r, *emails[1:])
+            return await email_filter.might_exist(r, emails[0])
+        finally:
+            await cleanup(r, email_filter)
+
+    assert asyncio.run(run()) is True
+
+
+def test_rebuild_keeps_adds_made_during_the_build_and_swaps_atomically(services, monkeypatch):
+    email_filter = make_filter(size=1 << 16, hashes=5)
+    run_id = uuid4().hex[:8]
+    in_db, added_during_build = f"efilter-{run_id}-db@example.com", f"efilter-{run_id}-late@example.com"
+    stale = f"efilter-{run_id}-stale@example.com"
+
+    original_increment = email_filter._increment
+
+    async def increment_then_verify(r, key, emails):
+        #пока идёт чтение из бд, на другом воркере подтверждают почту
+        await email_filter.add(r, added_during_build)
+        await original_increment(r, key, emails)
+
+    async def run() -> tuple:
+        r = redis.from_url(os.environ["REDIS_URL"], decode_responses=True)
+        try:
+            async with get_async_session_maker()() as db:
+                db.add(UserModel(username=f"ef{run_id}", email=in_db, hashed_password="-", is_active=True))
+                await db.commit()
+            #живой фильтр знает email, которого в бд уже нет
+            await r.bitfield(email_filter.KEY).set("u4", f"#{email_filter.size}", 1).execute()
+            await email_filter.add(r, stale)
+
+            monkeypatch.setattr(email_filter, "_increment", increment_then_verify)
+            built = await email_filter.build(r, force=True)
+            return (
+                built,
+                await email_filter.might_exist(r, in_db),
+                await email_filter.might_exist(r, added_during_build),
+                await email_filter.might_exist(r, stale),
+                await r.exists(email_filter.NEXT_KEY),
+            )
+        finally:
+            async with get_async_session_maker()() as db:
+                await db.execute(delete(UserModel).where(UserModel.email.like(f"efilter-{run_id}-%")))
+                await db.commit()
+            await dispose_engines()
+            await cleanup(r, email_filter)
+
+    built, has_db, has_late, has_stale, next_left = asyncio.run(run())
+    assert built
+    assert has_db and has_late
+    assert has_stale is False
+    assert not next_left
@@ -0,0 +1,185 @@
+"""
+Очередь задач: повторы с экспоненциальной задержкой, dead после исчерпания попыток,
+периодическую задачу ставит один воркер, задача после падения воркера считается попыткой,
+а долгая задача продлевает дедлайн и не выполняется дважды
+"""
+import asyncio
+import json
+
+from time import time
+from uuid import uuid4
+
+import pytest
+
+redis = pytest.importorskip("redis.asyncio")
+
+from app.services.job_queue import JobQueue
+
+
+def make_queue(**kwargs) -> JobQueue:
+    run_id = uuid4().hex[:8]
+
+    class TestQueue(JobQueue):
+        QUEUE_KEY = f"{{test:{run_id}}}:queue"
+        SCHEDULED_KEY = f"{{test:{run_id}}}:scheduled"
+        PROCESSING_KEY = f"{{test:{run_id}}}:processing"
+        DEAD_KEY = f"{{test:{run_id}}}:dead"
+        PERIODIC_PREFIX = f"{{test:{run_id}}}:periodic:"
+
+    options = dict(concurrency=4, max_attempts=3, retry_base_delay=10, visibility_timeout=30, poll_interval=0.05)
+    options.update(kwargs)
+    return TestQueue(**options)
+
+
+async def cleanup(r, queue : JobQueue) -> None:
+    await r.delete(queue.QUEUE_KEY, queue.SCHEDULED_KEY, queue.PROCESSING_KEY, queue.DEAD_KEY)
+    keys = [key async for key in r.scan_iter(match=f"{queue.PERIODIC_PREFIX}*")]
+    if keys:
+        await r.delete(*keys)
+    await r.aclose()
+
+
+async def take(r, queue : JobQueue) -> None:
+    #одна выдача и одно выполнение, как в цикле воркера
+    for raw in await queue._pop(r, 1):
+        await queue._execute(r, raw)
+
+
+def test_failed_job_is_retried_with_backoff_then_dead_lettered(redis_url):
+    queue = make_queue()
+
+    @queue.job("boom")
+    async def boom(r):
+        raise RuntimeError("boom")
+
+    async def run() -> tuple:
+        r = redis.from_url(redis_url, decode_responses=True)
+        try:
+            await queue.enqueue(r, "boom")
+            delays = []
+            for _ in range(queue.max_attempts - 1):
+                started = time()
+                await take(r, queue)
+                [(raw, due)] = await r.zrange(queue.SCHEDULED_KEY, 0, -1, withscores=True)
+                delays.append(due - started)
+                #время повтора подошло
+                await r.zadd(queue.SCHEDULED_KEY, {raw: 0})
+                await queue._promote_due(r)
+            await take(r, queue)
+            return (
+                delays,
+                await r.zcard(queue.SCHEDULED_KEY),
+                await r.zcard(queue.PROCESSING_KEY),
+                [json.loads(raw) for raw in await r.lrange(queue.DEAD_KEY, 0, -1)],
+            )
+        finally:
+            await cleanup(r, queue)
+
+    delays, scheduled, processing, dead = asyncio.run(run())
+    assert delays[0] == pytest.approx(10, abs=1)
+    assert delays[1] == pytest.approx(20, abs=1)
+    assert scheduled == 0 and processing == 0
+    assert len(dead) == 1 and dead[0]["attempts"] == 3 and "boom" in dead[0]["error"]
+    assert queue.failed == 3 and queue.dead_lettered == 1
+
+
+def test_periodic_job_is_enqueued_once_per_period(redis_url):
+    first, second = make_queue(), make_queue()
+    #два воркера с одними ключами
+    for attr in ("QUEUE_KEY", "PERIODIC_PREFIX"):
+        setattr(second, attr, getattr(first, attr))
+    for queue in (first, second):
+        queue.every(60, "refresh")
+
+    async def run() -> int:
+        r = redis.from_url(redis_url, decode_responses=True)
+        try:
+            await asyncio.gather(first._schedule_periodic(r), second._schedule_periodic(r))
+            await first._schedule_periodic(r)
+            return await r.llen(first.QUEUE_KEY)
+        finally:
+            await cleanup(r, first)
+
+    assert asyncio.run(run()) == 1
+
+
+def test_expired_job_is_redelivered_as_another_attempt(redis_url):
+    queue = make_queue(max_attempts=2)
+
+    @queue.job("crash")
+    async def crash(r):
+        pass
+
+    async def run() -> tuple:
+        r = redis.from_url(redis_url, decode_responses=True)
+        try:
+            await queue.enqueue(r, "crash")
+            for _ in range(queue.max_attempts):
+                #воркер взял задачу и упал, дедлайн истёк
+                [raw] = await queue._pop(r, 1)
+                await r.zadd(queue.PROCESSING_KEY, {raw: 0})
+                await queue._recover_expired(r)
+            return (
+                await r.llen(queue.QUEUE_KEY),
+                await r.zcard(queue.PROCESSING_KEY),
+                [json.loads(raw) for raw in await r.lrange(queue.DEAD_KEY, 0, -1)],
+            )
+        finally:
+            await cleanup(r, queue)
+
+    queued, processing, dead = asyncio.run(run())
+    assert queued == 0 and processing == 0
+    assert len(dead) == 1 and dead[0]["attempts"] == 2
+    assert queue.redelivered == 1 and queue.dead_lettered == 1
+
+
+def test_long_running_job_extends_its_deadline(redis_url):
+    queue = make_queue(visibility_timeout=0.3)
+    calls = []
+
+    @queue.job("slow")
+    async def slow(r):
+        calls.append(1)
+        await asyncio.sleep(1)
+
+    async def run() -> tuple:
+        r = redis.from_url(redis_url, decode_responses=True)
+        try:
+            await queue.enqueue(r, "slow")
+            worker = asyncio.create_task(queue.run_worker(r))
+            await asyncio.sleep(1.2)
+            queue.stop()
+            await worker
+            return await r.zcard(queue.PROCESSING_KEY), await r.llen(queue.QUEUE_KEY)
+        finally:
+            await cleanup(r, queue)
+
+    processing, queued = asyncio.run(run())
+    assert len(calls) == 1
+    assert processing == 0 and queued == 0
+    assert queue.redelivered == 0 and queue.completed == 1
+
+
+def test_failure_after_redelivery_does_not_schedule_a_second_copy(redis_url):
+    queue = make_queue()
+
+    async def run() -> tuple:
+        r = redis.from_url(redis_url, decode_responses=True)
+
+        @queue.job("late")
+        async def late(r):
+            #пока задача работала, дедлайн истёк и другой воркер вернул её в очередь
+            await r.zadd(queue.PROCESSING_KEY, {raw: 0})
+            await queue._recover_expired(r)
+            raise RuntimeError("late")
+
+        try:
+            await queue.enqueue(r, "late")
+            [raw] = await queue._pop(r, 1)
+            await queue._execute(r, raw)
+            return await r.llen(queue.QUEUE_KEY), await r.zcard(queue.SCHEDULED_KEY), await r.zcard(queue.PROCESSING_KEY)
+        finally:
+            await cleanup(r, queue)
+
+    queued, scheduled, processing = asyncio.run(run())
+    assert (queued, scheduled, processing) == (1, 0, 0)
@@ -0,0 +1,107 @@
+"""
+Гонка вступления в команды: игроки одновременно ломятся в две команды сразу.
+Ни одна команда не переполняется, members_count совпадает с реальным составом,
+каждый успешный ответ - ровно одна привязка юзера
+"""
+import asyncio
+
+from uuid import uuid4
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+pytest.importorskip("fastapi")
+
+from sqlalchemy import select, delete, func
+
+from app.main import app
+from app.database import get_async_session_maker
+from app.models import UserModel, CommandModel
+from app.models.commands import MAX_MEMBERS
+from app.validation.hash_password import pwd_context
+from app.validation.jwt_manager import jwt_manager
+
+
+PLAYERS = 4 * MAX_MEMBERS
+TEAM_PASSWORD = "Team!pass1"
+TEAM_HASH = pwd_context.hash(TEAM_PASSWORD, rounds=4) #проверка пароля не то, что здесь тестируется
+
+
+async def seed(run_id : str) -> tuple[list[int], list[UserModel]]:
+    async with get_async_session_maker()() as db:
+        teams = [
+            CommandModel(name=f"race-{run_id}-{i}", password=TEAM_HASH, members_count=0)
+            for i in range(2)
+        ]
+        players = [
+            UserModel(
+                username=f"r{run_id}{i}", email=f"race-{run_id}-{i}@example.com",
+                hashed_password="-", role="player", is_active=True,
+            )
+            for i in range(PLAYERS)
+        ]
+        db.add_all([*teams, *players])
+        await db.commit()
+        return [team.id for team in teams], players
+
+
+async def cleanup(run_id : str) -> None:
+    async with get_async_session_maker()() as db:
+        await db.execute(delete(UserModel).where(UserModel.email.like(f"race-{run_id}-%")))
+        await db.execute(delete(CommandModel).where(CommandModel.name.like(f"race-{run_id}-%")))
+        await db.commit()
+
+
+async def join_race() -> None:
+    run_id = uuid4().hex[:8]
+    async with app.router.lifespan_context(app):
+        team_ids, players = await seed(run_id)
+        try:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://localhost") as client:
+
+                async def join(player : UserModel, team_id : int) -> tuple[int, int, int]:
+                    token = await jwt_manager.new_access_token(player)
+                    response = await client.put(
+                        f"/users/join-team/{team_id}",
+                        json={"password": TEAM_PASSWORD},
+                        headers={"Authorization": f"Bearer {token}"},
+                    )
+                    return player.id, team_id, response.status_code
+
+                results = await asyncio.gather(*(
+                    join(player, team_id) for player in players for team_id in team_ids
+                ))
+
+            statuses = {status for _, _, status in results}
+            assert statuses <= {200, 400}, statuses
+            joined = {(player_id, team_id) for player_id, team_id, status in results if status == 200}
+
+            async with get_async_session_maker()() as db:
+                members_counts = dict((await db.execute(
+                    select(CommandModel.id, CommandModel.members_count).where(CommandModel.id.in_(team_ids))
+                )).tuples().all())
+                actual = dict((await db.execute(
+                    select(UserModel.command_id, func.count())
+                    .where(UserModel.command_id.in_(team_ids))
+                    .group_by(UserModel.command_id)
+                )).tuples().all())
+                bindings = set((await db.execute(
+                    select(UserModel.id, UserModel.command_id)
+                    .where(UserModel.id.in_([player.id for player in players]), UserModel.command_id.is_not(None))
+                )).tuples().all())
+        finally:
+            await cleanup(run_id)
+
+    for team_id in team_ids:
+        assert members_counts[team_id] <= MAX_MEMBERS
+        assert members_counts[team_id] == actual.get(team_id, 0)
+    #обе команды должны заполниться, игроков хватает с запасом
+    assert all(count == MAX_MEMBERS for count in members_counts.values())
+    #успешный ответ без привязки или привязка без ответа - осиротевший юзер
+    assert joined == bindings
+    assert len({player_id for player_id, _ in joined}) == len(joined)
+
+
+def test_concurrent_joins_never_overfill_a_team(services):
+    asyncio.run(join_race())
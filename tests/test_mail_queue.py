@@ -0,0 +1,157 @@
+"""
+Очередь писем против локального SMTP сервера: одно соединение на пачку против соединения
+на каждое письмо, повторы и dead-letter, битое письмо не роняет остаток пачки
+"""
+import asyncio
+
+from time import perf_counter
+
+import pytest
+
+aiosmtplib = pytest.importorskip("aiosmtplib")
+pytest.importorskip("fastapi")
+pytest.importorskip("redis")
+
+from app.services.mail_queue import MailQueue, MemoryMailBackend
+
+
+GREETING_LATENCY = 0.005 #TLS и авторизация на настоящем сервере дороже отправки
+
+
+class LocalSMTPServer:
+    """
+    Минимальный SMTP сервер на localhost: считает соединения и принятые письма,
+    с reject=True отклоняет получателей
+    """
+    def __init__(self, reject : bool = False):
+        self.reject = reject
+        self.connections = 0
+        self.accepted = 0
+        self._server : asyncio.Server | None = None
+
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+
+    async def __aenter__(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self
+
+
+    async def __aexit__(self, *exc):
+        self._server.close()
+        await self._server.wait_closed()
+
+
+    def client(self) -> aiosmtplib.SMTP:
+        return aiosmtplib.SMTP(hostname="127.0.0.1", port=self.port, start_tls=False)
+
+
+    async def _handle(self, reader : asyncio.StreamReader, writer : asyncio.StreamWriter) -> None:
+        self.connections += 1
+        await asyncio.sleep(GREETING_LATENCY)
+        writer.write(b"220 localhost ESMTP\r\n")
+        try:
+            while line := await reader.readline():
+                command = line[:4].upper()
+                if command in (b"EHLO", b"HELO"):
+                    writer.write(b"250 localhost\r\n")
+                elif command == b"RCPT" and self.reject:
+                    writer.write(b"550 no such user\r\n")
+                elif command == b"DATA":
+                    writer.write(b"354 end with <CRLF>.<CRLF>\r\n")
+                    await writer.drain()
+                    while await reader.readline() != b".\r\n":
+                        pass
+                    self.accepted += 1
+                    writer.write(b"250 queued\r\n")
+                elif command == b"QUIT":
+                    writer.write(b"221 bye\r\n")
+                    await writer.drain()
+                    break
+                else: #MAIL, RCPT, RSET, NOOP
+                    writer.write(b"250 ok\r\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+
+
+@pytest.fixture(autouse=True)
+def smtp_from(monkeypatch):
+    monkeypatch.setenv("SMTP_FROM", "noreply@example.com")
+
+
+async def drain(queue : MailQueue, total : int) -> None:
+    while queue.sent + queue.dead_lettered < total:
+        await queue.process_batch(timeout=0.01)
+
+
+def test_batches_reuse_one_connection_and_beat_connect_per_email():
+    emails = 200
+
+    async def run() -> tuple:
+        async with LocalSMTPServer() as server:
+            queue = MailQueue(MemoryMailBackend(), smtp_factory=server.client, batch_size=50)
+            for i in range(emails):
+                await queue.enqueue_verification_email(to=f"user{i}@example.com", code="123456")
+            started = perf_counter()
+            await drain(queue, emails)
+            queued_seconds = perf_counter() - started
+            await queue.stop()
+            queued_connections, queued_accepted = server.connections, server.accepted
+
+            started = perf_counter()
+            for i in range(emails):
+                smtp = server.client()
+                await smtp.connect()
+                await smtp.sendmail("noreply@example.com", [f"user{i}@example.com"], "Subject: code\r\n\r\n123456")
+                await smtp.quit()
+            direct_seconds = perf_counter() - started
+        return queued_seconds, queued_connections, queued_accepted, direct_seconds, queue.sent
+
+    queued_seconds, connections, accepted, direct_seconds, sent = asyncio.run(run())
+    assert sent == accepted == emails
+    assert connections == 1
+    assert queued_seconds < direct_seconds / 2
+
+
+def test_failed_email_is_retried_then_dead_lettered():
+    async def run() -> tuple:
+        async with LocalSMTPServer(reject=True) as server:
+            backend = MemoryMailBackend()
+            queue = MailQueue(backend, smtp_factory=server.client, max_attempts=3, retry_base_delay=0)
+            await queue.enqueue_verification_email(to="user@example.com", code="123456")
+            await drain(queue, 1)
+            await queue.stop()
+        return queue, backend, server
+
+    queue, backend, server = asyncio.run(run())
+    assert queue.failed == 3
+    assert queue.dead_lettered == 1
+    assert backend.dead_letters[0]["attempts"] == 3
+    assert server.accepted == 0
+    #после ошибки соединение закрывается, каждый повтор открывает новое
+    assert server.connections == 3
+
+
+def test_broken_job_does_not_drop_the_rest_of_the_batch():
+    async def run() -> tuple:
+        async with LocalSMTPServer() as server:
+            backend = MemoryMailBackend()
+            queue = MailQueue(backend, smtp_factory=server.client, max_attempts=1)
+            await queue.enqueue_verification_email(to="first@example.com", code="123456")
+            await backend.push({"kind": "verification", "to": "broken@example.com", "attempts": 0}) #без кода
+            await queue.enqueue_verification_email(to="last@example.com", code="123456")
+            taken = await queue.process_batch(timeout=0.01)
+            await queue.stop()
+        return taken, queue, backend, server
+
+    taken, queue, backend, server = asyncio.run(run())
+    assert taken == 3
+    assert queue.sent == server.accepted == 2
+    assert [job["to"] for job in backend.dead_letters] == ["broken@example.com"]
+    #ошибка не связана с соединением, оно не переоткрывается
+    assert server.connections == 1
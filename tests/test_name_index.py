@@ -0,0 +1,44 @@
+"""
+Индекс названий: "занято" по индексу подтверждается в бд,
+команда, удалённая другим воркером, не блокирует название
+"""
+import asyncio
+
+from uuid import uuid4
+
+from sqlalchemy import delete
+
+from app.database import get_async_session_maker, dispose_engines
+from app.models import CommandModel
+from app.services.name_index import TeamNameIndex
+
+
+def test_taken_answer_is_confirmed_in_db(services):
+    index = TeamNameIndex(refresh_interval=60)
+    run_id = uuid4().hex[:8]
+    existing, deleted_elsewhere = f"idx-{run_id}-a", f"idx-{run_id}-b"
+
+    async def run() -> tuple[bool, bool, bool, bool]:
+        try:
+            async with get_async_session_maker()() as db:
+                db.add(CommandModel(name=existing, password="-"))
+                await db.commit()
+                await index.rebuild()
+                index.add(10**9, deleted_elsewhere) #удалена на другом воркере после перестройки
+                return (
+                    await index.is_taken(existing, db),
+                    await index.is_taken(deleted_elsewhere, db),
+                    index.exists(deleted_elsewhere),
+                    await index.is_taken(f"idx-{run_id}-free", db),
+                )
+        finally:
+            async with get_async_session_maker()() as db:
+                await db.execute(delete(CommandModel).where(CommandModel.name.like(f"idx-{run_id}-%")))
+                await db.commit()
+            await dispose_engines()
+
+    existing_taken, deleted_taken, still_indexed, free_taken = asyncio.run(run())
+    assert existing_taken
+    assert not deleted_taken
+    assert not still_indexed
+    assert not free_taken
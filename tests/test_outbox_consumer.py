@@ -0,0 +1,57 @@
+"""
+Потребитель outbox: событие, которое раз за разом падает в обработчике,
+после max_deliveries доставок уходит в dead stream и больше не забирается
+"""
+import asyncio
+
+from uuid import uuid4
+
+import pytest
+
+redis = pytest.importorskip("redis.asyncio")
+
+from app.services.json_response import dumps
+from app.services.outbox import OutboxConsumer
+
+
+def test_failing_event_is_dead_lettered_after_max_deliveries(redis_url):
+    stream = f"test:outbox:{uuid4().hex[:8]}"
+
+    async def run() -> tuple:
+        r = redis.from_url(redis_url, decode_responses=True)
+        consumer = OutboxConsumer(r, group="test", consumer="c1", stream=stream, max_deliveries=3)
+        handled = {"bad": 0, "good": 0}
+
+        async def handler(event : dict) -> None:
+            if event["type"] == "bad":
+                handled["bad"] += 1
+                raise RuntimeError("обработчик упал")
+            handled["good"] += 1
+
+        try:
+            await consumer.ensure_group()
+            for event_id, event_type in ((1, "bad"), (2, "good")):
+                await r.xadd(stream, {
+                    "id": event_id, "type": event_type, "aggregate_type": "user", "aggregate_id": 1,
+                    "payload": dumps({}), "created_at": "2026-01-01T00:00:00Z",
+                })
+            worker = asyncio.create_task(consumer.run(handler, claim_idle_ms=0))
+            while not await r.xlen(consumer.dead_stream):
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.05)
+            worker.cancel()
+            await asyncio.gather(worker, return_exceptions=True)
+
+            dead = await r.xrange(consumer.dead_stream)
+            pending = await r.xpending(stream, "test")
+        finally:
+            await r.delete(stream, consumer.dead_stream)
+            await r.aclose()
+        return handled, dead, pending, consumer.dead_lettered
+
+    handled, dead, pending, dead_lettered = asyncio.run(run())
+    assert handled == {"bad": 3, "good": 1}
+    assert dead_lettered == 1
+    assert [fields["id"] for _, fields in dead] == ["1"]
+    assert dead[0][1]["group"] == "test"
+    assert pending["pending"] == 0
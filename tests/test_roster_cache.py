@@ -0,0 +1,38 @@
+"""
+Кеш состава: ответ, прочитанный из бд до сброса, не ложится в кеш поверх сброса
+"""
+import asyncio
+
+from random import randint
+
+import pytest
+
+redis = pytest.importorskip("redis.asyncio")
+
+from app.services.roster_cache import RosterCache
+
+
+def test_set_after_invalidate_does_not_cache_stale_roster(redis_url):
+    cache = RosterCache(max_size=10, ttl=60, redis_ttl=60)
+    command_id = randint(10**9, 2 * 10**9)
+
+    async def run() -> tuple:
+        r = redis.from_url(redis_url, decode_responses=True)
+        try:
+            version = await cache.version(command_id, r) #запрос в бд начался
+            await cache.invalidate(r, command_id) #кто-то вступил в команду
+            await cache.set(command_id, b'{"members": 1}', r, version) #старый ответ
+            stale = await cache.get(command_id, r)
+
+            version = await cache.version(command_id, r)
+            await cache.set(command_id, b'{"members": 2}', r, version)
+            cache.local.clear()
+            fresh = await cache.get(command_id, r)
+        finally:
+            await r.delete(cache._key(command_id), cache._version_key(command_id))
+            await r.aclose()
+        return stale, fresh
+
+    stale, fresh = asyncio.run(run())
+    assert stale is None
+    assert fresh is not None and fresh[1].identity == b'{"members": 2}'
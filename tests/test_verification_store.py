@@ -0,0 +1,42 @@
+"""
+Коды подтверждения: после повторных отправок живым остаётся только последний код,
+погашенный код второй раз не срабатывает
+"""
+import asyncio
+
+from uuid import uuid4
+
+import pytest
+
+redis = pytest.importorskip("redis.asyncio")
+
+from app.services.verification_store import VerificationStore
+
+
+def test_rotate_keeps_only_the_latest_code_and_consume_is_single_use(redis_url):
+    store = VerificationStore(ttl=60)
+    email = f"verify-{uuid4().hex[:8]}@example.com"
+
+    async def run() -> tuple[list, dict | None, dict | None, str | None]:
+        r = redis.from_url(redis_url, decode_responses=True)
+        try:
+            await store.create(r, "10000000", 1, email)
+            #одновременные повторные отправки
+            await asyncio.gather(*(store.rotate(r, str(10000001 + i), 1, email) for i in range(10)))
+            live = [
+                code for code in (str(10000000 + i) for i in range(11))
+                if await r.exists(f"{store.CODE_PREFIX}{code}")
+            ]
+            first = await store.consume(r, live[0])
+            second = await store.consume(r, live[0])
+            pointer = await r.get(f"{store.EMAIL_PREFIX}{email}")
+        finally:
+            await r.delete(*(f"{store.CODE_PREFIX}{10000000 + i}" for i in range(11)), f"{store.EMAIL_PREFIX}{email}")
+            await r.aclose()
+        return live, first, second, pointer
+
+    live, first, second, pointer = asyncio.run(run())
+    assert len(live) == 1
+    assert first == {"code": live[0], "user_id": "1", "email": email}
+    assert second is None
+    assert pointer is None